@@ -1,8 +1,11 @@
 from PyQt5.QtWidgets import (QDialog, QDialogButtonBox, QVBoxLayout, QHBoxLayout, QLabel,
-                             QLineEdit, QPushButton, QFileDialog, QCheckBox)
+                             QLineEdit, QPushButton, QFileDialog, QCheckBox, QComboBox)
 from PyQt5.QtGui import QIntValidator
 from PyQt5.QtCore import Qt
 
+from archive_writer import OverflowPolicy
+import hdf5_archive
+
 class ArchiveSettings(QDialog):
     
     def __init__(self, root):
@@ -32,6 +35,24 @@ class ArchiveSettings(QDialog):
         top_row.addWidget(self.low_res_check)
         self.layout.addLayout(top_row)
         
+        format_row = QHBoxLayout()
+        format_row.addWidget(QLabel(text='Archive format:', parent=self))
+        self.format_box = QComboBox(parent=self)
+        self.format_box.addItems(('TIFF', 'HDF5'))
+        if hdf5_archive.h5py is None:
+            # HDF5 needs h5py, so only offer it when it is installed
+            self.format_box.model().item(1).setEnabled(False)
+        self.format_box.setCurrentText(self.root.archive_format)
+        self.format_box.currentIndexChanged.connect(self.trigger_refresh_from_widget)
+        format_row.addWidget(self.format_box)
+        format_row.addWidget(QLabel(text='HDF5 compression:', parent=self))
+        self.compression_box = QComboBox(parent=self)
+        self.compression_box.addItems(hdf5_archive.compression_options.keys())
+        self.compression_box.setCurrentText(self.root.archive_compression)
+        format_row.addWidget(self.compression_box)
+        format_row.addStretch(1)
+        self.layout.addLayout(format_row)
+        
         directory_row = QHBoxLayout()
         self.directory_box = QLineEdit(text=self.root.archive_dir, parent=self)
         self.directory_box.readOnly = True
@@ -76,6 +97,19 @@ class ArchiveSettings(QDialog):
         interval_row.addWidget(self.interval_box)
         self.layout.addLayout(interval_row)
         
+        queue_row = QHBoxLayout()
+        queue_row.addWidget(QLabel(text='Write queue size:', parent=self))
+        self.queue_size_box = QLineEdit(text=str(self.root.archive_writer.queue_size), parent=self)
+        self.queue_size_box.setValidator(QIntValidator(bottom=1, parent=self))
+        queue_row.addWidget(self.queue_size_box)
+        queue_row.addWidget(QLabel(text='When the queue is full:', parent=self))
+        self.policy_box = QComboBox(parent=self)
+        for policy in OverflowPolicy:
+            self.policy_box.addItem(policy.value, policy)
+        self.policy_box.setCurrentIndex(self.policy_box.findData(self.root.archive_writer.policy))
+        queue_row.addWidget(self.policy_box)
+        self.layout.addLayout(queue_row)
+        
         self.layout.addWidget(self.buttonBox)
         self.setLayout(self.layout)
         
@@ -86,11 +120,19 @@ class ArchiveSettings(QDialog):
         self.refresh_preview()
     
     def refresh_preview(self):
-        shot_number_string = r'_{shot_number}' if self.shot_number_check.isChecked() else ''
+        hdf5 = self.format_box.currentText() == 'HDF5'
+        self.low_res_check.setEnabled(not hdf5)
+        self.compression_box.setEnabled(hdf5)
+        shot_number_string = r'_{shot_number}' if self.shot_number_check.isChecked() and not hdf5 else ''
         prefix_string = self.prefix_box.text() + '_' if self.prefix_box.text() != '' else ''
         suffix_string = '_' + self.suffix_box.text() if self.suffix_box.text() != '' else ''
-        file_ext_string = '.png' if self.low_res_check.isChecked() else '.tiff'
-        preview_string = f'Filename preview: {prefix_string}{self.base_filename}{suffix_string}{shot_number_string}{file_ext_string}'
+        if hdf5:
+            base_filename = r'{session_timestamp}_{cam_name}'
+            file_ext_string = '.h5'
+        else:
+            base_filename = self.base_filename
+            file_ext_string = '.png' if self.low_res_check.isChecked() else '.tiff'
+        preview_string = f'Filename preview: {prefix_string}{base_filename}{suffix_string}{shot_number_string}{file_ext_string}'
         self.preview_label.setText(preview_string)
 
     def find_file(self):
@@ -100,5 +142,7 @@ class ArchiveSettings(QDialog):
     def accept(self):
         self.root.set_archive_parameters(self.archive_check.isChecked(), self.low_res_check.isChecked(), int(self.interval_box.text()), self.directory_box.text(),
                                          self.shot_number_check.isChecked(), int(self.shot_number_box.text()),
-                                         self.prefix_box.text(), self.suffix_box.text())
+                                         self.prefix_box.text(), self.suffix_box.text(),
+                                         self.policy_box.currentData(), int(self.queue_size_box.text()),
+                                         self.format_box.currentText(), self.compression_box.currentText())
         super().accept()
@@ -0,0 +1,225 @@
+'''
+Asynchronous archive writer
+
+Frames to be archived are put on a bounded queue and encoded and written by
+background threads, so saving never stalls acquisition or the display. When
+the disk can't keep up, the overflow policy decides what happens.
+'''
+
+from collections import namedtuple
+from enum import Enum
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from hdf5_archive import HDF5Archive, save_stack
+
+class OverflowPolicy(Enum):
+    BLOCK = 'Block'
+    DROP_OLDEST = 'Drop oldest'
+    DROP_NEWEST = 'Drop newest'
+
+# HDF5 items (.h5 filename) carry a metadata record, analysis region rows and compression,
+# image items a description or colormap. Stack items (bursts, events) carry the extra datasets
+# saved next to the frames, their data is the whole stack.
+ArchiveItem = namedtuple('ArchiveItem', ['filename', 'data', 'description', 'lut', 'levels', 'metadata', 'compression',
+                                         'roi_records', 'datasets'])
+ArchiveItem.__new__.__defaults__ = ('', None, None, None, None, None, None)
+
+# queued by rotate, closes the open HDF5 archives once the items queued before it are written
+rotate_marker = object()
+
+def is_unbounded(item):
+    # stacks and rotate markers are queued regardless of the queue size and never dropped
+    return item is rotate_marker or item.datasets is not None
+
+class ArchiveQueue(queue.Queue):
+    """Frame queue whose size only counts frames, stacks and markers are queued on top of maxsize."""
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self.unbounded = 0
+
+    def _qsize(self):
+        return len(self.queue) - self.unbounded
+
+    def _get(self):
+        item = self.queue.popleft()
+        if is_unbounded(item):
+            self.unbounded -= 1
+        return item
+
+    def get(self):
+        # Queue.get waits on _qsize, which misses stacks and markers
+        with self.not_empty:
+            while len(self.queue) == 0:
+                self.not_empty.wait()
+            item = self._get()
+            self.not_full.notify()
+            return item
+
+    def put_unbounded(self, item):
+        with self.mutex:
+            self.queue.append(item)
+            self.unbounded += 1
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def drop_oldest(self):
+        """Remove the oldest frame, skipping stacks and markers. False if there is none."""
+        with self.mutex:
+            for item in self.queue:
+                if not is_unbounded(item):
+                    self.queue.remove(item)
+                    break
+            else:
+                return False
+            # what task_done does for the dropped frame
+            self.unfinished_tasks -= 1
+            if self.unfinished_tasks == 0:
+                self.all_tasks_done.notify_all()
+            return True
+
+ArchiveStats = namedtuple('ArchiveStats', ['queue_depth', 'queue_size', 'bytes_per_second', 'written', 'dropped'])
+
+class ArchiveWriter:
+    low_res_size = 640
+
+    def __init__(self, queue_size=64, policy=OverflowPolicy.DROP_OLDEST, workers=2):
+        """Background writer for archived frames.
+
+        Args:
+            queue_size (int): maximum number of frames waiting to be written
+            policy (OverflowPolicy): what to do when the queue is full
+            workers (int): number of writer threads
+        """
+        self.policy = policy
+        self.queue = ArchiveQueue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.bytes_written = 0
+        self.written = 0
+        self.dropped = 0
+        self._last_poll_time = time.time()
+        self._last_poll_bytes = 0
+        self.hdf5_archive = HDF5Archive()
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    @property
+    def queue_size(self):
+        return self.queue.maxsize
+
+    def resize(self, queue_size):
+        # queue.Queue reads maxsize on every put, so it can be changed in place
+        with self.queue.mutex:
+            self.queue.maxsize = queue_size
+            # producers blocked in put only look at the new size when woken
+            self.queue.not_full.notify_all()
+
+    def submit(self, item):
+        """Queue an ArchiveItem for writing.
+
+        The data must not be modified afterwards. Depending on the policy this
+        blocks until there is room or drops a frame when the queue is full.
+
+        Returns:
+            bool: True if the item was queued
+        """
+        if self.policy == OverflowPolicy.BLOCK:
+            self.queue.put(item)
+            return True
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except queue.Full:
+                if self.policy == OverflowPolicy.DROP_NEWEST or not self.queue.drop_oldest():
+                    self.count_dropped()
+                    return False
+            self.count_dropped()
+
+    def submit_stack(self, item):
+        """Queue a stack item (burst or event window) regardless of the overflow policy.
+
+        Stacks are explicit captures: they are queued even when the queue is full,
+        never block the caller and are never dropped to make room for frames.
+        """
+        self.queue.put_unbounded(item)
+
+    def count_dropped(self):
+        with self.lock:
+            self.dropped += 1
+
+    def poll_stats(self):
+        """Return ArchiveStats, with the write rate averaged since the previous call."""
+        now = time.time()
+        with self.lock:
+            bytes_written = self.bytes_written
+            written = self.written
+            dropped = self.dropped
+        elapsed = now - self._last_poll_time
+        rate = (bytes_written - self._last_poll_bytes)/elapsed if elapsed > 0 else 0
+        self._last_poll_time = now
+        self._last_poll_bytes = bytes_written
+        return ArchiveStats(self.queue.qsize(), self.queue.maxsize, rate, written, dropped)
+
+    def flush(self):
+        self.queue.join()
+
+    def close_files(self):
+        """Wait for queued frames and close open archive containers, ending the session."""
+        self.flush()
+        self.hdf5_archive.close()
+
+    def rotate(self):
+        """Close open archive containers once the frames queued so far are written, without waiting for them.
+
+        The marker doesn't count against the queue size and is never dropped. A frame of the old
+        session still being written by another thread reopens its file, which is closed again by
+        the next rotate or close_files.
+        """
+        self.queue.put_unbounded(rotate_marker)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is rotate_marker:
+                    self.hdf5_archive.close()
+                    continue
+                size = self.write(item)
+                with self.lock:
+                    self.bytes_written += size
+                    self.written += 1
+            except Exception as e:
+                print(e)
+            finally:
+                self.queue.task_done()
+
+    def write(self, item):
+        """Write item and return the number of bytes written (uncompressed for HDF5)."""
+        if item.datasets is not None:
+            save_stack(item.filename, item.data, **item.datasets)
+            print(f'Saved {len(item.data)} frames to {item.filename}')
+            return item.data.nbytes
+        if item.filename.endswith('.h5'):
+            self.hdf5_archive.append(item.filename, item.data, item.metadata, item.compression, item.roi_records)
+            return item.data.nbytes
+        if item.lut is None:
+            Image.fromarray(item.data).save(item.filename, 'TIFF', description=item.description)
+        else:
+            Image.fromarray(self.render(item.data, item.lut, item.levels)).save(item.filename, 'PNG')
+        return os.path.getsize(item.filename)
+
+    def render(self, data, lut, levels):
+        """Colormap data the way it is displayed, at reduced resolution."""
+        step = max(1, int(np.ceil(max(data.shape)/self.low_res_size)))
+        data = data[::step, ::step].astype(np.float32)
+        low, high = levels
+        scale = (len(lut) - 1)/(high - low) if high > low else 0
+        index = np.clip((data - low)*scale, 0, len(lut) - 1).astype(np.intp)
+        return lut[index]
@@ -0,0 +1,215 @@
+'''
+Dark frame and background subtraction
+
+Each camera keeps a dark frame that is subtracted from its frames before the
+beam statistics. The dark frame is either captured as the average of N frames
+taken with the beam blocked, or kept up to date as an exponential running
+average of the incoming frames.
+
+Subtracting goes into preallocated int32 buffers, so noise below the dark
+level stays negative instead of wrapping around, and no frame-sized array is
+allocated per frame. Buffers go back to the pool when the processed frame
+holding them is released.
+
+Captured dark frames are saved per serial number and ROI, and loaded again
+whenever the camera comes back to that ROI.
+'''
+
+import os
+import re
+import threading
+
+import numpy as np
+
+from processing import BufferPool
+
+background_modes = ('Off', 'Dark frame', 'Running average')
+
+class BackgroundSubtractor:
+    def __init__(self, directory, serial_number, capture_frames=20, alpha=0.05, pool_size=4):
+        """Background subtraction for the frames of one camera.
+
+        Args:
+            directory (str): folder dark frames are saved to and loaded from
+            serial_number (str): serial number of the camera, part of the dark frame filenames
+            capture_frames (int): number of frames averaged by capture
+            alpha (float): weight of the newest frame in the running average
+            pool_size (int): number of subtraction buffers kept for reuse
+        """
+        self.directory = directory
+        self.serial_number = serial_number
+        self.mode = 'Off'
+        self.capture_frames = capture_frames
+        self.alpha = alpha
+        self.buffers = BufferPool(pool_size)
+        self.lock = threading.Lock()
+        # ROI and binning the background belongs to, (offset_x, offset_y, binning, shape)
+        self.key = None
+        self.dark = None
+        self.dark_total = 0
+        self.dark_frames = 0
+        self.running = None
+        self.scratch = None
+        self.accumulator = None
+        self.accumulated = 0
+        self.capture_target = 0
+
+    @property
+    def capturing(self):
+        return self.capture_target > 0
+
+    def status(self):
+        if self.capturing:
+            return f'Capturing {self.accumulated}/{self.capture_target}'
+        if self.mode == 'Running average':
+            return 'Running average' if self.running is not None else 'Running average: waiting for frames'
+        if self.dark is None:
+            return 'No dark frame'
+        return f'Dark frame: {self.dark_frames} frames'
+
+    def capture(self, n_frames=None):
+        """Average the next n_frames frames into a new dark frame, which is saved when complete."""
+        with self.lock:
+            self.capture_target = n_frames if n_frames is not None else self.capture_frames
+            self.accumulator = None
+            self.accumulated = 0
+
+    def set_mode(self, mode):
+        with self.lock:
+            if mode == 'Running average' and self.mode != mode:
+                # start from the current dark frame if there is one, the first frame otherwise
+                self.running = self.dark.astype(np.float32) if self.dark is not None else None
+            self.mode = mode
+
+    def clear(self):
+        """Forget the dark frame and running average, saved dark frames stay on disk."""
+        with self.lock:
+            self.dark = None
+            self.dark_total = 0
+            self.dark_frames = 0
+            self.running = None
+
+    def filename(self, key):
+        offset_x, offset_y, binning, (height, width) = key
+        # replayed cameras use the file path as serial number
+        serial_number = re.sub(r'[^\w.-]', '_', str(self.serial_number))
+        return os.path.join(self.directory, f'{serial_number}_roi_{offset_x}_{offset_y}_{width}x{height}_bin{binning}.npz')
+
+    def save(self):
+        """Save the current dark frame for its ROI."""
+        with self.lock:
+            key, dark, dark_frames = self.key, self.dark, self.dark_frames
+        if key is None or dark is None:
+            return
+        filename = self.filename(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            np.savez(filename, dark=dark, frames=dark_frames)
+            print(f'Saved dark frame to {filename}')
+        except Exception as e:
+            print(e)
+
+    def load(self):
+        """Load the saved dark frame of the current ROI, if there is one."""
+        with self.lock:
+            self.load_key(self.key)
+            return self.dark is not None
+
+    def load_key(self, key):
+        self.dark = None
+        self.dark_total = 0
+        self.dark_frames = 0
+        if key is None:
+            return
+        filename = self.filename(key)
+        if not os.path.exists(filename):
+            return
+        try:
+            with np.load(filename) as saved:
+                dark = saved['dark']
+                dark_frames = int(saved['frames'])
+        except Exception as e:
+            print(e)
+            return
+        if dark.shape != key[3]:
+            return
+        self.set_dark(dark.astype(np.int32), dark_frames)
+
+    def set_dark(self, dark, dark_frames):
+        self.dark = dark
+        self.dark_total = int(dark.sum(dtype=np.int64))
+        self.dark_frames = dark_frames
+
+    def switch(self, key):
+        # a new ROI needs its own dark frame
+        self.key = key
+        self.running = None
+        self.scratch = None
+        self.accumulator = None
+        self.accumulated = 0
+        self.load_key(key)
+        if self.mode == 'Running average' and self.dark is not None:
+            self.running = self.dark.astype(np.float32)
+
+    def apply(self, frame, offset_x, offset_y, binning):
+        """Subtract the background from frame.
+
+        Args:
+            frame (ndarray): unsigned integer frame, it is only read
+            offset_x (int), offset_y (int), binning (int): ROI of the frame, picks the dark frame
+
+        Returns:
+            (ndarray, int): the background subtracted int32 frame and the total counts of the
+                subtracted background, or frame itself and 0 if there is nothing to subtract
+        """
+        key = (offset_x, offset_y, binning, frame.shape)
+        save = False
+        subtracted, dark_total = frame, 0
+        with self.lock:
+            if key != self.key:
+                self.switch(key)
+            if self.capturing:
+                save = self.accumulate(frame)
+            elif self.mode != 'Off':
+                if self.mode == 'Running average':
+                    self.update_running(frame)
+                if self.dark is not None:
+                    subtracted = self.buffers.get(frame.shape, np.int32)
+                    np.subtract(frame, self.dark, out=subtracted)
+                    dark_total = self.dark_total
+        if save:
+            self.save()
+        return subtracted, dark_total
+
+    def accumulate(self, frame):
+        if self.accumulator is None:
+            self.accumulator = np.zeros(frame.shape, dtype=np.int64)
+        self.accumulator += frame
+        self.accumulated += 1
+        if self.accumulated < self.capture_target:
+            return False
+        dark = self.accumulator + self.accumulated//2
+        dark //= self.accumulated
+        self.set_dark(dark.astype(np.int32), self.accumulated)
+        if self.mode == 'Running average':
+            self.running = self.dark.astype(np.float32)
+        self.capture_target = 0
+        self.accumulator = None
+        return True
+
+    def update_running(self, frame):
+        if self.scratch is None:
+            self.scratch = np.empty(frame.shape, dtype=np.float32)
+        if self.running is None:
+            self.running = frame.astype(np.float32)
+        else:
+            # running += alpha*(frame - running) without temporaries
+            np.subtract(frame, self.running, out=self.scratch)
+            self.scratch *= self.alpha
+            self.running += self.scratch
+        if self.dark is None or self.dark.shape != frame.shape:
+            self.dark = np.empty(frame.shape, dtype=np.int32)
+        np.rint(self.running, out=self.scratch)
+        np.copyto(self.dark, self.scratch, casting='unsafe')
+        self.dark_total = int(self.dark.sum(dtype=np.int64))
+        self.dark_frames = 0
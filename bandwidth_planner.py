@@ -0,0 +1,130 @@
+'''
+GigE bandwidth planner
+
+Plans packet size, inter-packet delay (GevSCPD) and frame transmission delay
+(GevSCFTD) for every streaming camera, so that the cameras sharing a network
+interface stay under a configurable fraction of its link speed even when they
+all send a frame at the same time.
+
+Each camera gets a share of its link proportional to the bandwidth it asks
+for (bytes per frame times target frame rate). Its packets are spaced so it
+sends at exactly that share, and the cameras on a link start one packet time
+apart so their packets interleave.
+'''
+
+from collections import namedtuple
+import math
+
+# bytes of IP, UDP and GVSP headers inside a GevSCPSPacketSize packet
+packet_header_bytes = 20 + 8 + 8
+# bytes on the wire around each packet: Ethernet header, FCS, preamble and inter-frame gap
+wire_overhead_bytes = 14 + 4 + 8 + 12
+
+CameraDemand = namedtuple('CameraDemand', ['cam', 'interface', 'bytes_per_frame', 'target_frame_rate',
+                                           'packet_size', 'tick_frequency'])
+
+CameraPlan = namedtuple('CameraPlan', ['cam', 'interface', 'packet_size', 'interpacket_delay',
+                                       'frame_transmission_delay', 'target_frame_rate', 'achievable_frame_rate',
+                                       'bandwidth', 'utilization'])
+
+def wire_bytes_per_frame(bytes_per_frame, packet_size):
+    payload = packet_size - packet_header_bytes
+    packets = math.ceil(bytes_per_frame/payload)
+    return packets*(packet_size + wire_overhead_bytes)
+
+class BandwidthPlanner:
+    def __init__(self, link_speed=1e9, max_utilization=0.9, max_packet_size=1500):
+        """Bandwidth planner for GigE cameras.
+
+        Args:
+            link_speed (float): speed of each network interface in bit/s
+            max_utilization (float): fraction of the link speed the cameras may use
+            max_packet_size (int): largest GevSCPSPacketSize to use, 1500 without jumbo frames
+        """
+        self.link_speed = link_speed
+        self.max_utilization = max_utilization
+        self.max_packet_size = max_packet_size
+        # per-interface correction of max_utilization, lowered by the delay controller while packets get lost
+        self.utilization_scale = {}
+
+    def demand(self, cam):
+        """Read what a camera needs from its wrapper. Returns None for cameras that aren't on a network link."""
+        interface = cam.interface
+        if interface is None:
+            return None
+        if cam.is_grabbing():
+            # the packet size is locked while the camera streams
+            packet_size = cam.packet_size
+        else:
+            packet_size = min(self.max_packet_size, cam.max_packet_size)
+        return CameraDemand(cam, interface, cam.bytes_per_frame, cam.target_frame_rate, packet_size,
+                            cam.tick_frequency)
+
+    def plan(self, demands):
+        """Plan the transport parameters for a list of CameraDemands.
+
+        Returns:
+            list of CameraPlan, in the order of demands
+        """
+        links = {}
+        for demand in demands:
+            links.setdefault(demand.interface, []).append(demand)
+        plans = {}
+        for interface, link_demands in links.items():
+            budget = self.link_speed*self.max_utilization*self.utilization_scale.get(interface, 1)
+            wire_bits = [8*wire_bytes_per_frame(d.bytes_per_frame, d.packet_size) for d in link_demands]
+            requested = [bits*d.target_frame_rate for bits, d in zip(wire_bits, link_demands)]
+            total_requested = sum(requested)
+            frame_transmission_delay = 0
+            for demand, bits, request in zip(link_demands, wire_bits, requested):
+                # spare capacity is handed out too, so frames get off the camera as fast as the budget allows
+                share = budget*request/total_requested if total_requested > 0 else budget/len(link_demands)
+                packet_time = 8*(demand.packet_size + wire_overhead_bytes)/self.link_speed
+                packet_interval = 8*(demand.packet_size + wire_overhead_bytes)/share
+                interpacket_delay = int(max(0, packet_interval - packet_time)*demand.tick_frequency)
+                achievable = min(demand.target_frame_rate, share/bits)
+                plans[id(demand)] = CameraPlan(demand.cam, interface, demand.packet_size, interpacket_delay,
+                                               frame_transmission_delay, demand.target_frame_rate, achievable,
+                                               achievable*bits, achievable*bits/self.link_speed)
+                frame_transmission_delay += int(packet_time*demand.tick_frequency)
+        return [plans[id(demand)] for demand in demands]
+
+    def apply(self, cams, errors=()):
+        """Plan the transport of cams and set their packet sizes and delays.
+
+        Args:
+            cams (iterable): running cameras
+            errors (tuple): exception types of failed parameter access, which skip
+                the camera concerned instead of the whole plan
+
+        Returns:
+            list: the CameraPlan of each camera that has one
+        """
+        demands = []
+        for cam in cams:
+            try:
+                demand = self.demand(cam)
+            except errors as e:
+                print(f'{cam.name}: could not read transport parameters: {e}')
+                continue
+            if demand is not None:
+                demands.append(demand)
+        plans = self.plan(demands)
+        for plan in plans:
+            cam = plan.cam
+            try:
+                # the packet size can only change while the camera isn't streaming
+                if not cam.is_grabbing():
+                    cam.packet_size = plan.packet_size
+                cam.interpacket_delay = plan.interpacket_delay
+                cam.frame_transmission_delay = plan.frame_transmission_delay
+            except errors:
+                pass
+        return plans
+
+    def link_utilization(self, plans):
+        """Planned fraction of each interface's link speed in use, keyed by interface."""
+        utilization = {}
+        for plan in plans:
+            utilization[plan.interface] = utilization.get(plan.interface, 0) + plan.utilization
+        return utilization
@@ -0,0 +1,83 @@
+from PyQt5.QtWidgets import (QDialog, QDialogButtonBox, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
+                             QTableWidget, QTableWidgetItem, QAbstractItemView, QHeaderView)
+from PyQt5.QtGui import QIntValidator, QDoubleValidator
+from PyQt5.QtCore import Qt
+
+class BandwidthWindow(QDialog):
+    columns = ('Camera', 'Interface', 'MB/frame', 'Target fps', 'Achievable fps', 'Packet size',
+               'GevSCPD', 'GevSCFTD')
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.root = root
+        self.planner = root.bandwidth_planner
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+        self.setWindowTitle('Bandwidth')
+
+        Qbtn = QDialogButtonBox.Ok | QDialogButtonBox.Apply | QDialogButtonBox.Cancel
+        self.buttonBox = QDialogButtonBox(Qbtn)
+        self.buttonBox.accepted.connect(self.accept)
+        self.buttonBox.rejected.connect(self.reject)
+        self.buttonBox.button(QDialogButtonBox.Apply).clicked.connect(self.apply)
+
+        self.layout = QVBoxLayout()
+
+        settings_row = QHBoxLayout()
+        settings_row.addWidget(QLabel(text='Link speed (Mbit/s):', parent=self))
+        self.link_speed_box = QLineEdit(text=f'{self.planner.link_speed/1e6:g}', parent=self)
+        self.link_speed_box.setValidator(QDoubleValidator(bottom=1, parent=self))
+        settings_row.addWidget(self.link_speed_box)
+        settings_row.addWidget(QLabel(text='Maximum utilization (%):', parent=self))
+        self.utilization_box = QLineEdit(text=f'{100*self.planner.max_utilization:g}', parent=self)
+        self.utilization_box.setValidator(QDoubleValidator(bottom=1, top=100, parent=self))
+        settings_row.addWidget(self.utilization_box)
+        settings_row.addWidget(QLabel(text='Maximum packet size:', parent=self))
+        self.packet_size_box = QLineEdit(text=str(self.planner.max_packet_size), parent=self)
+        self.packet_size_box.setValidator(QIntValidator(bottom=576, top=16000, parent=self))
+        settings_row.addWidget(self.packet_size_box)
+        self.layout.addLayout(settings_row)
+
+        self.table = QTableWidget(0, len(self.columns), parent=self)
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.layout.addWidget(self.table)
+
+        self.utilization_label = QLabel(text='', parent=self)
+        self.layout.addWidget(self.utilization_label)
+
+        self.layout.addWidget(self.buttonBox)
+        self.setLayout(self.layout)
+
+        self.refresh()
+
+    def refresh(self):
+        plans = self.root.bandwidth_plan
+        self.table.setRowCount(len(plans))
+        for row, plan in enumerate(plans):
+            values = (plan.cam.name, str(plan.interface), f'{plan.cam.bytes_per_frame/1e6:.2f}',
+                      f'{plan.target_frame_rate:.1f}', f'{plan.achievable_frame_rate:.1f}', str(plan.packet_size),
+                      str(plan.interpacket_delay), str(plan.frame_transmission_delay))
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column == 4 and plan.achievable_frame_rate < 0.99*plan.target_frame_rate:
+                    item.setForeground(Qt.red)
+                self.table.setItem(row, column, item)
+        utilization = self.planner.link_utilization(plans)
+        if len(utilization) == 0:
+            self.utilization_label.setText('No running GigE cameras.')
+        else:
+            self.utilization_label.setText('Planned link utilization: ' + ', '.join(
+                f'{interface}: {100*fraction:.0f}%' for interface, fraction in utilization.items()))
+
+    def apply(self):
+        self.planner.link_speed = float(self.link_speed_box.text())*1e6
+        self.planner.max_utilization = float(self.utilization_box.text())/100
+        self.planner.max_packet_size = int(self.packet_size_box.text())
+        self.root.set_delays()
+        self.refresh()
+
+    def accept(self):
+        self.apply()
+        super().accept()
@@ -1,28 +1,63 @@
-from enum import Enum, auto
-
 import pypylon._genicam as _genicam
 import pypylon.pylon as pylon
 import threading
 
 import camera_wrapper as cw
+from camera_wrapper import TriggerMode
+
+
+class CacheInvalidator(pylon.ConfigurationEventHandler):
+    '''
+    Drops the parameter cache of a camera whenever pylon reports that its configuration may have changed
+    '''
+    def __init__(self, camera):
+        super().__init__()
+        self.camera = camera
+
+    def OnOpened(self, cam):
+        self.camera.invalidate()
+
+    def OnGrabStarted(self, cam):
+        self.camera.invalidate()
 
+    def OnGrabStopped(self, cam):
+        self.camera.invalidate()
+
+    def OnCameraDeviceRemoved(self, cam):
+        self.camera.invalidate()
 
-class TriggerMode(Enum):
-    FREERUN = auto()
-    SOFTWARE = auto()
-    HARDWARE = auto()
 
 class Basler_Camera(cw.Camera):
+    cached_parameters = ('gain', 'exposure', 'offset_x', 'offset_y', 'width', 'height', 'max_width', 'max_height',
+                         'frame_transmission_delay', 'interpacket_delay', 'packet_size', 'max_packet_size',
+                         'tick_frequency', 'bytes_per_frame', 'target_frame_rate', 'sensor_width', 'sensor_height')
+    # the maximum ROI size shrinks with the offset, and the ROI and exposure set the payload and frame rate
+    parameter_dependents = {'offset_x': ('max_width',),
+                            'offset_y': ('max_height',),
+                            'width': ('bytes_per_frame', 'target_frame_rate'),
+                            'height': ('bytes_per_frame', 'target_frame_rate'),
+                            'exposure': ('target_frame_rate',),
+                            'packet_size': ('target_frame_rate',)}
+
     def __init__(self, serial_number, trigger_mode, packet_size=8192, binning=1):
         super().__init__(serial_number)
         tlf = pylon.TlFactory.GetInstance()
         di = pylon.DeviceInfo()
         di.SetSerialNumber(serial_number)
-        device = tlf.EnumerateDevices([di, ])[0]
+        devices = tlf.EnumerateDevices([di, ])
+        if len(devices) == 0:
+            raise RuntimeError(f'camera {serial_number} not found')
+        device = devices[0]
         self.name = device.GetUserDefinedName()
         self.model = device.GetModelName()
+        if device.GetDeviceClass() == 'BaslerGigE':
+            self._interface = device.GetInterface()
+        else:
+            self._interface = None
 #        self.address = device.GetAddress()
         self.cam = pylon.InstantCamera(tlf.CreateDevice(device))
+        self.cache_invalidator = CacheInvalidator(self)
+        self.cam.RegisterConfiguration(self.cache_invalidator, pylon.RegistrationMode_Append, pylon.Cleanup_None)
                 
         if trigger_mode == TriggerMode.SOFTWARE:
             raise NotImplementedError('Software triggers not supported')
@@ -44,6 +79,8 @@ class Basler_Camera(cw.Camera):
         self.lock.acquire()
         self.waiting_for_trigger = False
         self.lock.release()
+        # MaxNumBuffer to restore after a burst, None while not bursting
+        self.normal_max_num_buffer = None
             
         
         if self.model != 'Emulation':
@@ -69,22 +106,76 @@ class Basler_Camera(cw.Camera):
             self._binning = binning
         except _genicam.LogicalErrorException:
             self._binning = 1 # camera doesn't support binning, so we report a binning factor of 1
+        self.invalidate()
+
+    def read_node(self, name, node):
+        """Cached value of the GenICam node called node"""
+        return self.cached(name, lambda: getattr(self.cam, node).GetValue())
+
+    def write_node(self, name, node, value):
+        parameter = getattr(self.cam, node)
+        self.write_through(name, lambda: parameter.SetValue(value), parameter.GetValue)
     
     @property
     def frame_transmission_delay(self):
-        return self.cam.GevSCFTD.GetValue()
+        return self.read_node('frame_transmission_delay', 'GevSCFTD')
 
     @frame_transmission_delay.setter
     def frame_transmission_delay(self, value):
-        return self.cam.GevSCFTD.SetValue(value)
+        self.write_node('frame_transmission_delay', 'GevSCFTD', value)
 
     @property
     def interpacket_delay(self):
-        return self.cam.GevSCPD.GetValue()
+        return self.read_node('interpacket_delay', 'GevSCPD')
 
     @interpacket_delay.setter
     def interpacket_delay(self, value):
-        self.cam.GevSCPD.SetValue(value)
+        self.write_node('interpacket_delay', 'GevSCPD', value)
+
+    @property
+    def packet_size(self):
+        return self.read_node('packet_size', 'GevSCPSPacketSize')
+
+    @packet_size.setter
+    def packet_size(self, value):
+        self.write_node('packet_size', 'GevSCPSPacketSize', value)
+
+    @property
+    def max_packet_size(self):
+        return self.cached('max_packet_size', lambda: self.cam.GevSCPSPacketSize.GetMax())
+
+    @property
+    def tick_frequency(self):
+        """Frequency of the timestamp ticks GevSCPD and GevSCFTD are given in, in Hz"""
+        def read():
+            try:
+                return self.cam.GevTimestampTickFrequency.GetValue()
+            except _genicam.LogicalErrorException:
+                return 125e6
+        return self.cached('tick_frequency', read)
+
+    @property
+    def interface(self):
+        return self._interface
+
+    @property
+    def bytes_per_frame(self):
+        return self.read_node('bytes_per_frame', 'PayloadSize')
+
+    @property
+    def target_frame_rate(self):
+        return self.read_node('target_frame_rate', 'ResultingFrameRateAbs')
+
+    def grab_statistics(self):
+        stream = self.cam.StreamGrabber
+        try:
+            resent_packets = stream.Statistic_Resend_Packet_Count.GetValue()
+        except _genicam.LogicalErrorException:
+            resent_packets = 0  # only GigE stream grabbers request resends
+        return cw.GrabStatistics(stream.Statistic_Total_Buffer_Count.GetValue(),
+                                 stream.Statistic_Failed_Buffer_Count.GetValue(),
+                                 resent_packets,
+                                 stream.Statistic_Buffer_Underrun_Count.GetValue())
 
     @property
     def pixel_format(self):
@@ -92,12 +183,12 @@ class Basler_Camera(cw.Camera):
     
     @property
     def gain(self):
-        return self.cam.GainRaw.GetValue()
+        return self.read_node('gain', 'GainRaw')
     
     @gain.setter
     def gain(self, value):
         try: 
-            self.cam.GainRaw.SetValue(value)    
+            self.write_node('gain', 'GainRaw', value)    
         except _genicam.OutOfRangeException:
             pass
     @property
@@ -107,54 +198,67 @@ class Basler_Camera(cw.Camera):
         Returns:
             float: exposure time in ms
         """
-        return self.cam.ExposureTimeRaw.GetValue()/1e3
+        return self.cached('exposure', self.read_exposure)
     
+    def read_exposure(self):
+        return self.cam.ExposureTimeRaw.GetValue()/1e3
+
     @exposure.setter
     def exposure(self, value):
         try:
-            self.cam.ExposureTimeRaw.SetValue(int(value*1e3))
+            self.write_through('exposure', lambda: self.cam.ExposureTimeRaw.SetValue(int(value*1e3)),
+                               self.read_exposure)
         except _genicam.OutOfRangeException:
             pass
     @property
     def offset_x(self):
-        return self.cam.OffsetX.GetValue()
+        return self.read_node('offset_x', 'OffsetX')
     
     @offset_x.setter
     def offset_x(self, value):
-        self.cam.OffsetX.SetValue(value)
+        self.write_node('offset_x', 'OffsetX', value)
     
     @property
     def offset_y(self):
-        return self.cam.OffsetY.GetValue()
+        return self.read_node('offset_y', 'OffsetY')
     
     @offset_y.setter
     def offset_y(self, value):
-        self.cam.OffsetY.SetValue(value)
+        self.write_node('offset_y', 'OffsetY', value)
     
     @property
     def width(self):
-        return self.cam.Width.GetValue()
+        return self.read_node('width', 'Width')
     
     @width.setter
     def width(self, value):
-        self.cam.Width.SetValue(value)
+        self.write_node('width', 'Width', value)
     
     @property  
     def height(self):
-        return self.cam.Height.GetValue()
+        return self.read_node('height', 'Height')
     
     @height.setter
     def height(self, value):
-        self.cam.Height.SetValue(value)
+        self.write_node('height', 'Height', value)
     
     @property    
     def max_width(self):
-        return self.cam.WidthMax.GetValue()
+        return self.read_node('max_width', 'WidthMax')
     
     @property
     def max_height(self):
-        return self.cam.HeightMax.GetValue()
+        return self.read_node('max_height', 'HeightMax')
     
+    @property
+    def sensor_width(self):
+        # WidthMax shrinks with OffsetX, SensorWidth is the unbinned sensor
+        return -(-self.read_node('sensor_width', 'SensorWidth')//self.binning)
+
+    @property
+    def sensor_height(self):
+        return -(-self.read_node('sensor_height', 'SensorHeight')//self.binning)
+
     @property
     def binning(self):
         return self._binning
@@ -175,14 +279,23 @@ class Basler_Camera(cw.Camera):
             self.cam.TriggerMode = 'Off'
         else:
             raise TypeError('Input must be of type TriggerMode')
+        self.invalidate('target_frame_rate')
         
     def start_grabbing(self):
+        self.restore_max_num_buffer()
         if self.trigger_mode == TriggerMode.FREERUN or self.trigger_mode == TriggerMode.HARDWARE:
 #            self.cam.StartGrabbing(pylon.GrabStrategy_LatestImageOnly, pylon.GrabLoop_ProvidedByUser)
             self.cam.StartGrabbing(pylon.GrabStrategy_LatestImageOnly, pylon.GrabLoop_ProvidedByInstantCamera)
         elif self.trigger_mode == TriggerMode.SOFTWARE:
             self.cam.StartGrabbing(pylon.GrabStrategy_LatestImageOnly, pylon.GrabLoop_ProvidedByInstantCamera)
     
+    def start_burst_grabbing(self, buffer_count):
+        # the burst's buffer pool is given back when grabbing stops
+        if self.normal_max_num_buffer is None:
+            self.normal_max_num_buffer = self.cam.MaxNumBuffer.GetValue()
+        self.cam.MaxNumBuffer = buffer_count
+        self.cam.StartGrabbing(pylon.GrabStrategy_OneByOne, pylon.GrabLoop_ProvidedByInstantCamera)
+    
     def return_frame(self):
         if self.trigger_mode == TriggerMode.FREERUN or self.trigger_mode == TriggerMode.HARDWARE:
             with self.cam.RetrieveResult(5000) as res:
@@ -217,6 +330,13 @@ class Basler_Camera(cw.Camera):
     
     def stop_grabbing(self):
         self.cam.StopGrabbing()
+        self.restore_max_num_buffer()
+
+    def restore_max_num_buffer(self):
+        # only writable while the camera isn't grabbing
+        if self.normal_max_num_buffer is not None:
+            self.cam.MaxNumBuffer = self.normal_max_num_buffer
+            self.normal_max_num_buffer = None
 
     def is_grabbing(self):
         return self.cam.IsGrabbing()
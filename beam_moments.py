@@ -0,0 +1,79 @@
+'''
+Beam moment calculations from image projections
+
+The first and second moments of an image only depend on its row and column
+projections, so the full-frame work is a single reduction per axis and
+everything after that is O(H + W).
+'''
+
+from collections import namedtuple
+
+import numpy as np
+
+BeamMoments = namedtuple('BeamMoments', ['total_counts', 'centroid_x', 'centroid_y', 'sigma_x', 'sigma_y'])
+
+class MomentEngine:
+
+    '''
+    Computes total counts, centroids and sigmas of a frame.
+
+    Coordinate vectors are cached per ROI (offsets and frame shape), so
+    they are only rebuilt when the ROI or binning changes.
+    '''
+    def __init__(self):
+        self._key = None
+        self._x_values = None
+        self._y_values = None
+        self._clipped = None
+
+    def coordinates(self, offset_x, offset_y, shape):
+        key = (offset_x, offset_y, shape)
+        if key != self._key:
+            height, width = shape
+            self._x_values = np.arange(offset_x, offset_x + width, dtype=float)
+            self._y_values = np.arange(offset_y, offset_y + height, dtype=float)
+            self._key = key
+        return self._x_values, self._y_values
+
+    def compute(self, frame, offset_x=0, offset_y=0, clip_negative=False):
+        """Calculate beam moments of a 2D frame.
+
+        Args:
+            frame (ndarray): image in row-major order
+            offset_x (int): x coordinate of the first column
+            offset_y (int): y coordinate of the first row
+            clip_negative (bool): weight negative pixels, e.g. noise below a subtracted background, as zero
+
+        Returns:
+            BeamMoments: total counts, centroids and sigmas in pixels. Centroids
+            and sigmas are nan if the frame has no counts.
+        """
+        x_values, y_values = self.coordinates(offset_x, offset_y, frame.shape)
+        if clip_negative:
+            frame = self.clip(frame)
+        if np.issubdtype(frame.dtype, np.integer):
+            accumulator = np.int64
+        else:
+            accumulator = np.float64
+        x_projection = frame.sum(axis=0, dtype=accumulator)
+        y_projection = frame.sum(axis=1, dtype=accumulator)
+        return moments_from_projections(x_projection, y_projection, x_values, y_values)
+
+    def clip(self, frame):
+        # into a buffer kept between frames, the subtracted frame itself is displayed and archived
+        if self._clipped is None or self._clipped.shape != frame.shape or self._clipped.dtype != frame.dtype:
+            self._clipped = np.empty_like(frame)
+        return np.maximum(frame, 0, out=self._clipped)
+
+def moments_from_projections(x_projection, y_projection, x_values, y_values):
+    total_counts = x_projection.sum()
+    # over-subtracted frames can sum to less than nothing, which has no centroid either
+    if total_counts <= 0:
+        return BeamMoments(total_counts, np.nan, np.nan, np.nan, np.nan)
+    x_weights = x_projection / total_counts
+    y_weights = y_projection / total_counts
+    centroid_x = np.dot(x_values, x_weights)
+    centroid_y = np.dot(y_values, y_weights)
+    sigma_x = np.sqrt(np.dot((x_values - centroid_x)**2, x_weights))
+    sigma_y = np.sqrt(np.dot((y_values - centroid_y)**2, y_weights))
+    return BeamMoments(total_counts, centroid_x, centroid_y, sigma_x, sigma_y)
@@ -0,0 +1,284 @@
+'''
+Headless acquisition daemon
+
+Runs cameras without the GUI: cameras are opened by serial number from a JSON
+config file, and acquisition, processing and archiving run on the same worker
+threads as in Beamview. Instead of a display, beam statistics are logged at a
+fixed interval. Qt, pyqtgraph and the colormaps are never imported, so the
+daemon starts quickly and stays small on a headless host.
+
+SIGTERM or SIGINT stops the cameras, waits for the frames in flight and queued
+archive items, and closes open HDF5 archives before exiting.
+
+With share_frames, the latest processed frame and statistics of each camera
+are published in shared memory for other processes, see shared_frames.
+
+Usage: python beamview_headless.py config.json [--log-file FILE] [--log-level LEVEL]
+
+Example config, every key except the camera's serial number is optional:
+
+    {
+        "log_interval": 10,
+        "binning": 1,
+        "share_frames": true,
+        "archive": {"enabled": true, "directory": "/data/beams", "interval": 1, "format": "HDF5",
+                    "compression": "gzip", "prefix": "", "suffix": "", "shot_number": true,
+                    "queue_size": 64, "policy": "Drop oldest"},
+        "cameras": [
+            {"serial_number": "40012345", "name": "Gun", "exposure": 1.5, "gain": 0,
+             "roi": [0, 0, 1920, 1200], "statistics": true, "median_filter": false, "threshold": 5,
+             "background": "Dark frame", "average_frames": 1,
+             "analysis_rois": [{"name": "core", "x": 900, "y": 500, "width": 120, "height": 120}],
+             "events": {"pre_frames": 10, "post_frames": 10, "centroid_jump": 20}},
+            {"synthetic": "SYN0000", "width": 1920, "height": 1200, "bit_depth": 12, "frame_rate": 20},
+            {"replay": "/data/beams/20240101_120000_Gun.h5", "loop": true}
+        ]
+    }
+'''
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import signal
+import threading
+
+import numpy as np
+
+from archive_writer import ArchiveWriter, OverflowPolicy
+from background import BackgroundSubtractor
+from bandwidth_planner import BandwidthPlanner
+from beam_moments import MomentEngine
+from camera_wrapper import TriggerMode
+from event_capture import EventCapture, threshold_rules
+from frame_averager import FrameAverager
+from frame_processor import FrameProcessor
+from hdf5_archive import stack_filename
+from image_grabber import ImageGrabber
+from replay_camera import ReplayDeviceInfo
+from roi_stats import AnalysisRoi
+from shared_frames import SharedFramePublisher
+from stats_history import StatsHistory
+from synthetic_camera import SyntheticDeviceInfo
+
+logger = logging.getLogger('beamview')
+
+bit_depths = {'Mono8': 8, 'Mono12': 12, 'Mono16': 16}
+
+class HeadlessCamera:
+    # archived PNGs of the low resolution mode are grayscale without a colormap
+    display_lut = np.repeat(np.arange(256, dtype=np.uint8)[:, None], 3, axis=1)
+
+    def __init__(self, master, cam, config):
+        """Processing of one camera without a display, the counterpart of CameraFrame.
+
+        Args:
+            master (HeadlessBeamview): owner of the archive settings and shared services
+            cam (Camera): opened camera, configured from config
+            config (dict): camera entry of the config file
+        """
+        self.master = master
+        self.cam = cam
+        self.bit_depth = bit_depths.get(cam.pixel_format, 12)
+        self.display_levels = (0, 2**self.bit_depth - 1)
+        # the display stage passes frames through undecimated
+        self.display_factor = 1
+        self.display_decimation = 'Off'
+
+        self.use_median_filter = config.get('median_filter', False)
+        threshold = config.get('threshold')
+        self.use_threshold = threshold is not None
+        self.threshold = threshold if threshold is not None else 0
+        self.calculate_stats = config.get('statistics', True)
+
+        self.last_archive_time = 0
+        self.shot_number = 0
+        self.moment_engine = MomentEngine()
+        self.stats_history = StatsHistory(seconds=master.log_interval)
+        self.background = BackgroundSubtractor(master.background_dir, cam.serial_number,
+                                               alpha=config.get('background_alpha', 0.05))
+        self.background.set_mode(config.get('background', 'Off'))
+        self.averager = FrameAverager(max(1, config.get('average_frames', 1)))
+        self.stats_on_average = config.get('statistics_on_average', True)
+        self.analysis_rois = [AnalysisRoi(**roi) for roi in config.get('analysis_rois', [])]
+        self.event_capture = EventCapture()
+        events = config.get('events')
+        if events is not None:
+            self.event_capture.configure(events.get('pre_frames', 10), events.get('post_frames', 10),
+                                         threshold_rules(events.get('centroid_jump'), events.get('saturated_pixels'),
+                                                         events.get('counts_dropout')))
+            self.event_capture.enabled = True
+        self.frame_publisher = SharedFramePublisher(cam) if master.share_frames else None
+
+        self.image_grabber = ImageGrabber(self)
+        # nothing takes the results, each one replaces and releases the previous
+        self.processor = FrameProcessor(self, self.image_grabber.ring_buffer)
+        self.cam.register_event_handler(self.image_grabber)
+
+    def archive_stack_filename(self, tag):
+        return stack_filename(self.master, self.cam.name, tag)
+
+    def start(self):
+        if not self.cam.is_grabbing():
+            self.master.start_camera(self.cam)
+            self.cam.start_grabbing()
+
+    def stop(self):
+        if self.cam.is_grabbing():
+            self.cam.stop_grabbing()
+            self.master.stop_camera(self.cam)
+
+    def close(self):
+        self.stop()
+        self.cam.release_camera()
+        self.processor.stop()
+        if self.frame_publisher is not None:
+            self.frame_publisher.close()
+
+class HeadlessBeamview:
+    def __init__(self, config):
+        """Cameras, archive writer and bandwidth planning of the daemon, set up from config."""
+        archive = config.get('archive', {})
+        self.archive_mode = archive.get('enabled', False)
+        self.low_res_mode = archive.get('low_res', False)
+        self.archive_time = archive.get('interval', 300)
+        self.archive_dir = os.path.expanduser(archive.get('directory', '~'))
+        self.archive_shot_number = archive.get('shot_number', True)
+        self.archive_prefix = archive.get('prefix', '')
+        self.archive_suffix = archive.get('suffix', '')
+        self.archive_format = archive.get('format', 'HDF5')
+        self.archive_compression = archive.get('compression', 'gzip')
+        self.archive_session = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.archive_writer = ArchiveWriter(queue_size=archive.get('queue_size', 64),
+                                            policy=OverflowPolicy(archive.get('policy', 'Drop oldest')))
+        self.background_dir = os.path.join(os.path.expanduser('~'), '.beamview', 'backgrounds')
+        self.log_interval = config.get('log_interval', 10)
+        self.binning = config.get('binning', 1)
+        self.share_frames = config.get('share_frames', False)
+
+        self.bandwidth_planner = BandwidthPlanner()
+        self.bandwidth_plan = []
+        # parameter access errors that only affect the camera concerned, set once pylon is loaded
+        self.transport_errors = ()
+        self.running_cameras = {}
+        self.cameras = {}
+        self.stop_event = threading.Event()
+        for cam_config in config.get('cameras', []):
+            try:
+                self.open_camera(cam_config)
+            except Exception as e:
+                logger.error(f'Could not open camera {cam_config}: {e}')
+
+    def open_camera(self, cam_config):
+        binning = cam_config.get('binning', self.binning)
+        if 'synthetic' in cam_config:
+            device = SyntheticDeviceInfo(cam_config['synthetic'], cam_config.get('name', ''),
+                                         cam_config.get('width', 1920), cam_config.get('height', 1200),
+                                         cam_config.get('bit_depth', 12), cam_config.get('frame_rate', 20))
+            cam = device.create_camera(TriggerMode.FREERUN, binning)
+        elif 'replay' in cam_config:
+            device = ReplayDeviceInfo(cam_config['replay'], loop=cam_config.get('loop', True))
+            cam = device.create_camera(TriggerMode.FREERUN, binning)
+        else:
+            # imported here so synthetic and replay cameras work without pypylon installed
+            from pypylon import _genicam as gen
+            from basler_camera_wrapper import Basler_Camera
+            self.transport_errors = (gen.GenericException,)
+            cam = Basler_Camera(str(cam_config['serial_number']), TriggerMode.FREERUN,
+                                self.bandwidth_planner.max_packet_size, binning)
+        if cam_config.get('name'):
+            cam.name = cam_config['name']
+        elif cam.name == '':
+            cam.name = str(cam.serial_number)
+        if 'exposure' in cam_config:
+            cam.exposure = cam_config['exposure']
+        if 'gain' in cam_config:
+            cam.gain = cam_config['gain']
+        if 'roi' in cam_config:
+            cam.set_roi(*cam_config['roi'])
+        self.cameras[cam.serial_number] = HeadlessCamera(self, cam, cam_config)
+        logger.info(f'Opened {cam.name} ({cam.serial_number}), {cam.width}x{cam.height} at ({cam.offset_x}, {cam.offset_y})')
+
+    def set_delays(self):
+        self.bandwidth_plan = self.bandwidth_planner.apply(self.running_cameras.values(), self.transport_errors)
+
+    def start_camera(self, cam):
+        if cam.serial_number not in self.running_cameras:
+            self.running_cameras[cam.serial_number] = cam
+            self.set_delays()
+
+    def stop_camera(self, cam):
+        if cam.serial_number in self.running_cameras:
+            del self.running_cameras[cam.serial_number]
+            self.set_delays()
+
+    def request_stop(self, signum, frame):
+        logger.info(f'Received {signal.Signals(signum).name}, shutting down')
+        self.stop_event.set()
+
+    def run(self):
+        """Acquire until SIGTERM or SIGINT, logging statistics every log_interval seconds."""
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        for camera in self.cameras.values():
+            camera.start()
+        try:
+            while not self.stop_event.wait(self.log_interval):
+                self.log_stats()
+        finally:
+            self.shutdown()
+
+    def log_stats(self):
+        for camera in self.cameras.values():
+            records = camera.stats_history.window(self.log_interval)
+            if len(records) > 1:
+                fps = (len(records) - 1)/(records['timestamp'][-1] - records['timestamp'][0])
+            else:
+                fps = 0
+            message = f'{camera.cam.name}: {fps:.1f} fps, dropped {camera.processor.dropped_frames}'
+            if len(records) > 0:
+                message += f', counts {np.mean(records["total_counts"]):.4g}'
+                # nan while statistics are off or the frames were empty
+                if np.any(np.isfinite(records['centroid_x'])):
+                    centroid = [np.nanmean(records[field]) for field in ('centroid_x', 'centroid_y')]
+                    sigma = [np.nanmean(records[field]) for field in ('sigma_x', 'sigma_y')]
+                    jitter = [camera.stats_history.jitter(field, records=records).rms
+                              for field in ('centroid_x', 'centroid_y')]
+                    message += (f', centroid ({centroid[0]:.2f}, {centroid[1]:.2f}) px'
+                                f', sigma ({sigma[0]:.2f}, {sigma[1]:.2f}) px'
+                                f', jitter ({jitter[0]:.2f}, {jitter[1]:.2f}) px rms')
+            logger.info(message)
+        if self.archive_mode:
+            stats = self.archive_writer.poll_stats()
+            logger.info(f'Archive: queue {stats.queue_depth}/{stats.queue_size}, {stats.bytes_per_second/1e6:.1f} MB/s, '
+                        f'written {stats.written}, dropped {stats.dropped}')
+
+    def shutdown(self):
+        for camera in self.cameras.values():
+            camera.close()
+        self.archive_writer.close_files()
+        stats = self.archive_writer.poll_stats()
+        logger.info(f'Stopped, archived {stats.written} frames, dropped {stats.dropped}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Beamview acquisition without the GUI.')
+    parser.add_argument('config', help='JSON file with the cameras and archive settings')
+    parser.add_argument('--log-file', help='log to FILE instead of stderr', metavar='FILE')
+    parser.add_argument('--log-level', help='logging level', default='INFO',
+                        choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'))
+    args = parser.parse_args()
+    logging.basicConfig(filename=args.log_file, level=args.log_level,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    with open(args.config) as f:
+        config = json.load(f)
+    beamview = HeadlessBeamview(config)
+    if len(beamview.cameras) == 0:
+        logger.error('No cameras could be opened')
+        beamview.shutdown()
+        return 1
+    beamview.run()
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,30 +1,54 @@
 from multiprocessing import dummy
 from PyQt5.QtGui import QIcon
-from PyQt5.QtWidgets import QAction, QActionGroup, QMainWindow, QWidget, QGridLayout, QApplication, QMessageBox
-from PyQt5.QtCore import pyqtSlot
+from PyQt5.QtWidgets import (QAction, QActionGroup, QMainWindow, QWidget, QGridLayout, QApplication, QMessageBox, QLabel,
+                             QFileDialog)
+from PyQt5.QtCore import Qt, pyqtSlot, pyqtSignal, QTimer
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import threading
 import time
 import datetime
 import numpy as np
-from camera_frame import CameraFrame
+from camera_frame import CameraFrame, CameraPlaceholder
 import os
 import qrc_icons
 import faulthandler
 import argparse
-import pypylon.pylon as pylon
-from pypylon import _genicam as gen
-from basler_camera_wrapper import Basler_Camera, TriggerMode
+from camera_wrapper import TriggerMode
+from synthetic_camera import SyntheticDeviceInfo
+from replay_camera import ReplayDeviceInfo
+try:
+    import pypylon.pylon as pylon
+    from pypylon import _genicam as gen
+    # parameter access errors that only affect the camera concerned
+    transport_errors = (gen.GenericException,)
+except ImportError:
+    # synthetic cameras still work without pypylon
+    pylon = None
+    transport_errors = ()
 from settings_window import SettingsWindow
 from camera_list_window import CameraListWindow
 import pyqtgraph as pg
 from archive_settings import ArchiveSettings
-import json
+from archive_writer import ArchiveWriter, OverflowPolicy
+from bandwidth_planner import BandwidthPlanner
+from bandwidth_window import BandwidthWindow
+from grab_telemetry import GrabTelemetry, DelayController
+from telemetry_window import TelemetryWindow
+from pipeline_window import PipelineWindow
+from render_scheduler import RenderScheduler
+from device_discovery import DeviceDiscovery
+from session import device_entry, make_device, acquisition_settings, open_camera, read_session, write_session
 
-packet_size = 700
 binning = 4
 
 class Beamview(QMainWindow):    
-    def __init__(self, app):
+    # cameras opened on worker threads are handed to the GUI thread with the session entry they belong to
+    camera_opened = pyqtSignal(object, object)
+    camera_open_failed = pyqtSignal(object, str)
+    devices_changed = pyqtSignal(object)
+
+    def __init__(self, app, synthetic_devices=()):
         super().__init__()
         self.setWindowTitle('Beamview')
         self.camera_frames = {}
@@ -38,13 +62,27 @@ class Beamview(QMainWindow):
         self.archive_shot_number_offset = 0
         self.archive_prefix = ''
         self.archive_suffix = ''
+        self.archive_format = 'TIFF'
+        self.archive_compression = 'gzip'
+        self.archive_session = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.archive_writer = ArchiveWriter(queue_size=64, policy=OverflowPolicy.DROP_OLDEST)
+        self.background_dir = os.path.join(os.path.expanduser('~'), '.beamview', 'backgrounds')
+        self.session_dir = os.path.join(os.path.expanduser('~'), '.beamview', 'sessions')
+        
+        self.bandwidth_planner = BandwidthPlanner()
+        self.bandwidth_plan = []
+        self.grab_telemetry = GrabTelemetry()
+        self.delay_controller = DelayController(self.bandwidth_planner)
         
-        # get basler devices
-        tlf = pylon.TlFactory.GetInstance()
-        self.devices = tlf.EnumerateDevices()
-        for i, device in enumerate(self.devices):
-            if device.GetUserDefinedName() == '':
-                device.SetUserDefinedName(f'Camera {i}')
+        # devices keyed by serial number, basler devices are added as the background discovery finds them
+        self.devices = {}
+        self.device_count = 0
+        for device in synthetic_devices:
+            self.name_device(device)
+            self.devices[device.GetSerialNumber()] = device
+        # devices that went away while their camera is open stay listed as unreachable
+        self.unreachable_devices = set()
+        self.device_accessible = {}
         
         # create grid for camera frames
         dummy_widget = QWidget()
@@ -60,6 +98,13 @@ class Beamview(QMainWindow):
         self.connect_actions()
         self.create_toolbar()
         
+        self.archive_status_label = QLabel(parent=self)
+        self.statusBar().addPermanentWidget(self.archive_status_label)
+        self.archive_status_timer = QTimer()
+        self.archive_status_timer.timeout.connect(self.update_archive_status)
+        self.archive_status_timer.start(1000)
+        self.update_archive_status()
+
         self.app = app
 
         # disabling trigger thread, since software triggering is disabled
@@ -69,24 +114,68 @@ class Beamview(QMainWindow):
         
         self.opened_cameras = {}
         self.running_cameras = {}
+        # opening a camera blocks for seconds, so several are opened at once on worker threads
+        self.camera_executor = ThreadPoolExecutor(max_workers=8)
+        # grid tiles of cameras being opened, keyed by serial number
+        self.pending_cameras = {}
+        self.session_order = []
+        self.share_frames = False
+        self.camera_opened.connect(self.camera_ready)
+        self.camera_open_failed.connect(self.camera_open_error)
+        self.devices_changed.connect(self.update_devices)
         
         self.selected_camera = None
+        self.render_scheduler = RenderScheduler(self)
         
         self.settings_window = SettingsWindow(self, app)
         self.camera_list_window = CameraListWindow(self, app)
+        self.telemetry_window = TelemetryWindow(self, app)
+        self.pipeline_window = PipelineWindow(self, app)
+        
+        self.telemetry_timer = QTimer()
+        self.telemetry_timer.timeout.connect(self.poll_telemetry)
+        self.telemetry_timer.start(1000)
+        
+        # enumerating can take seconds on a large network, so it runs in the background once the window is up
+        # and again periodically to pick up cameras that come and go
+        if pylon is not None:
+            self.device_discovery = DeviceDiscovery(enumerate_devices, is_device_accessible)
+        else:
+            self.device_discovery = None
+        self.discovery_future = None
+        self.discovery_timer = QTimer()
+        self.discovery_timer.timeout.connect(self.discover_devices)
+        self.discovery_timer.start(5000)
+        self.discover_devices()
             
     def closeEvent(self, event):
         self.camera_list_window.hide()
         self.settings_window.hide()
+        self.telemetry_window.hide()
+        self.pipeline_window.hide()
+        self.render_scheduler.stop()
+        self.discovery_timer.stop()
+        self.camera_executor.shutdown(wait=False)
+        # segments outlive the process unless unlinked
+        for frame in self.camera_frames.values():
+            frame.set_frame_sharing(False)
+        self.archive_writer.close_files()
         self.app.quit()
         
     def connect_actions(self):
         self.start_all_action.triggered.connect(self.start_all_cameras)
         self.stop_all_action.triggered.connect(self.stop_all_cameras)    
         self.camera_list_action.triggered.connect(self.open_camera_list)
+        self.replay_action.triggered.connect(self.open_replay)
+        self.save_session_action.triggered.connect(self.save_session)
+        self.load_session_action.triggered.connect(self.load_session)
         self.settings_action.triggered.connect(self.open_settings)    
         self.archive_action.triggered.connect(self.open_archive_settings)
+        self.bandwidth_action.triggered.connect(self.open_bandwidth_window)
+        self.telemetry_action.triggered.connect(self.open_telemetry)
+        self.pipeline_action.triggered.connect(self.open_pipeline_diagnostics)
         self.axis_action.toggled.connect(self.toggle_axes)
+        self.share_frames_action.toggled.connect(self.toggle_frame_sharing)
         self.crosshair_add_action.toggled.connect(self.toggle_add_crosshair)
         self.crosshair_move_action.toggled.connect(self.toggle_move_crosshair)
         self.crosshair_delete_action.toggled.connect(self.toggle_delete_crosshair)
@@ -95,10 +184,19 @@ class Beamview(QMainWindow):
         self.start_all_action = QAction(QIcon(':control.png'), '&Start all cameras', self)
         self.stop_all_action = QAction(QIcon(':control-stop-square.png'), '&Stop all cameras', self)
         self.camera_list_action = QAction(QIcon(':script--arrow.png'), '&Camera list...', self)
+        self.replay_action = QAction('&Replay archive...', self)
+        self.save_session_action = QAction('Save s&ession...', self)
+        self.load_session_action = QAction('&Load session...', self)
         self.settings_action = QAction(QIcon(':gear.png'), '&Settings...', self)
         self.archive_action = QAction(QIcon(':books-brown.png'), '&Archive settings', self)
+        self.bandwidth_action = QAction('&Bandwidth...', self)
+        self.telemetry_action = QAction('&Telemetry...', self)
+        self.pipeline_action = QAction('&Processing diagnostics...', self)
         self.axis_action = QAction(QIcon(':guide.png'), '&Toggle axis labels', self)
         self.axis_action.setCheckable(True)
+        self.share_frames_action = QAction('S&hare frames', self)
+        self.share_frames_action.setCheckable(True)
+        self.share_frames_action.setToolTip('Publish the latest frame of each camera in shared memory for other processes')
         self.crosshair_add_action = QAction(QIcon(':target--plus.png'), '&Add crosshair', self)
         self.crosshair_add_action.setCheckable(True)
         self.crosshair_move_action = QAction(QIcon(':target--arrow.png'), '&Move crosshair', self)
@@ -112,9 +210,16 @@ class Beamview(QMainWindow):
         self.toolbar.addAction(self.stop_all_action)
         self.toolbar.addSeparator()
         self.toolbar.addAction(self.camera_list_action)
+        self.toolbar.addAction(self.replay_action)
+        self.toolbar.addAction(self.save_session_action)
+        self.toolbar.addAction(self.load_session_action)
         self.toolbar.addAction(self.settings_action)
         self.toolbar.addSeparator()
         self.toolbar.addAction(self.archive_action)
+        self.toolbar.addAction(self.bandwidth_action)
+        self.toolbar.addAction(self.telemetry_action)
+        self.toolbar.addAction(self.pipeline_action)
+        self.toolbar.addAction(self.share_frames_action)
         self.toolbar.addAction(self.axis_action)
         self.toolbar.addSeparator()
         self.toolbar.addAction(self.crosshair_add_action)
@@ -135,7 +240,8 @@ class Beamview(QMainWindow):
         self.settings_window.refresh()
             
     def set_archive_parameters(self, archive_mode, low_res_mode, archive_time, archive_dir, archive_shot_number, archive_shot_number_offset,
-                               archive_prefix, archive_suffix):
+                               archive_prefix, archive_suffix, archive_policy=None, archive_queue_size=None,
+                               archive_format=None, archive_compression=None):
         self.archive_mode = archive_mode
         self.low_res_mode = low_res_mode
         self.archive_time = archive_time
@@ -146,11 +252,61 @@ class Beamview(QMainWindow):
         self.archive_shot_number_offset = archive_shot_number_offset
         self.archive_prefix = archive_prefix
         self.archive_suffix = archive_suffix
+        if archive_policy is not None:
+            self.archive_writer.policy = archive_policy
+        if archive_queue_size is not None:
+            self.archive_writer.resize(archive_queue_size)
+        if archive_format is not None:
+            self.archive_format = archive_format
+        if archive_compression is not None:
+            self.archive_compression = archive_compression
+        # applying archive settings starts a new session, so HDF5 archives go to new files. The old
+        # files are closed by the writer threads once their queued frames are written, the GUI doesn't wait
+        self.archive_writer.rotate()
+        self.archive_session = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    def update_archive_status(self):
+        stats = self.archive_writer.poll_stats()
+        self.archive_status_label.setText(f'Archive queue: {stats.queue_depth}/{stats.queue_size}   '
+                                          f'{stats.bytes_per_second/1e6:.1f} MB/s   '
+                                          f'Written: {stats.written}   Dropped: {stats.dropped}')
+        if stats.dropped > 0 or stats.queue_depth >= stats.queue_size:
+            self.archive_status_label.setStyleSheet('color: red')
+        else:
+            self.archive_status_label.setStyleSheet('')
     
     def open_archive_settings(self):
         archive_settings = ArchiveSettings(self)
         archive_settings.exec_()
         # self.settings_window.refresh()
+    
+    def open_bandwidth_window(self):
+        bandwidth_window = BandwidthWindow(self)
+        bandwidth_window.exec_()
+        
+    def open_telemetry(self):
+        self.telemetry_window.refresh()
+        self.telemetry_window.show()
+        self.telemetry_window.raise_()
+        self.telemetry_window.activateWindow()
+        
+    def open_pipeline_diagnostics(self):
+        self.pipeline_window.show()
+        self.pipeline_window.refresh()
+        self.pipeline_window.raise_()
+        self.pipeline_window.activateWindow()
+        
+    def poll_telemetry(self):
+        cams = list(self.running_cameras.values())
+        try:
+            samples = self.grab_telemetry.poll(cams)
+        except transport_errors as e:
+            print(f'could not read grab statistics: {e}')
+            return
+        if self.delay_controller.update(cams, samples):
+            self.set_delays()
+        if self.telemetry_window.isVisible():
+            self.telemetry_window.refresh()
             
     def toggle_add_crosshair(self):
         self.adding_crosshair = self.crosshair_add_action.isChecked()
@@ -188,8 +344,83 @@ class Beamview(QMainWindow):
         self.camera_list_window.raise_()
         self.camera_list_window.activateWindow()
         
+    def open_replay(self):
+        filename, _ = QFileDialog.getOpenFileName(self, 'Replay archive...', self.archive_dir,
+                                                  'Archives (*.tiff *.tif *.h5 *.npz)')
+        if filename == '':
+            return
+        self.add_device(ReplayDeviceInfo(filename))
+        self.open_camera_list()
+
+    def name_device(self, device):
+        if device.GetUserDefinedName() == '':
+            device.SetUserDefinedName(f'Camera {self.device_count}')
+        self.device_count += 1
+
+    def add_device(self, device):
+        serial_number = device.GetSerialNumber()
+        if serial_number in self.devices:
+            if serial_number in self.unreachable_devices:
+                self.unreachable_devices.discard(serial_number)
+                self.camera_list_window.update_device(serial_number)
+            return
+        self.name_device(device)
+        self.devices[serial_number] = device
+        self.camera_list_window.add_device(device)
+
+    def remove_device(self, serial_number):
+        if serial_number in self.opened_cameras or serial_number in self.pending_cameras:
+            self.unreachable_devices.add(serial_number)
+            self.camera_list_window.update_device(serial_number)
+            return
+        self.devices.pop(serial_number, None)
+        self.unreachable_devices.discard(serial_number)
+        self.device_accessible.pop(serial_number, None)
+        self.camera_list_window.remove_device(serial_number)
+
+    def device_status(self, serial_number):
+        if serial_number in self.unreachable_devices:
+            return 'Unreachable'
+        if serial_number in self.opened_cameras:
+            return 'Open'
+        if serial_number in self.pending_cameras:
+            return 'Connecting…'
+        if not self.device_accessible.get(serial_number, True):
+            return 'In use'
+        return 'Available'
+
+    def discover_devices(self):
+        if self.device_discovery is None or self.discovery_future is not None:
+            return
+        # cameras open here are known to be in use
+        skip = set(self.opened_cameras) | set(self.pending_cameras)
+        self.discovery_future = self.camera_executor.submit(self.device_discovery.scan, skip)
+        self.discovery_future.add_done_callback(self.discovery_finished)
+
+    def discovery_finished(self, future):
+        # runs on the worker thread, the device list belongs to the GUI thread
+        try:
+            self.devices_changed.emit(future.result())
+        except Exception as e:
+            print(f'could not enumerate cameras: {e}')
+            self.devices_changed.emit(None)
+
+    @pyqtSlot(object)
+    def update_devices(self, result):
+        self.discovery_future = None
+        if result is None:
+            return
+        for device in result.added:
+            self.add_device(device)
+        for serial_number in result.removed:
+            self.remove_device(serial_number)
+        self.device_accessible.update(result.accessible)
+        for serial_number in result.accessible:
+            self.camera_list_window.update_device(serial_number)
+
     def regrid(self):                
-        for i, frame in enumerate(self.camera_frames.values()):
+        # cameras still being opened come after the open ones
+        for i, frame in enumerate(list(self.camera_frames.values()) + list(self.pending_cameras.values())):
             self.assign_frame_to_grid(frame, i)
         self.adjustSize()
         
@@ -254,28 +485,42 @@ class Beamview(QMainWindow):
         self.selected_camera = cam
         self.activate_frame(cam)
             
-    def add_camera(self, index):
-        serial_number = self.devices[index].GetSerialNumber()
-        if serial_number not in self.opened_cameras:
-            try:
-                cam  = Basler_Camera(serial_number, TriggerMode.FREERUN, packet_size, binning)
-            except gen.RuntimeException:
-                error_box = QMessageBox()
-                error_box.setIcon(QMessageBox.Critical)
-                error_box.setWindowTitle('Error')
-                error_box.setText('Error: Camera in use by another application.')
-                error_box.show()
-                error_box.exec_()
-                return
-            if cam.name == '':
-                cam.name = self.devices[index].GetUserDefinedName()
-            self.opened_cameras[serial_number] = cam
-            frame = CameraFrame(self, cam, self.app)
-            frame.close_signal.connect(self.remove_camera)
-            self.camera_frames[cam.serial_number] = frame
-            self.assign_frame_to_grid(frame, len(self.camera_frames) - 1)
-            self.settings_window.add_camera(cam, frame)
-            self.select_camera(cam)
+    def add_camera(self, serial_number):
+        device = self.devices[serial_number]
+        entry = {'serial_number': serial_number, 'name': device.GetUserDefinedName(), 'binning': binning}
+        if not isinstance(device, (SyntheticDeviceInfo, ReplayDeviceInfo)):
+            # basler cameras are opened by serial number
+            device = None
+        self.open_camera_async(entry, device)
+
+    def open_camera_async(self, entry, device):
+        """Open the camera of a session entry on a worker thread, with a placeholder in the grid until it is ready."""
+        serial_number = entry['serial_number']
+        if serial_number in self.opened_cameras or serial_number in self.pending_cameras:
+            return
+        self.pending_cameras[serial_number] = CameraPlaceholder(self, entry['name'])
+        self.regrid()
+        self.camera_list_window.update_device(serial_number)
+        future = self.camera_executor.submit(open_camera, entry, device, self.bandwidth_planner.max_packet_size)
+        future.add_done_callback(partial(self.camera_open_finished, entry))
+
+    def remove_placeholder(self, serial_number):
+        placeholder = self.pending_cameras.pop(serial_number, None)
+        if placeholder is not None:
+            self.grid.removeWidget(placeholder)
+            placeholder.deleteLater()
+
+    def add_camera_frame(self, cam):
+        self.opened_cameras[cam.serial_number] = cam
+        frame = CameraFrame(self, cam, self.app)
+        frame.close_signal.connect(self.remove_camera)
+        self.camera_frames[cam.serial_number] = frame
+        self.regrid()
+        self.settings_window.add_camera(cam, frame)
+        self.select_camera(cam)
+        if self.share_frames:
+            frame.set_frame_sharing(True)
+        return frame
 
     @pyqtSlot(str)
     def remove_camera(self, serial_number):
@@ -286,27 +531,22 @@ class Beamview(QMainWindow):
         del self.camera_frames[serial_number]
         self.regrid()
         self.settings_window.remove_camera(cam)
+        self.grab_telemetry.forget(serial_number)
         if serial_number in self.opened_cameras:
             del self.opened_cameras[serial_number]
-            self.camera_list_window.remove_camera(cam)
+            if serial_number in self.unreachable_devices:
+                self.remove_device(serial_number)
+            else:
+                self.camera_list_window.update_device(serial_number)
+
+    def toggle_frame_sharing(self, share_frames):
+        self.share_frames = share_frames
+        for frame in self.camera_frames.values():
+            frame.set_frame_sharing(share_frames)
 
     def set_delays(self):
-        accumulated_delay = 0
-        delay_offset = 0
-        maximum_interpacket_delay = 6000
-        for cam in self.opened_cameras.values():
-            try:
-                cam.frame_transmission_delay = accumulated_delay + delay_offset
-                total_packet_size = packet_size + 14 + 4  # including Ethernet headers
-                accumulated_delay += total_packet_size
-            except gen.LogicalErrorException:
-                pass
-        for cam in self.opened_cameras.values():
-            interpacket_delay = accumulated_delay if accumulated_delay < maximum_interpacket_delay else maximum_interpacket_delay
-            try:
-                cam.interpacket_delay = interpacket_delay
-            except gen.LogicalErrorException:
-                pass
+        """Plan packet size and delays of the running cameras so no network link is overloaded."""
+        self.bandwidth_plan = self.bandwidth_planner.apply(self.running_cameras.values(), transport_errors)
 
     def start_camera(self, cam):
         if cam.serial_number not in self.running_cameras:
@@ -318,24 +558,160 @@ class Beamview(QMainWindow):
             del self.running_cameras[cam.serial_number]
             self.set_delays()
             
-    def save_configuration(self):
-        pass
+    def save_session(self):
+        os.makedirs(self.session_dir, exist_ok=True)
+        filename, _ = QFileDialog.getSaveFileName(self, 'Save session...', self.session_dir, 'Sessions (*.json)')
+        if filename == '':
+            return
+        if not filename.endswith('.json'):
+            filename += '.json'
+        self.save_configuration(filename)
+
+    def load_session(self):
+        filename, _ = QFileDialog.getOpenFileName(self, 'Load session...', self.session_dir, 'Sessions (*.json)')
+        if filename != '':
+            self.load_configuration(filename)
+
+    def save_configuration(self, filename):
+        """Save the open cameras in grid order with their settings, and the archive settings, to filename."""
+        cameras = []
+        for serial_number, frame in self.camera_frames.items():
+            cam = frame.cam
+            cameras.append({'serial_number': serial_number,
+                            'name': cam.name,
+                            'device': device_entry(self.devices.get(serial_number)),
+                            'binning': cam.binning,
+                            'running': cam.is_grabbing(),
+                            'acquisition': acquisition_settings(cam),
+                            'frame': frame.settings()})
+        geometry = self.geometry()
+        session = {'archive': {'archive_mode': self.archive_mode,
+                               'low_res_mode': self.low_res_mode,
+                               'archive_time': self.archive_time,
+                               'archive_dir': self.archive_dir,
+                               'archive_shot_number': self.archive_shot_number,
+                               'archive_shot_number_offset': self.archive_shot_number_offset,
+                               'archive_prefix': self.archive_prefix,
+                               'archive_suffix': self.archive_suffix,
+                               'archive_policy': self.archive_writer.policy.value,
+                               'archive_queue_size': self.archive_writer.queue_size,
+                               'archive_format': self.archive_format,
+                               'archive_compression': self.archive_compression},
+                   'window': [geometry.x(), geometry.y(), geometry.width(), geometry.height()],
+                   'share_frames': self.share_frames,
+                   'cameras': cameras}
+        try:
+            write_session(filename, session)
+            self.statusBar().showMessage(f'Saved session to {filename}', 5000)
+        except (OSError, TypeError) as e:
+            print(e)
+            self.statusBar().showMessage(f'Could not save session: {e}', 10000)
+
+    def load_configuration(self, filename):
+        """Restore a session saved by save_configuration, the cameras are opened in the background."""
+        try:
+            session = read_session(filename)
+        except (OSError, ValueError) as e:
+            error_box = QMessageBox()
+            error_box.setIcon(QMessageBox.Critical)
+            error_box.setWindowTitle('Error')
+            error_box.setText(f'Error: could not load session: {e}')
+            error_box.exec_()
+            return
+        if 'archive' in session:
+            archive = dict(session['archive'])
+            archive['archive_policy'] = OverflowPolicy(archive['archive_policy'])
+            self.set_archive_parameters(**archive)
+        if 'window' in session:
+            self.setGeometry(*session['window'])
+        if 'share_frames' in session:
+            self.share_frames_action.setChecked(session['share_frames'])
+        entries = session.get('cameras', [])
+        self.session_order = [entry['serial_number'] for entry in entries]
+        for entry in entries:
+            device = make_device(entry)
+            if device is not None:
+                self.add_device(device)
+            self.open_camera_async(entry, device)
+        self.statusBar().showMessage(f'Opening {len(entries)} cameras from {filename}...', 5000)
+
+    def camera_open_finished(self, entry, future):
+        # runs on the worker thread, frames are made on the GUI thread
+        try:
+            self.camera_opened.emit(future.result(), entry)
+        except Exception as e:
+            if pylon is not None and isinstance(e, gen.RuntimeException):
+                self.camera_open_failed.emit(entry, 'Camera in use by another application.')
+            else:
+                self.camera_open_failed.emit(entry, str(e))
+
+    @pyqtSlot(object, object)
+    def camera_ready(self, cam, entry):
+        self.remove_placeholder(cam.serial_number)
+        frame = self.add_camera_frame(cam)
+        frame.apply_settings(entry.get('frame', {}))
+        self.camera_list_window.update_device(cam.serial_number)
+        # restored frames take their saved grid position, whichever camera finishes opening first
+        order = {serial_number: i for i, serial_number in enumerate(self.session_order)}
+        self.camera_frames = dict(sorted(self.camera_frames.items(), key=lambda item: order.get(item[0], len(order))))
+        self.regrid()
+        if entry.get('running', False):
+            frame.start_camera()
+        self.settings_window.refresh()
+
+    @pyqtSlot(object, str)
+    def camera_open_error(self, entry, error):
+        self.remove_placeholder(entry['serial_number'])
+        self.regrid()
+        if entry['serial_number'] in self.unreachable_devices:
+            self.remove_device(entry['serial_number'])
+        else:
+            self.camera_list_window.update_device(entry['serial_number'])
+        print(f'{entry["name"]}: could not open camera: {error}')
+        # not modal, a restored session can have several cameras fail at once
+        error_box = QMessageBox(self)
+        error_box.setIcon(QMessageBox.Critical)
+        error_box.setWindowTitle('Error')
+        error_box.setText(f'Error: could not open {entry["name"]}: {error}')
+        error_box.setAttribute(Qt.WA_DeleteOnClose)
+        error_box.show()
                 
+def enumerate_devices():
+    return list(pylon.TlFactory.GetInstance().EnumerateDevices())
+
+def is_device_accessible(device):
+    return pylon.TlFactory.GetInstance().IsDeviceAccessible(device)
+
 def main():
     parser = argparse.ArgumentParser(description='Multicam Beamview.')
     parser.add_argument('--debug', help='create emulated cameras for debugging', action='store_true')
+    parser.add_argument('--synthetic', help='create N synthetic cameras that do not need pylon', type=int, default=0, metavar='N')
+    parser.add_argument('--synthetic-size', help='sensor size of synthetic cameras', default='1920x1200', metavar='WxH')
+    parser.add_argument('--synthetic-bit-depth', help='bit depth of synthetic cameras', type=int, choices=(8, 12, 16), default=12)
+    parser.add_argument('--synthetic-frame-rate', help='frame rate of synthetic cameras in Hz', type=float, default=20)
+    parser.add_argument('--session', help='restore the session saved in FILE', metavar='FILE')
+    parser.add_argument('--share-frames', help='publish the latest frame of each camera in shared memory',
+                        action='store_true')
     args = parser.parse_args()
     if args.debug:
         faulthandler.enable()
         number_of_emulated_cameras = 20
         os.environ['PYLON_CAMEMU'] = str(number_of_emulated_cameras)
+    synthetic_width, synthetic_height = (int(n) for n in args.synthetic_size.lower().split('x'))
+    synthetic_devices = [SyntheticDeviceInfo(f'SYN{i:04d}', f'Synthetic {i}', synthetic_width, synthetic_height,
+                                             args.synthetic_bit_depth, args.synthetic_frame_rate)
+                         for i in range(args.synthetic)]
     app = QApplication([])
     pg.setConfigOption('imageAxisOrder', 'row-major')
-    beamview = Beamview(app)
+    beamview = Beamview(app, synthetic_devices)
     beamview.show()
-    beamview.camera_list_window.show()  
-    beamview.camera_list_window.raise_()
-    beamview.camera_list_window.activateWindow()
+    beamview.share_frames_action.setChecked(args.share_frames)
+    if args.session is not None:
+        beamview.load_configuration(args.session)
+    else:
+        beamview.camera_list_window.show()  
+        beamview.camera_list_window.raise_()
+        beamview.camera_list_window.activateWindow()
     app.exec_()
     
     
@@ -0,0 +1,55 @@
+'''
+Benchmark of the per-frame statistics
+
+Compares processing.frame_statistics with the separate np.sum, np.unique and
+np.max passes the frame processor used before, for the 8, 12 and 16-bit
+formats a CameraFrame can have.
+
+Usage: python benchmark_frame_statistics.py [--width 1920] [--height 1200] [--repeat 20]
+'''
+
+import argparse
+import timeit
+
+import numpy as np
+
+from processing import frame_statistics
+
+def legacy_statistics(frame, bit_depth):
+    total_counts = np.sum(frame)
+    saturation = 2**bit_depth - 1
+    unique, counts = np.unique(frame, return_counts=True)
+    sat_pixels = dict(zip(unique, counts)).get(saturation, 0)
+    max_data = np.max(frame)
+    return total_counts, sat_pixels, max_data
+
+def beam_frame(width, height, bit_depth, rng):
+    saturation = 2**bit_depth - 1
+    y, x = np.ogrid[:height, :width]
+    beam = 1.2*saturation*np.exp(-((x - width/2)**2/(2*(width/8)**2) + (y - height/2)**2/(2*(height/8)**2)))
+    frame = beam + rng.normal(0, 0.01*saturation, (height, width)) + 0.02*saturation
+    return np.clip(frame, 0, saturation).astype(np.uint8 if bit_depth == 8 else np.uint16)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the per-frame statistics')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f'{args.width}x{args.height}, best of {args.repeat}')
+    print(f'{"bit depth":>9} {"legacy (ms)":>12} {"fused (ms)":>11} {"speedup":>8}')
+    for bit_depth in (8, 12, 16):
+        frame = beam_frame(args.width, args.height, bit_depth, rng)
+        stats = frame_statistics(frame, bit_depth)
+        total_counts, sat_pixels, max_data = legacy_statistics(frame, bit_depth)
+        assert stats.total_counts == total_counts
+        assert stats.saturated_pixels == sat_pixels
+        assert stats.maximum == max_data
+        legacy = min(timeit.repeat(lambda: legacy_statistics(frame, bit_depth), number=1, repeat=args.repeat))
+        fused = min(timeit.repeat(lambda: frame_statistics(frame, bit_depth), number=1, repeat=args.repeat))
+        print(f'{bit_depth:>9} {1e3*legacy:>12.2f} {1e3*fused:>11.2f} {legacy/fused:>7.1f}x')
+
+if __name__ == '__main__':
+    main()
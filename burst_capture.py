@@ -0,0 +1,66 @@
+'''
+Burst capture into a preallocated in-memory frame stack
+
+Every frame of a burst is copied into a stack allocated before the burst
+starts, so recording at full frame rate does no allocation. Missing frames
+are found afterwards from gaps in the camera's frame IDs.
+'''
+
+import threading
+
+import numpy as np
+
+from archive_writer import ArchiveItem
+
+class BurstRecorder:
+    def __init__(self, n_frames, shape, dtype):
+        """Recorder for a burst of n_frames frames of the given shape and dtype."""
+        self.stack = np.empty((n_frames,) + tuple(shape), dtype=dtype)
+        self.frame_ids = np.zeros(n_frames, dtype=np.int64)
+        self.timestamps = np.zeros(n_frames, dtype=np.float64)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    @property
+    def n_frames(self):
+        return self.stack.shape[0]
+
+    @property
+    def complete(self):
+        return self.count >= self.n_frames
+
+    def record(self, array, frame_id, timestamp):
+        """Copy a frame into the stack.
+
+        Returns:
+            bool: True if this frame completed the burst
+        """
+        with self.lock:
+            if self.complete:
+                return False
+            if array.shape != self.stack.shape[1:]:
+                # the ROI changed under the burst, which can't be stored in the stack
+                raise ValueError('Frame shape does not match the burst')
+            i = self.count
+            np.copyto(self.stack[i], array, casting='unsafe')
+            self.frame_ids[i] = frame_id
+            self.timestamps[i] = timestamp
+            self.count += 1
+            return self.complete
+
+    def missed_frame_ids(self):
+        """Frame IDs between the first and last recorded frame that were never recorded."""
+        ids = self.frame_ids[:self.count]
+        missed = []
+        for previous, current in zip(ids[:-1], ids[1:]):
+            if current > previous + 1:
+                missed.extend(range(previous + 1, current))
+        return missed
+
+    def archive_item(self, filename):
+        """ArchiveItem that writes the recorded frames to filename (.h5 or .npz). The recorder must not be reused."""
+        missed = np.array(self.missed_frame_ids(), dtype=np.int64)
+        return ArchiveItem(filename, self.stack[:self.count],
+                           datasets={'frame_ids': self.frame_ids[:self.count],
+                                     'timestamps': self.timestamps[:self.count],
+                                     'missed_frame_ids': missed})
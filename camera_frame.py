@@ -6,18 +6,23 @@ import faulthandler
 import os
 import cmasher as cmr
 import datetime
-import pyqtgraph.exporters as exp
 
 from PyQt5.QtWidgets import (QFrame, QHBoxLayout, QVBoxLayout, QLabel, QPushButton)
 from PyQt5.QtGui import QTransform
-from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+from PyQt5.QtCore import Qt, pyqtSignal
 import pyqtgraph as pg
 
 import numpy as np
-import scipy.ndimage as ndi
-from basler_camera_wrapper import Basler_Camera, TriggerMode
-from pypylon import pylon
-from PIL import Image
+from beam_moments import MomentEngine
+from frame_processor import FrameProcessor
+from burst_capture import BurstRecorder
+from hdf5_archive import stack_filename
+from event_capture import EventCapture, threshold_rules
+from stats_history import StatsHistory
+from background import BackgroundSubtractor
+from frame_averager import FrameAverager
+from roi_stats import AnalysisRoi
+from shared_frames import SharedFramePublisher
 
 class CameraFrame(QFrame):
     # format: "friendly name" displayed to users, "real name" used by getFromMatplotlib     
@@ -29,7 +34,11 @@ class CameraFrame(QFrame):
                  'viridis': 'viridis',
                  'inferno': 'inferno'}
     default_cmap = 'cmr.ember'
+    # longest strip chart window in seconds, the statistics history keeps at least that
+    max_history_window = 300
     close_signal = pyqtSignal(str)
+    burst_complete = pyqtSignal()
+    burst_failed = pyqtSignal(str)
     
     def __init__(self, master, cam, app):
         super().__init__(master)
@@ -48,6 +57,8 @@ class CameraFrame(QFrame):
         info_layout_1 = QHBoxLayout()
         info_layout_2 = QHBoxLayout()
         info_layout_3 = QHBoxLayout()
+        info_layout_4 = QHBoxLayout()
+        info_layout_5 = QHBoxLayout()
         
         main_layout.addLayout(status_layout)
         status_layout.addLayout(info_layout)
@@ -55,6 +66,8 @@ class CameraFrame(QFrame):
         info_layout.addLayout(info_layout_1)
         info_layout.addLayout(info_layout_2)
         info_layout.addLayout(info_layout_3)
+        info_layout.addLayout(info_layout_4)
+        info_layout.addLayout(info_layout_5)
                 
         info_layout_0.addWidget(QLabel(text=self.cam.name, parent=self))
         
@@ -70,6 +83,10 @@ class CameraFrame(QFrame):
 
         self.max_data_label = QLabel(text='Saturated pixels: 0     ', parent=self)
         info_layout_1.addWidget(self.max_data_label)
+        self.dropped_frames_label = QLabel(text='Dropped frames: 0     ', parent=self)
+        info_layout_1.addWidget(self.dropped_frames_label)
+        self.events_label = QLabel(text='Events: 0   ', parent=self)
+        info_layout_1.addWidget(self.events_label)
         info_layout_1.addStretch(1)
         
         self.centroid_label = QLabel(text='Centroids (px): (N/A, N/A)', parent=self)
@@ -80,6 +97,16 @@ class CameraFrame(QFrame):
         info_layout_3.addWidget(self.sigma_label)
         info_layout_3.addStretch(1)
         
+        self.jitter_label = QLabel(text='', parent=self)
+        self.jitter_label.setVisible(False)
+        info_layout_4.addWidget(self.jitter_label)
+        info_layout_4.addStretch(1)
+        
+        self.roi_label = QLabel(text='', parent=self)
+        self.roi_label.setVisible(False)
+        info_layout_5.addWidget(self.roi_label)
+        info_layout_5.addStretch(1)
+        
         close_button = QPushButton(text='Close camera', parent=self)
         close_layout = QVBoxLayout()
         close_layout.addStretch(1)
@@ -116,7 +143,9 @@ class CameraFrame(QFrame):
         
         self.img = pg.ImageItem()
         self._cmap = CameraFrame.default_cmap
-        self.img.setColorMap(pg.colormap.getFromMatplotlib(self.cmap))
+        colormap = pg.colormap.getFromMatplotlib(self.cmap)
+        self.img.setColorMap(colormap)
+        self.display_lut = colormap.getLookupTable(nPts=256, alpha=False)
         self.plot.addItem(self.img)
         
         # monkey patch in custom mouse events
@@ -126,6 +155,8 @@ class CameraFrame(QFrame):
         self.cbar = pg.ColorBarItem(values=(self.vmin, self.vmax))
         self.cbar.setImageItem(self.img)
         self.fig.addItem(self.cbar)
+        self.display_levels = (self.vmin, self.vmax)
+        self.cbar.sigLevelsChanged.connect(self.levels_changed)
         
         # font = .QFont()
         # font.setPixelSize(16)
@@ -136,34 +167,82 @@ class CameraFrame(QFrame):
         self.plot.showAxis('left', self.show_axes)
         self.tr = QTransform()
         
+        # frames are shown decimated by display_factor, picked so one frame pixel covers about one screen pixel
+        self.display_decimation = 'Mean'
+        self.display_factor = 1
+        self.applied_display_factor = 1
+        self.display_factor_stale = True
+        self.plot.getViewBox().sigResized.connect(self.display_factor_changed)
+        self.plot.getViewBox().sigRangeChanged.connect(self.display_factor_changed)
+        
         main_layout.addWidget(self.fig)
+        
+        # analysis regions are drawn in view coordinates and handed to the processor in frame pixels
+        self.roi_items = []
+        self.analysis_rois = []
+        self.rois_stale = False
+        self.roi_count = 0
+        
+        # strip charts of the statistics history, hidden until enabled in the settings
+        self.stats_history = StatsHistory(seconds=self.max_history_window)
+        self.history_window = 60
+        self.chart_interval = 0.2
+        self.last_chart_time = 0
+        self.charted_version = -1
+        self.chart_origin = 0
+        self.chart = pg.GraphicsLayoutWidget()
+        self.chart.setFixedHeight(180)
+        self.chart.setVisible(False)
+        self.chart_curves = {}
+        centroid_plot = self.chart.addPlot(row=0, col=0)
+        sigma_plot = self.chart.addPlot(row=1, col=0)
+        sigma_plot.setXLink(centroid_plot)
+        for plot, label in ((centroid_plot, 'Centroid'), (sigma_plot, 'Sigma')):
+            plot.setLabel('left', label)
+            plot.setClipToView(True)
+            plot.setDownsampling(auto=True, mode='peak')
+            plot.addLegend(offset=(-5, 5))
+        for plot, field, pen, name in ((centroid_plot, 'centroid_x', 'c', 'x'), (centroid_plot, 'centroid_y', 'm', 'y'),
+                                       (sigma_plot, 'sigma_x', 'c', 'x'), (sigma_plot, 'sigma_y', 'm', 'y')):
+            self.chart_curves[field] = StripChartCurve(plot, pen, name)
+        self.chart_plot = centroid_plot
+        sigma_plot.setLabel('bottom', 'Time (s)')
+        main_layout.addWidget(self.chart)
         self.setLayout(main_layout)
 
         self.plot_data = np.array([])
-        self.prev_frame_timestamp = time.time()
         self.use_median_filter = False
         self.calculate_stats = False
         self.use_threshold = False
         self.use_calibration = False
-        self.frame_available = False
         self.centroid_label.setEnabled(True)
         self.sigma_label.setEnabled(True)
 
         self.calibration = 1
        
-        self.lock = threading.Lock()
-        
         self.stop_camera()
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_frames)
-        self.timer.start(100)
         self.setMinimumHeight(400)
         self.crosshairs = []
-        self.image_grabber = ImageGrabber(self)
-        self.cam.register_event_handler(self.image_grabber)
 
         self.last_archive_time = 0
         self.shot_number = 0
+        self.moment_engine = MomentEngine()
+        # dark frames are kept per serial number, so they survive closing and reopening the camera
+        self.background = BackgroundSubtractor(master.background_dir, cam.serial_number)
+        self.averager = FrameAverager()
+        self.stats_on_average = True
+        self.image_grabber = ImageGrabber(self)
+        self.displayed_result = None
+        self.frame_publisher = None
+        # results are picked up by the master's render scheduler
+        self.processor = FrameProcessor(self, self.image_grabber.ring_buffer)
+        self.burst_recorder = None
+        self.burst_resume = False
+        self.burst_complete.connect(self.finish_burst)
+        self.burst_failed.connect(self.finish_burst)
+        self.event_capture = EventCapture()
+        self.configure_event_capture(False, 10, 10)
+        self.cam.register_event_handler(self.image_grabber)
         
     def toggle_axes(self):
         self.show_axes = not self.show_axes
@@ -176,12 +255,19 @@ class CameraFrame(QFrame):
 
     @cmap.setter
     def cmap(self, value):
-        self.cbar.setColorMap(pg.colormap.getFromMatplotlib(value))
+        colormap = pg.colormap.getFromMatplotlib(value)
+        self.cbar.setColorMap(colormap)
+        self.display_lut = colormap.getLookupTable(nPts=256, alpha=False)
         self._cmap = value
+
+    def levels_changed(self, cbar):
+        # kept as a plain attribute so the processing worker never touches the colorbar
+        self.display_levels = cbar.levels()
         
     def change_calibration(self, use_calibration, calibration):
         self.use_calibration = use_calibration
         self.calibration = calibration
+        self.charted_version = -1
         self.update_transform()
         
     def change_offset(self, x_offset, y_offset):
@@ -194,7 +280,25 @@ class CameraFrame(QFrame):
         self.tr.translate(self.x_offset, self.y_offset)
         if self.use_calibration:
             self.tr.scale(self.calibration, self.calibration)
+        self.tr.scale(self.applied_display_factor, self.applied_display_factor)
         self.img.setTransform(self.tr)
+        self.display_factor_stale = True
+        self.rois_stale = True
+
+    def display_factor_changed(self, *args):
+        # resizes and zooms come in bursts, so the factor is only worked out again on the next render
+        self.display_factor_stale = True
+
+    def update_display_factor(self):
+        """Pick the decimation factor from the number of frame pixels per physical screen pixel."""
+        # viewPixelSize is per logical pixel, a high DPI screen shows devicePixelRatio physical pixels across it
+        pixel_size = self.plot.getViewBox().viewPixelSize()
+        scale = self.calibration if self.use_calibration else 1
+        frame_pixels = min(pixel_size)/scale/self.fig.devicePixelRatioF()
+        if not np.isfinite(frame_pixels):
+            return  # the view has no size yet
+        self.display_factor = max(1, int(frame_pixels))
+        self.display_factor_stale = False
 
 
     def close(self):
@@ -204,16 +308,31 @@ class CameraFrame(QFrame):
     def cleanup(self):
         self.cam.stop_grabbing()
         self.cam.release_camera()
+        self.processor.stop()
+        self.set_frame_sharing(False)
+
+    def set_frame_sharing(self, enabled):
+        """Publish processed frames to other processes in shared memory, see shared_frames."""
+        if enabled and self.frame_publisher is None:
+            try:
+                self.frame_publisher = SharedFramePublisher(self.cam)
+            except OSError as e:
+                print(f'{self.cam.name}: could not create the shared memory segment: {e}')
+        elif not enabled and self.frame_publisher is not None:
+            publisher = self.frame_publisher
+            self.frame_publisher = None
+            publisher.close()
     
     def start_camera(self):
         if not self.cam.is_grabbing():
+            # plan the transport first, the packet size is locked once the camera streams
+            self.master.start_camera(self.cam)
             self.cam.start_grabbing()
             self.status_label.setText('Running...')
             try:
                 self.cam.request_frame()
             except:
                 print('trigger timed out')
-            self.master.start_camera(self.cam)
         
     def stop_camera(self):
         if self.cam.is_grabbing():
@@ -221,83 +340,197 @@ class CameraFrame(QFrame):
             self.status_label.setText('Stopped.  ')
             self.master.stop_camera(self.cam)
         
+    def start_burst(self, n_frames, buffer_count):
+        """Record the next n_frames frames into memory without dropping any, then save them."""
+        if self.burst_recorder is not None:
+            return
+        self.burst_resume = self.cam.is_grabbing()
+        self.stop_camera()
+        dtype = np.uint8 if self.bit_depth == 8 else np.uint16
+        self.burst_recorder = BurstRecorder(n_frames, (self.cam.height, self.cam.width), dtype)
+        self.image_grabber.burst_recorder = self.burst_recorder
+        self.master.start_camera(self.cam)
+        self.cam.start_burst_grabbing(buffer_count)
+        self.status_label.setText('Burst...   ')
+
+    def finish_burst(self, error=None):
+        """Save the recorded frames and resume normal grabbing, error is why the burst ended early."""
+        recorder = self.burst_recorder
+        self.burst_recorder = None
+        self.image_grabber.burst_recorder = None
+        self.stop_camera()
+        if recorder is None:
+            return
+        missed = recorder.missed_frame_ids()
+        if len(missed) > 0:
+            print(f'{self.cam.name}: burst missed frame IDs {missed}')
+        
+        if recorder.count > 0:
+            self.master.archive_writer.submit_stack(recorder.archive_item(self.archive_stack_filename('burst')))
+        
+        if self.burst_resume:
+            self.start_camera()
+        if error is not None:
+            print(f'{self.cam.name}: burst failed: {error}')
+            self.status_label.setText(f'Burst failed: {error}, {recorder.count} frames')
+        else:
+            self.status_label.setText(f'Burst: {recorder.count} frames, {len(missed)} missed')
+
+    def archive_stack_filename(self, tag):
+        return stack_filename(self.master, self.cam.name, tag)
+
+    def configure_event_capture(self, enabled, pre_frames, post_frames, centroid_jump=None, saturated_pixels=None,
+                                counts_dropout=None):
+        """Set up event-triggered capture. Rules whose threshold is None are disabled.
+
+        Args:
+            centroid_jump (float): centroid movement between frames in px
+            saturated_pixels (int): number of saturated pixels
+            counts_dropout (float): total counts as percent of their running average
+        """
+        self.event_centroid_jump = centroid_jump
+        self.event_saturated_pixels = saturated_pixels
+        self.event_counts_dropout = counts_dropout
+        self.event_capture.configure(pre_frames, post_frames,
+                                     threshold_rules(centroid_jump, saturated_pixels, counts_dropout))
+        self.event_capture.enabled = enabled
+
+    def settings(self):
+        """Display and processing settings, as saved in session files. Positions are in view coordinates."""
+        return {'cmap': self.cmap,
+                'levels': [float(level) for level in self.cbar.levels()],
+                'decimation': self.display_decimation,
+                'use_calibration': self.use_calibration,
+                'calibration': self.calibration,
+                'calculate_stats': self.calculate_stats,
+                'median_filter': self.use_median_filter,
+                'use_threshold': self.use_threshold,
+                'threshold': self.threshold,
+                'average_frames': self.averager.n_frames,
+                'stats_on_average': self.stats_on_average,
+                'background_mode': self.background.mode,
+                'background_frames': self.background.capture_frames,
+                'background_alpha': self.background.alpha,
+                'events': {'enabled': self.event_capture.enabled,
+                           'pre_frames': self.event_capture.pre_frames,
+                           'post_frames': self.event_capture.post_frames,
+                           'centroid_jump': self.event_centroid_jump,
+                           'saturated_pixels': self.event_saturated_pixels,
+                           'counts_dropout': self.event_counts_dropout},
+                'show_charts': self.chart.isVisibleTo(self),
+                'history_window': self.history_window,
+                'crosshairs': [[crosshair.pos().x(), crosshair.pos().y()] for crosshair in self.crosshairs],
+                'analysis_rois': [{'name': item.roi_name, 'pos': [item.pos().x(), item.pos().y()],
+                                   'size': [item.size().x(), item.size().y()]} for item in self.roi_items]}
+
+    def apply_settings(self, settings):
+        """Restore settings from a session file, keys that are missing keep their current value."""
+        if 'cmap' in settings:
+            self.cmap = settings['cmap']
+        if 'levels' in settings:
+            self.cbar.setLevels(tuple(settings['levels']))
+        self.display_decimation = settings.get('decimation', self.display_decimation)
+        self.change_calibration(settings.get('use_calibration', self.use_calibration),
+                                settings.get('calibration', self.calibration))
+        self.calculate_stats = settings.get('calculate_stats', self.calculate_stats)
+        self.use_median_filter = settings.get('median_filter', self.use_median_filter)
+        self.use_threshold = settings.get('use_threshold', self.use_threshold)
+        self.threshold = settings.get('threshold', self.threshold)
+        self.averager.set_frames(settings.get('average_frames', self.averager.n_frames))
+        self.stats_on_average = settings.get('stats_on_average', self.stats_on_average)
+        self.background.capture_frames = settings.get('background_frames', self.background.capture_frames)
+        self.background.alpha = settings.get('background_alpha', self.background.alpha)
+        # dark frames saved for the ROI are loaded with the first frame
+        self.background.set_mode(settings.get('background_mode', self.background.mode))
+        if 'events' in settings:
+            events = settings['events']
+            self.configure_event_capture(events['enabled'], events['pre_frames'], events['post_frames'],
+                                         events['centroid_jump'], events['saturated_pixels'], events['counts_dropout'])
+        # sessions from before the history was bounded can have None, the whole history
+        self.history_window = settings.get('history_window', self.history_window) or self.max_history_window
+        self.show_charts(settings.get('show_charts', self.chart.isVisibleTo(self)))
+        for x, y in settings.get('crosshairs', []):
+            self.add_crosshair(x, y)
+        for roi in settings.get('analysis_rois', []):
+            self.add_analysis_roi(roi['name'], roi['pos'], roi['size'])
+
+    def show_charts(self, show):
+        self.chart.setVisible(show)
+        self.jitter_label.setVisible(show)
+        self.charted_version = -1
+
+    def update_charts(self):
+        """Add new statistics to the strip charts and update the jitter figures."""
+        history = self.stats_history
+        if history.version == self.charted_version or time.time() - self.last_chart_time < self.chart_interval:
+            return
+        self.last_chart_time = time.time()
+        new_records, self.charted_version, reset = history.since(self.charted_version, self.history_window)
+        if self.use_calibration:
+            scale = self.calibration/1000
+            unit = 'mm'
+        else:
+            scale = 1
+            unit = 'px'
+        if reset:
+            for curve in self.chart_curves.values():
+                curve.clear()
+            # times relative to an origin near the data, so the curves don't carry epoch seconds
+            self.chart_origin = new_records['timestamp'][0] if len(new_records) > 0 else 0
+            self.chart_plot.setXRange(-self.history_window, 0, padding=0)
+        if len(new_records) > 0:
+            times = new_records['timestamp'] - self.chart_origin
+            for field, curve in self.chart_curves.items():
+                curve.append(times, new_records[field]*scale)
+        records = history.window(self.history_window)
+        if len(records) == 0:
+            self.jitter_label.setText('')
+            return
+        # the curves keep their data, only their position follows the latest record
+        latest = records['timestamp'][-1] - self.chart_origin
+        for curve in self.chart_curves.values():
+            curve.scroll(latest, latest - self.history_window)
+        jitter_x = history.jitter('centroid_x', records=records)
+        jitter_y = history.jitter('centroid_y', records=records)
+        self.jitter_label.setText(f'Jitter rms ({unit}): {jitter_x.rms*scale:.3g}, {jitter_y.rms*scale:.3g}   '
+                                  f'Drift ({unit}/s): {jitter_x.drift*scale:.3g}, {jitter_y.drift*scale:.3g}   '
+                                  f'Range ({unit}): {(jitter_x.maximum - jitter_x.minimum)*scale:.3g}, '
+                                  f'{(jitter_y.maximum - jitter_y.minimum)*scale:.3g}')
+
     def auto_range(self):
         self.cbar.setLevels((np.min(self.plot_data), np.max(self.plot_data)))
         
     def reset_range(self):
         self.cbar.setLevels((0, 2**self.bit_depth - 1))
 
-    def update_frames(self):
-        if self.cam.is_grabbing():
-#            if self.cam.trigger_mode == TriggerMode.FREERUN or self.cam.trigger_mode == TriggerMode.HARDWARE:
-#                self.plot_data = self.cam.return_frame()
-#                self.draw_frame()
-#            else:
-            self.lock.acquire()
-            if self.frame_available:
-                self.frame_available = False
-                self.draw_frame()
-            else:
-                self.lock.release()
-        
-    def draw_frame(self):
-        plot_data = self.plot_data
-        raw_data = np.copy(self.plot_data)
-        self.lock.release()
+    def display_frame(self):
+        result = self.processor.take_result()
+        if result is None:
+            return
+        # the image item keeps a reference to the displayed data, so its slot is held until it is replaced
+        self.processor.release(self.displayed_result)
+        self.displayed_result = result
         try:
-            frame_time = time.time() - self.prev_frame_timestamp
-            self.prev_frame_timestamp = time.time()
-            # if frame_time > 50:
-            #     frame_time = 50
-            frame_time_text = f'{frame_time:.3f} s'
+            self.plot_data = result.display_data
+            frame_time_text = f'{result.frame_time:.3f} s'
             self.frame_time_label.setText(f'Frame time: {frame_time_text:<12}')
+            self.dropped_frames_label.setText(f'Dropped frames: {result.dropped_frames:<6}')
+            self.events_label.setText(f'Events: {self.event_capture.event_count:<4}')
 
-            if self.use_median_filter:
-                plot_data = ndi.median_filter(plot_data, size=2)
-            total_counts = np.sum(plot_data)                
-            total_count_string = f'{total_counts:.4g}'
+            total_count_string = f'{result.total_counts:.4g}'
             self.total_count_label.setText(f'Total counts: {total_count_string:<10}')
-            saturation = 2**self.bit_depth - 1
-            unique, counts = np.unique(plot_data, return_counts=True)
-            sat_pixels = dict(zip(unique, counts))
-            # max_data_percent = 100 * np.max(plot_data) / (2**self.bit_depth - 1)
-            try:
-                sat_pixels = sat_pixels[saturation]
-            except KeyError:
-                sat_pixels = 0
-            max_data_string = f'{sat_pixels:.4g}'
-
+            max_data_string = f'{result.saturated_pixels:.4g}'
             self.max_data_label.setText(f'Saturated pixels: {max_data_string:<6}')
-            #if sat_pixel_percent > 97:
-#                self.max_data_label.setStyleSheet('background-color: red')
-#            else:
-#                self.max_data_label.setStyleSheet('background-color: none')
-            if self.use_threshold:
-                max_data = np.max(plot_data)
-                plot_data[plot_data < max_data*self.threshold/100] = 0
-
-
-            if self.calculate_stats:
-                calc_plot_data = np.copy(plot_data)
-                max_data = np.max(calc_plot_data)
-                # calc_frame[calc_frame < max_data*self.calc_threshold/100] = 0
-                calc_plot_data = calc_plot_data.astype(float)
-                calc_plot_data /= np.sum(calc_plot_data)
-                
-                x_values = np.arange(self.cam.offset_x, self.cam.offset_x + self.cam.width).astype(float)
-                y_values = np.arange(self.cam.offset_y, self.cam.offset_y + self.cam.height).astype(float)
-                
-                xx, yy = np.meshgrid(x_values, y_values, indexing='xy')
-                
-                centroid_x = np.sum(xx * calc_plot_data)
-                centroid_y = np.sum(yy * calc_plot_data)
-                
-                sigma_x = np.sqrt(np.sum((xx - centroid_x)**2 * calc_plot_data))
-                sigma_y = np.sqrt(np.sum((yy - centroid_y)**2 * calc_plot_data))
+
+            moments = result.moments
+            if moments is not None:
+                centroid_x, centroid_y = moments.centroid_x, moments.centroid_y
+                sigma_x, sigma_y = moments.sigma_x, moments.sigma_y
                 
                 if self.use_calibration:
-                    x_values *= self.pixel_calibration/1000
-                    y_values *= self.pixel_calibration/1000
+                    scale = self.calibration/1000
+                    centroid_x, centroid_y = centroid_x*scale, centroid_y*scale
+                    sigma_x, sigma_y = sigma_x*scale, sigma_y*scale
                     unit = '(mm)'
                 else:
                     unit = '(px)'
@@ -310,33 +543,21 @@ class CameraFrame(QFrame):
                 self.centroid_label.setEnabled(False)
                 self.sigma_label.setEnabled(False)
 
-            self.img.setImage(plot_data[::-1,], autoLevels=False)
-            if self.master.archive_mode and time.time() - self.last_archive_time > self.master.archive_time:
-                self.last_archive_time = time.time()
-                timestamp = datetime.datetime.now()
-                try:
-                    shot_number_string = f'_{self.shot_number}' if self.master.archive_shot_number else ''
-                    prefix_string = self.master.archive_prefix + '_' if self.master.archive_prefix != '' else ''
-                    suffix_string = '_' + self.master.archive_suffix if self.master.archive_suffix != '' else ''
-                    filename = os.path.join(self.master.archive_dir, f'{prefix_string}{timestamp.year}{timestamp.month:02d}{timestamp.day:02d}_{timestamp.hour:02d}{timestamp.minute:02d}{timestamp.second:02d}'+f'_{self.cam.name}{suffix_string}{shot_number_string}')
-                    print(filename)
-                    # np.savez(filename + '.npz', plot_data=self.camera_frames[sn].plot_data)
-                    if self.master.low_res_mode:
-                        exporter = exp.ImageExporter(self.plot)
-                        exporter.export(filename + '.png')
-                    else:
-                        im = Image.fromarray(raw_data)
-                        im.save(filename + '.tiff', 'TIFF')
-
-                    # res = cam.return_frame()
-                    # frame.image_grabber.OnImageGrabbed(cam, res)
-                    self.shot_number += 1
-                except Exception as e:
-                    print(e)
-            self.app.processEvents()
+            if result.display_factor != self.applied_display_factor:
+                self.applied_display_factor = result.display_factor
+                self.update_transform()
+            self.img.setImage(result.display_image[::-1,], autoLevels=False)
+            if self.display_factor_stale:
+                self.update_display_factor()
+            if self.rois_stale:
+                self.update_analysis_rois()
+            if len(result.roi_stats) > 0:
+                self.show_roi_stats(result.roi_stats)
+            if self.chart.isVisible():
+                self.update_charts()
         except RuntimeError as e:
             print(e)
-    
+
     def activate(self):
         self.setFrameStyle(QFrame.Box | QFrame.Plain)
         self.setStyleSheet('#frame {border: 1px solid red; }')
@@ -352,25 +573,113 @@ class CameraFrame(QFrame):
             self.plot.setTitle(' ')
             return
         pos = event.pos()
-        i, j = pos.x(), pos.y()
-        i = int(np.clip(i, 0, self.plot_data.shape[0] - 1))
-        j = int(np.clip(j, 0, self.plot_data.shape[1] - 1))
-        val = self.plot_data[i, j]
+        i, j = self.frame_pixel(pos)
+        val = self.plot_data[j, i]
         ppos = self.img.mapToParent(pos)
         x, y = ppos.x(), ppos.y()
         self.plot.setTitle("pos: (%0.1f, %0.1f)<br>pixel: (%d, %d)  value: %.3g" % (x, y, i, j, val))
         
+    def frame_pixel(self, pos):
+        """Column and row of the full resolution frame under pos, given in image item coordinates."""
+        factor = self.applied_display_factor
+        # the displayed image is flipped vertically and may be cropped to a multiple of the display factor
+        displayed_height = self.img.image.shape[0]*factor
+        # floored before the flip, truncating after it is a row off for fractional positions
+        i = int(np.clip(np.floor(pos.x()*factor), 0, self.plot_data.shape[1] - 1))
+        j = int(np.clip(displayed_height - 1 - np.floor(pos.y()*factor), 0, self.plot_data.shape[0] - 1))
+        return i, j
+
+    def frame_edge(self, pos):
+        """Column and row boundary of the full resolution frame at pos, for the edges of regions."""
+        factor = self.applied_display_factor
+        displayed_height = self.img.image.shape[0]*factor
+        i = int(np.clip(np.floor(pos.x()*factor), 0, self.plot_data.shape[1]))
+        j = int(np.clip(displayed_height - np.floor(pos.y()*factor), 0, self.plot_data.shape[0]))
+        return i, j
+        
+    def add_analysis_roi(self, name='', pos=None, size=None):
+        """Add a rectangular analysis region, in the middle of the view unless pos and size are given in view coordinates."""
+        self.roi_count += 1
+        if name == '':
+            name = f'ROI {self.roi_count}'
+        if pos is None or size is None:
+            if self.img.image is not None:
+                (x0, x1), (y0, y1) = self.plot.getViewBox().viewRange()
+            else:
+                # nothing shown yet, so the view doesn't know the frame size
+                scale = self.calibration if self.use_calibration else 1
+                x0, y0 = self.x_offset, self.y_offset
+                x1 = x0 + self.cam.width*scale
+                y1 = y0 + self.cam.height*scale
+            size = ((x1 - x0)/4, (y1 - y0)/4)
+            pos = (x0 + 1.5*size[0], y0 + 1.5*size[1])
+        color = pg.intColor(self.roi_count - 1, hues=8)
+        item = pg.RectROI(pos, size, pen=pg.mkPen(color, width=2), removable=True)
+        item.roi_name = name
+        label = pg.TextItem(name, color=color, anchor=(0, 0))
+        label.setParentItem(item)
+        item.sigRegionChangeFinished.connect(self.analysis_rois_changed)
+        item.sigRemoveRequested.connect(self.remove_analysis_roi)
+        self.plot.addItem(item)
+        self.roi_items.append(item)
+        self.analysis_rois_changed()
+
+    def remove_analysis_roi(self, item):
+        self.roi_items.remove(item)
+        self.plot.removeItem(item)
+        self.analysis_rois_changed()
+
+    def clear_analysis_rois(self):
+        for item in list(self.roi_items):
+            self.remove_analysis_roi(item)
+
+    def analysis_rois_changed(self, *args):
+        # the frame pixels under a region are only known once a frame is shown
+        self.rois_stale = True
+        if self.img.image is not None:
+            self.update_analysis_rois()
+
+    def update_analysis_rois(self):
+        """Work out the frame pixels under each region for the processor."""
+        if self.img.image is None:
+            return
+        rois = []
+        for item in self.roi_items:
+            pos = item.pos()
+            size = item.size()
+            # the rectangle's sides are pixel boundaries, pos + size is the exclusive far edge
+            corners = [self.frame_edge(self.img.mapFromView(pg.Point(pos.x() + dx, pos.y() + dy)))
+                       for dx, dy in ((0, 0), (size.x(), size.y()))]
+            (i0, j0), (i1, j1) = corners
+            rois.append(AnalysisRoi(item.roi_name, min(i0, i1), min(j0, j1), abs(i1 - i0), abs(j1 - j0)))
+        # replaced in one go, the processor may be reading the old list
+        self.analysis_rois = rois
+        self.rois_stale = False
+        self.roi_label.setVisible(len(rois) > 0)
+        if len(rois) == 0:
+            self.roi_label.setText('')
+
+    def show_roi_stats(self, roi_stats):
+        if self.use_calibration:
+            scale = self.calibration/1000
+            unit = 'mm'
+        else:
+            scale = 1
+            unit = 'px'
+        self.roi_label.setText(f'ROI counts at centroid ({unit}): ' + '   '.join(
+            f'{stats.name}: {stats.total_counts:.4g} at {stats.centroid_x*scale:.1f}, {stats.centroid_y*scale:.1f}'
+            for stats in roi_stats))
+
     def imageClickEvent(self, event):
         if self.master.adding_crosshair and event.button() == Qt.MouseButton.LeftButton:
             pos = event.pos()
-            i, j = pos.x(), pos.y()
-            i = int(np.clip(i, 0, self.plot_data.shape[0] - 1))
-            j = int(np.clip(j, 0, self.plot_data.shape[1] - 1))
             ppos = self.img.mapToParent(pos)
-            x, y = ppos.x(), ppos.y()
-            crosshair = Crosshair((x, y), movable=False, frame=self, pen='white')
-            self.crosshairs.append(crosshair)          
-            self.plot.addItem(crosshair)
+            self.add_crosshair(ppos.x(), ppos.y())
+
+    def add_crosshair(self, x, y):
+        crosshair = Crosshair((x, y), movable=self.master.moving_crosshair, frame=self, pen='white')
+        self.crosshairs.append(crosshair)
+        self.plot.addItem(crosshair)
             
     def remove_crosshair(self, crosshair):
         self.crosshairs.remove(crosshair)
@@ -384,6 +693,60 @@ class CameraFrame(QFrame):
         for crosshair in self.crosshairs:
             crosshair.highlight = highlight
 
+class StripChartCurve:
+    chunk_size = 500
+
+    def __init__(self, plot, pen, name):
+        """Curve of a strip chart that is appended to instead of redrawn.
+
+        Points go into fixed-size chunks, each its own curve item, so a new point only
+        rebuilds the path of the last chunk. Chunks that scroll out of the window are removed.
+        """
+        self.plot = plot
+        self.pen = pen
+        # the chunks come and go, the legend entry stays
+        self.legend_item = plot.plot(pen=pen, name=name)
+        self.chunks = []
+
+    def clear(self):
+        for item, _, _, _ in self.chunks:
+            self.plot.removeItem(item)
+        self.chunks = []
+
+    def append(self, times, values):
+        i = 0
+        while i < len(times):
+            if len(self.chunks) == 0 or self.chunks[-1][3] == self.chunk_size:
+                self.add_chunk()
+            item, chunk_times, chunk_values, count = self.chunks[-1]
+            n = min(len(times) - i, self.chunk_size - count)
+            chunk_times[count:count + n] = times[i:i + n]
+            chunk_values[count:count + n] = values[i:i + n]
+            count += n
+            i += n
+            self.chunks[-1][3] = count
+            item.setData(chunk_times[:count], chunk_values[:count], connect='finite')
+
+    def add_chunk(self):
+        item = self.plot.plot(pen=self.pen)
+        chunk_times = np.empty(self.chunk_size)
+        chunk_values = np.empty(self.chunk_size)
+        count = 0
+        if len(self.chunks) > 0:
+            # starts at the last point of the previous chunk, so the line is continuous
+            _, previous_times, previous_values, _ = self.chunks[-1]
+            chunk_times[0] = previous_times[-1]
+            chunk_values[0] = previous_values[-1]
+            count = 1
+        self.chunks.append([item, chunk_times, chunk_values, count])
+
+    def scroll(self, latest, oldest):
+        """Show the chunks relative to latest and drop those entirely before oldest."""
+        while len(self.chunks) > 1 and self.chunks[0][1][self.chunks[0][3] - 1] < oldest:
+            self.plot.removeItem(self.chunks.pop(0)[0])
+        for item, _, _, _ in self.chunks:
+            item.setPos(-latest, 0)
+
 class Crosshair(pg.TargetItem):
     def __init__(self, *args, **kwargs):
         self.frame = kwargs.pop('frame')
@@ -402,3 +765,14 @@ class Crosshair(pg.TargetItem):
             self.setMouseHover(True)
         else:
             self.setMouseHover(False)
+
+class CameraPlaceholder(QFrame):
+    def __init__(self, master, name):
+        """Grid tile standing in for a camera while it is opened in the background."""
+        super().__init__(master)
+        layout = QVBoxLayout()
+        label = QLabel(text=f'{name}: connecting…', parent=self)
+        label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        layout.addWidget(label)
+        self.setLayout(layout)
+        self.setMinimumHeight(400)
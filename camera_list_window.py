@@ -4,26 +4,26 @@ from PyQt5.QtGui import QStandardItem, QStandardItemModel, QFont
 from PyQt5.QtCore import Qt
 
 class CameraListWindow(QMainWindow):
+    serial_role = Qt.UserRole
+    
     def __init__(self, root, app):
         super().__init__()
-        self.setMinimumSize(200, 200)
+        self.setMinimumSize(300, 200)
         self.setWindowTitle('Camera list')
         self.app = app
         self.root = root
            
         self.camera_list = QTreeView(self)
         self.camera_list_model = BoldItemModel()
-        self.camera_list_model.setHorizontalHeaderLabels(('Name', 'Model'))
+        self.camera_list_model.setHorizontalHeaderLabels(('Name', 'Model', 'Status'))
         self.camera_list.setModel(self.camera_list_model)
         self.camera_list.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
         self.camera_list.setUniformRowHeights(True)
+        # name item of each row, keyed by serial number, so rows can be found while others come and go
+        self.rows = {}
         
-        for device in self.root.devices:
-            name = QStandardItem(device.GetUserDefinedName())
-            model = QStandardItem(device.GetModelName())
-            name.setEditable(False)
-            model.setEditable(False)
-            self.camera_list_model.appendRow((name, model))
+        for device in self.root.devices.values():
+            self.add_device(device)
             
         self.camera_list.doubleClicked.connect(self.add_camera)
         # layout.addChildWidget(self.camera_list)
@@ -32,51 +32,62 @@ class CameraListWindow(QMainWindow):
         
         self.setCentralWidget(self.camera_list)
             
+    def add_device(self, device):
+        serial_number = device.GetSerialNumber()
+        items = [QStandardItem(text) for text in (device.GetUserDefinedName(), device.GetModelName(), '')]
+        for item in items:
+            item.setEditable(False)
+        items[0].setData(serial_number, self.serial_role)
+        self.camera_list_model.appendRow(items)
+        self.rows[serial_number] = items[0]
+        self.update_device(serial_number)
+
+    def remove_device(self, serial_number):
+        item = self.rows.pop(serial_number, None)
+        if item is not None:
+            self.camera_list_model.removeRow(item.row())
+
+    def update_device(self, serial_number):
+        """Show whether the camera is open in bold and its status."""
+        item = self.rows.get(serial_number)
+        if item is None:
+            return
+        row = item.row()
+        if serial_number in self.root.opened_cameras or serial_number in self.root.pending_cameras:
+            self.camera_list_model.boldRow(row)
+        else:
+            self.camera_list_model.unboldRow(row)
+        self.camera_list_model.item(row, 2).setText(self.root.device_status(serial_number))
+            
     def closeEvent(self, event):
         self.hide()
         event.ignore()
      
     def add_camera(self, *args):
-        index = self.camera_list.currentIndex().row()
-        self.camera_list_model.boldRow(index)
-        self.root.add_camera(index)
-        
-    def remove_camera(self, cam):
-        self.camera_list_model.unboldRow(self.find_camera_index(cam))
-
-    def find_camera_index(self, cam):
-        for i, bascam in enumerate(self.root.devices):
-            if cam.serial_number == bascam.GetSerialNumber():
-                return i
-        raise ValueError('Camera not found')
+        row = self.camera_list.currentIndex().row()
+        self.root.add_camera(self.camera_list_model.item(row, 0).data(self.serial_role))
         
 class BoldItemModel(QStandardItemModel):
-    def __init__(self):
-        self._bold_rows = []
-        super().__init__()
+    bold_role = Qt.UserRole + 1
     
-    def appendRow(self, args):
-        self._bold_rows.append(False)
-        super().appendRow(args)
-        
     def emitRowChanged(self, row):
-        for col in (0, 1):
+        for col in range(self.columnCount()):
             index = self.index(row, col)
             self.dataChanged.emit(index, index)
     
+    # the bold state is kept on the row's first item, so it moves with the row when others are inserted or removed
     def boldRow(self, row):
-        self._bold_rows[row] = True
+        self.item(row, 0).setData(True, self.bold_role)
         self.emitRowChanged(row)
     
     def unboldRow(self, row):
-        self._bold_rows[row] = False
+        self.item(row, 0).setData(False, self.bold_role)
         self.emitRowChanged(row)
     
     def data(self, index, role):
         if role == Qt.FontRole:
-            if self._bold_rows[index.row()]:
+            if self.item(index.row(), 0).data(self.bold_role):
                 boldFont = QFont()
                 boldFont.setBold(True)
                 return boldFont
         return super().data(index, role)
-            
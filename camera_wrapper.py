@@ -5,6 +5,20 @@ Abstract camera wrapper class
 '''
 
 from abc import ABC, abstractmethod
+from collections import namedtuple
+from enum import Enum, auto
+import threading
+
+class TriggerMode(Enum):
+    FREERUN = auto()
+    SOFTWARE = auto()
+    HARDWARE = auto()
+
+# cumulative stream counters since the camera started grabbing
+GrabStatistics = namedtuple('GrabStatistics', ['delivered_frames', 'failed_frames', 'resent_packets',
+                                               'buffer_underruns'])
+
+_missing = object()
 
 class Camera(ABC):
     
@@ -14,9 +28,59 @@ class Camera(ABC):
     Parameters:
     address: Camera IP address
     '''
+    # parameters kept in the parameter cache, re-read together by refresh()
+    cached_parameters = ()
+    # parameters whose value can change when the keyed parameter is written
+    parameter_dependents = {}
+    
     @abstractmethod
     def __init__(self, serial_number):
         self.serial_number = serial_number
+        self._parameter_cache = {}
+        self._cache_lock = threading.RLock()
+    
+    def cached(self, name, read):
+        '''
+        Cached value of parameter name, calling read() to get it from the device on a miss
+        '''
+        # hits skip the lock, dict lookups are atomic
+        value = self._parameter_cache.get(name, _missing)
+        if value is not _missing:
+            return value
+        with self._cache_lock:
+            if name not in self._parameter_cache:
+                self._parameter_cache[name] = read()
+            return self._parameter_cache[name]
+    
+    def write_through(self, name, write, read):
+        '''
+        Write a parameter to the device with write() and cache the value read() reports back
+        '''
+        with self._cache_lock:
+            self._parameter_cache.pop(name, None)
+            write()
+            self._parameter_cache[name] = read()
+            for dependent in self.parameter_dependents.get(name, ()):
+                self._parameter_cache.pop(dependent, None)
+    
+    def invalidate(self, *names):
+        '''
+        Drop the named parameters from the cache, or every parameter if no names are given
+        '''
+        with self._cache_lock:
+            if len(names) == 0:
+                self._parameter_cache.clear()
+            for name in names:
+                self._parameter_cache.pop(name, None)
+    
+    def refresh(self):
+        '''
+        Re-read every cached parameter from the device
+        '''
+        with self._cache_lock:
+            self._parameter_cache.clear()
+            for name in self.cached_parameters:
+                getattr(self, name)
     
     @property
     def pixel_format(self):
@@ -92,6 +156,20 @@ class Camera(ABC):
     def max_height(self):
         pass
     
+    @property
+    def sensor_width(self):
+        '''
+        Widest frame the camera can deliver at its binning, unlike max_width independent of the ROI offset
+        '''
+        return self.max_width
+
+    @property
+    def sensor_height(self):
+        '''
+        Tallest frame the camera can deliver at its binning, unlike max_height independent of the ROI offset
+        '''
+        return self.max_height
+
     @property
     @abstractmethod
     def binning(self):
@@ -102,10 +180,62 @@ class Camera(ABC):
     def trigger_mode(self):
         pass
     
+    @property
+    def interface(self):
+        '''
+        Network interface the camera streams through, None if it doesn't stream over a network
+        '''
+        return None
+    
+    def set_roi(self, min_x, min_y, max_x, max_y):
+        '''
+        Set the ROI to columns min_x to max_x and rows min_y to max_y, limited to the sensor and at least 4 px
+        '''
+        min_x = min(max(min_x, 0), self.max_width - 4)
+        min_y = min(max(min_y, 0), self.max_height - 4)
+        max_x = min(max(max_x, min_x + 4), self.max_width)
+        max_y = min(max(max_y, min_y + 4), self.max_height)
+        # shrink before moving, so the ROI stays on the sensor at every step
+        if min_x > self.offset_x:
+            self.width = max_x - min_x
+            self.offset_x = min_x
+        else:
+            self.offset_x = min_x
+            self.width = max_x - min_x
+        if min_y > self.offset_y:
+            self.height = max_y - min_y
+            self.offset_y = min_y
+        else:
+            self.offset_y = min_y
+            self.height = max_y - min_y
+
+    @property
+    def bytes_per_frame(self):
+        return self.width*self.height*(1 if self.pixel_format == 'Mono8' else 2)
+    
+    @property
+    def target_frame_rate(self):
+        '''
+        Frame rate the camera runs at with its current settings, in Hz
+        '''
+        return None
+    
+    def grab_statistics(self):
+        '''
+        Current GrabStatistics of the stream, None if the camera doesn't keep any
+        '''
+        return None
+    
     @abstractmethod
     def start_grabbing(self):
         pass
     
+    def start_burst_grabbing(self, buffer_count):
+        '''
+        Start grabbing every frame in order, queueing up to buffer_count frames
+        '''
+        self.start_grabbing()
+    
     @abstractmethod
     def return_frame(self):
         pass
@@ -0,0 +1,76 @@
+'''
+Periodic camera discovery
+
+Each scan enumerates the devices on a worker thread and compares the result
+with the previous scan by serial number, so the camera list only has to
+insert the rows of new devices and remove those of devices that went away.
+
+Whether a device is held by another application takes a round trip to the
+device, so a scan only checks new devices and a fixed number of the others in
+turn. However many devices are on the network, a scan costs one enumeration
+and a bounded number of accessibility checks.
+'''
+
+from collections import namedtuple, OrderedDict
+
+# added: device infos found for the first time, removed: serial numbers no longer found,
+# accessible: serial number -> whether the device can be opened, for the devices checked in the scan
+DiscoveryResult = namedtuple('DiscoveryResult', ['added', 'removed', 'accessible'])
+
+class DeviceDiscovery:
+    def __init__(self, enumerate_devices, is_accessible=None, checks_per_scan=16):
+        """Tracks the devices found by repeated scans.
+
+        Args:
+            enumerate_devices (callable): returns the device infos currently on the network
+            is_accessible (callable): takes a device info and returns whether it can be opened,
+                None to skip accessibility checks
+            checks_per_scan (int): accessibility checks of already known devices per scan
+        """
+        self.enumerate_devices = enumerate_devices
+        self.is_accessible = is_accessible
+        self.checks_per_scan = checks_per_scan
+        self.devices = {}
+        # serial numbers in the order they are checked, each once however often the device comes and goes
+        self.check_queue = OrderedDict()
+
+    def scan(self, skip=()):
+        """Enumerate the devices and compare them with the previous scan. Only one scan may run at a time.
+
+        Args:
+            skip (collection): serial numbers whose accessibility isn't checked, e.g. cameras opened by Beamview
+
+        Returns:
+            DiscoveryResult
+        """
+        found = {device.GetSerialNumber(): device for device in self.enumerate_devices()}
+        added = [device for serial_number, device in found.items() if serial_number not in self.devices]
+        removed = [serial_number for serial_number in self.devices if serial_number not in found]
+        self.devices = found
+        accessible = {}
+        if self.is_accessible is not None:
+            for device in added:
+                if device.GetSerialNumber() not in skip:
+                    accessible[device.GetSerialNumber()] = self.check(device)
+            for serial_number in removed:
+                self.check_queue.pop(serial_number, None)
+            for device in added:
+                self.check_queue.setdefault(device.GetSerialNumber())
+            checks = 0
+            for _ in range(len(self.check_queue)):
+                if checks == self.checks_per_scan:
+                    break
+                serial_number = next(iter(self.check_queue))
+                self.check_queue.move_to_end(serial_number)
+                if serial_number in accessible or serial_number in skip:
+                    continue
+                accessible[serial_number] = self.check(found[serial_number])
+                checks += 1
+        return DiscoveryResult(added, removed, accessible)
+
+    def check(self, device):
+        try:
+            return self.is_accessible(device)
+        except Exception as e:
+            print(f'{device.GetSerialNumber()}: could not check accessibility: {e}')
+            return True
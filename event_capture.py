@@ -0,0 +1,157 @@
+'''
+Event-triggered capture with a pre-trigger ring buffer
+
+The last frames of a camera are kept in a preallocated ring together with
+their metadata. Rules evaluated on the beam statistics of each frame can fire
+an event, and once the post-event frames are in, the window around the event
+is copied out of the ring to be saved.
+'''
+
+from collections import namedtuple
+import threading
+
+import numpy as np
+
+from hdf5_archive import metadata_dtype, fill_metadata
+
+EventStats = namedtuple('EventStats', ['total_counts', 'saturated_pixels', 'moments'])
+
+EventWindow = namedtuple('EventWindow', ['rule', 'frames', 'metadata', 'trigger_index'])
+
+class CentroidJumpRule:
+    name = 'centroid_jump'
+
+    def __init__(self, threshold):
+        """Fires when the centroid moves more than threshold pixels between frames."""
+        self.threshold = threshold
+        self.previous = None
+
+    def evaluate(self, stats):
+        if stats.moments is None:
+            self.previous = None
+            return False
+        current = (stats.moments.centroid_x, stats.moments.centroid_y)
+        previous = self.previous
+        self.previous = current
+        if previous is None:
+            return False
+        return np.hypot(current[0] - previous[0], current[1] - previous[1]) > self.threshold
+
+class SaturationRule:
+    name = 'saturation'
+
+    def __init__(self, threshold):
+        """Fires when more than threshold pixels are saturated."""
+        self.threshold = threshold
+
+    def evaluate(self, stats):
+        return stats.saturated_pixels > self.threshold
+
+class CountsDropoutRule:
+    name = 'counts_dropout'
+    smoothing = 0.1
+
+    def __init__(self, fraction):
+        """Fires when the total counts fall below fraction of their running average."""
+        self.fraction = fraction
+        self.average = None
+
+    def evaluate(self, stats):
+        total_counts = float(stats.total_counts)
+        if self.average is None:
+            self.average = total_counts
+            return False
+        fired = total_counts < self.fraction*self.average
+        # dropouts are kept out of the average, so a long dropout keeps firing
+        if not fired:
+            self.average += self.smoothing*(total_counts - self.average)
+        return fired
+
+def threshold_rules(centroid_jump=None, saturated_pixels=None, counts_dropout=None):
+    """The rules whose threshold is not None.
+
+    Args:
+        centroid_jump (float): centroid movement between frames in px
+        saturated_pixels (int): number of saturated pixels
+        counts_dropout (float): total counts as percent of their running average
+    """
+    rules = []
+    if centroid_jump is not None:
+        rules.append(CentroidJumpRule(centroid_jump))
+    if saturated_pixels is not None:
+        rules.append(SaturationRule(saturated_pixels))
+    if counts_dropout is not None:
+        rules.append(CountsDropoutRule(counts_dropout/100))
+    return rules
+
+class EventCapture:
+    def __init__(self, pre_frames=10, post_frames=10, rules=()):
+        """Rolling frame buffer that saves a window of frames around rule-triggered events.
+
+        Args:
+            pre_frames (int): frames kept from before the triggering frame
+            post_frames (int): frames recorded after the triggering frame
+            rules (iterable): objects with a name and an evaluate(EventStats) method
+        """
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.event_count = 0
+        self.configure(pre_frames, post_frames, rules)
+
+    def configure(self, pre_frames, post_frames, rules):
+        with self.lock:
+            self.pre_frames = pre_frames
+            self.post_frames = post_frames
+            self.rules = list(rules)
+            self.frames = None
+            self.metadata = np.zeros(self.capacity, dtype=metadata_dtype)
+            self.reset()
+
+    @property
+    def capacity(self):
+        return self.pre_frames + 1 + self.post_frames
+
+    def reset(self):
+        self.head = 0
+        self.count = 0
+        self.remaining = None
+        self.fired_rule = None
+
+    def add(self, frame, sequence, timestamp, cam, stats):
+        """Record a frame and evaluate the rules on its statistics.
+
+        Returns:
+            EventWindow: copy of the frames around an event once its last post-event
+            frame was added, otherwise None
+        """
+        with self.lock:
+            if self.frames is None or self.frames.shape[1:] != frame.shape or self.frames.dtype != frame.dtype:
+                self.frames = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+                self.reset()
+            slot = self.head
+            np.copyto(self.frames[slot], frame)
+            fill_metadata(self.metadata[slot], timestamp, sequence, cam, stats.moments, stats.total_counts)
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+            # rules see every frame, so their running state stays current during a capture
+            fired = [rule for rule in self.rules if rule.evaluate(stats)]
+            if self.remaining is None:
+                if len(fired) == 0:
+                    return None
+                self.fired_rule = fired[0].name
+                self.remaining = self.post_frames
+            else:
+                self.remaining -= 1
+            if self.remaining > 0:
+                return None
+            return self.dump()
+
+    def dump(self):
+        order = (self.head - self.count + np.arange(self.count)) % self.capacity
+        window = EventWindow(self.fired_rule, self.frames[order], self.metadata[order],
+                             self.count - 1 - self.post_frames)
+        self.event_count += 1
+        self.remaining = None
+        self.fired_rule = None
+        return window
@@ -0,0 +1,82 @@
+'''
+N-frame averaging for weak beams
+
+Keeps the sum of the last N frames in an int64 accumulator and the frames
+themselves in a preallocated ring. Each new frame is added to the sum and the
+frame it replaces in the ring is subtracted, so a frame costs one add and one
+subtract however many frames are averaged. The total counts of the average
+are kept the same way from the per-frame totals.
+'''
+
+import threading
+
+import numpy as np
+
+from processing import BufferPool
+
+class FrameAverager:
+    def __init__(self, n_frames=1, pool_size=4):
+        """Running average of the last n_frames frames of one camera.
+
+        Args:
+            n_frames (int): number of frames averaged, 1 turns averaging off
+            pool_size (int): number of averaged frame buffers kept for reuse
+        """
+        self.n_frames = n_frames
+        self.buffers = BufferPool(pool_size)
+        self.lock = threading.Lock()
+        self.ring = None
+        self.totals = None
+        self.accumulator = None
+        self.total = 0
+        self.count = 0
+        self.index = 0
+
+    @property
+    def enabled(self):
+        return self.n_frames > 1
+
+    def set_frames(self, n_frames):
+        with self.lock:
+            self.n_frames = max(1, n_frames)
+            self.ring = None
+
+    def reset(self):
+        with self.lock:
+            self.ring = None
+
+    def add(self, frame, total_counts):
+        """Add a frame to the average.
+
+        Args:
+            frame (ndarray): integer frame, copied into the ring
+            total_counts (int): total counts of frame
+
+        Returns:
+            (ndarray, float): float32 average of the frames so far, up to n_frames,
+                and its total counts
+        """
+        with self.lock:
+            if self.ring is None or self.ring.shape[1:] != frame.shape or self.ring.dtype != frame.dtype \
+                    or len(self.ring) != self.n_frames:
+                # ROI, binning, background subtraction or N changed, start over
+                self.ring = np.empty((self.n_frames,) + frame.shape, dtype=frame.dtype)
+                self.totals = np.zeros(self.n_frames, dtype=np.int64)
+                self.accumulator = np.zeros(frame.shape, dtype=np.int64)
+                self.total = 0
+                self.count = 0
+                self.index = 0
+            slot = self.ring[self.index]
+            if self.count == self.n_frames:
+                self.accumulator -= slot
+                self.total -= self.totals[self.index]
+            else:
+                self.count += 1
+            self.accumulator += frame
+            self.total += int(total_counts)
+            slot[...] = frame
+            self.totals[self.index] = total_counts
+            self.index = (self.index + 1) % self.n_frames
+            average = self.buffers.get(frame.shape, np.float32)
+            np.multiply(self.accumulator, 1/self.count, out=average, casting='unsafe')
+            return average, self.total/self.count
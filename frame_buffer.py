@@ -0,0 +1,78 @@
+'''
+Preallocated ring of frame buffers
+
+Grabbed images are copied once into a free slot of the ring. Consumers receive
+read-only views of the slot together with a sequence number, and own the slot
+until they release it.
+'''
+
+from collections import namedtuple
+import threading
+import time
+
+import numpy as np
+
+Frame = namedtuple('Frame', ['data', 'sequence', 'timestamp', 'slot'])
+
+class FrameRingBuffer:
+    def __init__(self, slots=6):
+        """Ring of preallocated frame buffers.
+
+        Args:
+            slots (int): number of buffers. Each consumer stage that can hold on to a
+                frame (pending, processing, waiting for display, displayed) needs one.
+        """
+        self.slots = slots
+        self.lock = threading.Lock()
+        self.buffers = []
+        self.shape = None
+        self.dtype = None
+        self.sequence = 0
+        self.overruns = 0
+        self._busy = [False]*slots
+        self._next = 0
+
+    def allocate(self, shape, dtype):
+        # buffers still held by consumers stay alive through their views
+        self.buffers = [np.empty(shape, dtype=dtype) for _ in range(self.slots)]
+        self._busy = [False]*self.slots
+        self._next = 0
+        self.shape = shape
+        self.dtype = dtype
+
+    def write(self, array, timestamp=None):
+        """Copy array into the next free slot.
+
+        Returns:
+            Frame: read-only view of the slot, or None if every slot is held by a consumer
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            if array.shape != self.shape or array.dtype != self.dtype:
+                self.allocate(array.shape, array.dtype)
+            for i in range(self.slots):
+                slot = (self._next + i) % self.slots
+                if not self._busy[slot]:
+                    break
+            else:
+                self.overruns += 1
+                return None
+            self._busy[slot] = True
+            self._next = (slot + 1) % self.slots
+            self.sequence += 1
+            sequence = self.sequence
+            buffer = self.buffers[slot]
+        np.copyto(buffer, array)
+        view = buffer.view()
+        view.flags.writeable = False
+        return Frame(view, sequence, timestamp, (buffer, slot))
+
+    def release(self, frame):
+        if frame is None:
+            return
+        buffer, slot = frame.slot
+        with self.lock:
+            # frames from before a reallocation no longer own a slot
+            if slot < len(self.buffers) and self.buffers[slot] is buffer:
+                self._busy[slot] = False
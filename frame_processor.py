@@ -0,0 +1,122 @@
+'''
+Per-camera frame processing worker
+
+Frames handed over by the image grabber are processed on a background
+thread. Only the most recent frame is kept: if a new frame arrives before the
+previous one was picked up, the old one is dropped and counted.
+
+Frames are ring buffer slots owned by whoever holds them. The processor
+releases frames it drops, and a ProcessedFrame keeps its slot until the
+consumer that took it calls release.
+
+The processing itself is the camera frame's pipeline, see pipeline.py.
+'''
+
+from collections import namedtuple
+import threading
+import time
+
+from pipeline import FrameState, default_pipeline
+
+ProcessedFrame = namedtuple('ProcessedFrame', ['frame', 'display_data', 'raw_data', 'frame_time', 'total_counts',
+                                               'saturated_pixels', 'moments', 'dropped_frames', 'display_image',
+                                               'display_factor', 'roi_stats'])
+
+class FrameProcessor:
+    def __init__(self, camera_frame, ring_buffer, callback=None):
+        """Processes frames for a single CameraFrame.
+
+        Args:
+            camera_frame (CameraFrame): frame whose processing settings are used
+            ring_buffer (FrameRingBuffer): buffer that submitted frames belong to
+            callback (callable): called without arguments from the worker thread
+                when a new result is ready to be taken with take_result. Without a
+                callback, consumers poll has_result
+        """
+        self.camera_frame = camera_frame
+        self.ring_buffer = ring_buffer
+        self.callback = callback
+        self.pipeline = default_pipeline(camera_frame)
+        self.condition = threading.Condition()
+        self._pending_frame = None
+        self._result = None
+        self._result_pending = False
+        self._running = True
+        self.dropped_frames = 0
+        self.prev_frame_timestamp = time.time()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, frame):
+        with self.condition:
+            dropped = self._pending_frame
+            if dropped is not None:
+                self.dropped_frames += 1
+            self._pending_frame = frame
+            self.condition.notify()
+        self.ring_buffer.release(dropped)
+
+    def count_dropped(self):
+        with self.condition:
+            self.dropped_frames += 1
+
+    def release(self, result):
+        if result is not None:
+            self.ring_buffer.release(result.frame)
+            self.pipeline.release(result.display_data)
+
+    def has_result(self):
+        return self._result_pending
+
+    def take_result(self):
+        with self.condition:
+            result = self._result
+            self._result = None
+            self._result_pending = False
+        return result
+
+    def stop(self):
+        with self.condition:
+            self._running = False
+            self.condition.notify()
+        self.thread.join()
+        with self.condition:
+            self.ring_buffer.release(self._pending_frame)
+            self._pending_frame = None
+        self.release(self.take_result())
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self._running and self._pending_frame is None:
+                    self.condition.wait()
+                if not self._running:
+                    return
+                frame = self._pending_frame
+                self._pending_frame = None
+            try:
+                result = self.process(frame)
+            except Exception as e:
+                print(e)
+                self.ring_buffer.release(frame)
+                continue
+            with self.condition:
+                stale_result = self._result
+                self._result = result
+                notify = not self._result_pending
+                self._result_pending = True
+            self.release(stale_result)
+            # the GUI always takes the latest result, so it only needs one notification per take
+            if notify and self.callback is not None:
+                self.callback()
+
+    def process(self, frame):
+        camera_frame = self.camera_frame
+        frame_time = time.time() - self.prev_frame_timestamp
+        self.prev_frame_timestamp = time.time()
+
+        state = FrameState(camera_frame, frame)
+        self.pipeline.run(state)
+        return ProcessedFrame(frame, state.plot_data, state.raw_data, frame_time, state.total_counts,
+                              state.saturated_pixels, state.moments, self.dropped_frames, state.display_image,
+                              state.display_factor, state.roi_stats)
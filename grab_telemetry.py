@@ -0,0 +1,116 @@
+'''
+Grab statistics telemetry
+
+Polls the stream counters of every running camera, turns them into rates and
+keeps a short history of them for plotting. A delay controller watches the
+resend and failure rates per network interface and lowers the share of the
+link the bandwidth planner hands out while packets are being lost.
+'''
+
+from collections import namedtuple, deque
+import time
+
+TelemetrySample = namedtuple('TelemetrySample', ['time', 'frame_rate', 'failure_rate', 'resend_rate',
+                                                 'underrun_rate', 'bandwidth', 'statistics'])
+
+class GrabTelemetry:
+    def __init__(self, history=300):
+        """Rate history of the grab statistics of each camera.
+
+        Args:
+            history (int): number of samples kept per camera
+        """
+        self.history_length = history
+        self.history = {}
+        self.last = {}
+
+    def poll(self, cams):
+        """Sample the grab statistics of cams.
+
+        Returns:
+            dict: the new TelemetrySample of each camera that keeps statistics, keyed by serial number
+        """
+        samples = {}
+        now = time.perf_counter()
+        for cam in cams:
+            statistics = cam.grab_statistics()
+            if statistics is None:
+                continue
+            last = self.last.get(cam.serial_number)
+            self.last[cam.serial_number] = (now, statistics)
+            if last is None:
+                continue
+            last_time, last_statistics = last
+            elapsed = now - last_time
+            if elapsed <= 0:
+                continue
+            # the counters restart from zero when grabbing restarts
+            if statistics.delivered_frames < last_statistics.delivered_frames:
+                last_statistics = statistics._make(0 for _ in statistics)
+            delta = [current - previous for current, previous in zip(statistics, last_statistics)]
+            frame_rate = delta[0]/elapsed
+            sample = TelemetrySample(now, frame_rate, delta[1]/elapsed, delta[2]/elapsed, delta[3]/elapsed,
+                                     frame_rate*cam.bytes_per_frame, statistics)
+            self.history.setdefault(cam.serial_number, deque(maxlen=self.history_length)).append(sample)
+            samples[cam.serial_number] = sample
+        return samples
+
+    def forget(self, serial_number):
+        self.history.pop(serial_number, None)
+        self.last.pop(serial_number, None)
+
+class DelayController:
+    def __init__(self, planner, threshold=1, backoff=0.8, recovery=1.05, min_scale=0.2, settle_polls=5):
+        """Closed-loop correction of the bandwidth planner's utilization per interface.
+
+        Args:
+            planner (BandwidthPlanner): planner whose utilization_scale is adjusted
+            threshold (float): resent packets plus failed frames per second that count as trouble
+            backoff (float): factor the scale is multiplied with while there is trouble
+            recovery (float): factor the scale grows by after settle_polls clean polls
+            min_scale (float): lowest scale the controller backs off to
+            settle_polls (int): clean polls in a row before the scale grows again
+        """
+        self.planner = planner
+        self.enabled = False
+        self.threshold = threshold
+        self.backoff = backoff
+        self.recovery = recovery
+        self.min_scale = min_scale
+        self.settle_polls = settle_polls
+        self.clean_polls = {}
+
+    def update(self, cams, samples):
+        """Adjust the utilization scales from one poll of samples.
+
+        Returns:
+            bool: True if a scale changed and the delays need to be planned again
+        """
+        if not self.enabled:
+            return False
+        trouble = {}
+        for cam in cams:
+            sample = samples.get(cam.serial_number)
+            interface = cam.interface
+            if sample is None or interface is None:
+                continue
+            trouble[interface] = trouble.get(interface, 0) + sample.resend_rate + sample.failure_rate
+        changed = False
+        for interface, rate in trouble.items():
+            scale = self.planner.utilization_scale.get(interface, 1)
+            if rate > self.threshold:
+                new_scale = max(self.min_scale, scale*self.backoff)
+                self.clean_polls[interface] = 0
+            else:
+                self.clean_polls[interface] = self.clean_polls.get(interface, 0) + 1
+                if self.clean_polls[interface] < self.settle_polls:
+                    continue
+                new_scale = min(1, scale*self.recovery)
+            if new_scale != scale:
+                self.planner.utilization_scale[interface] = new_scale
+                changed = True
+        return changed
+
+    def reset(self):
+        self.planner.utilization_scale.clear()
+        self.clean_polls = {}
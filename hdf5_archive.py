@@ -0,0 +1,141 @@
+'''
+HDF5 shot archive
+
+Frames are appended to chunked, optionally compressed datasets with a
+parallel metadata table, one file per camera and archive session. Frames with
+a different ROI or binning go into their own group in the same file.
+'''
+
+import datetime
+import os
+import threading
+import time
+
+import numpy as np
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+compression_options = {'None': None, 'gzip': 'gzip', 'lzf': 'lzf'}
+
+metadata_dtype = np.dtype([('timestamp', 'f8'), ('shot_number', 'i8'), ('exposure', 'f8'), ('gain', 'f8'),
+                           ('offset_x', 'i4'), ('offset_y', 'i4'), ('binning', 'i4'), ('total_counts', 'f8'),
+                           ('centroid_x', 'f8'), ('centroid_y', 'f8'), ('sigma_x', 'f8'), ('sigma_y', 'f8')])
+
+# one row per analysis region and archived frame
+roi_stats_dtype = np.dtype([('shot_number', 'i8'), ('name', 'S32'), ('x', 'i4'), ('y', 'i4'), ('width', 'i4'),
+                            ('height', 'i4'), ('total_counts', 'f8'), ('centroid_x', 'f8'), ('centroid_y', 'f8')])
+
+def roi_stats_records(shot_number, roi_stats):
+    """Rows of roi_stats_dtype for the RoiStats of one frame."""
+    records = np.zeros(len(roi_stats), dtype=roi_stats_dtype)
+    for record, stats in zip(records, roi_stats):
+        record['shot_number'] = shot_number
+        record['name'] = stats.name.encode()[:32]
+        for field in roi_stats_dtype.names[2:]:
+            record[field] = getattr(stats, field)
+    return records
+
+def metadata_record(timestamp, shot_number, cam, moments, total_counts):
+    """Build a metadata row for one frame. Statistics are nan when moments is None."""
+    record = np.zeros((), dtype=metadata_dtype)
+    fill_metadata(record, timestamp, shot_number, cam, moments, total_counts)
+    return record
+
+def fill_metadata(record, timestamp, shot_number, cam, moments, total_counts):
+    """Write the metadata of one frame into an existing row of metadata_dtype."""
+    record['timestamp'] = timestamp
+    record['shot_number'] = shot_number
+    record['exposure'] = cam.exposure
+    record['gain'] = cam.gain
+    record['offset_x'] = cam.offset_x
+    record['offset_y'] = cam.offset_y
+    record['binning'] = cam.binning
+    record['total_counts'] = total_counts
+    for field in ('centroid_x', 'centroid_y', 'sigma_x', 'sigma_y'):
+        record[field] = np.nan if moments is None else getattr(moments, field)
+
+def stack_filename(settings, name, tag):
+    """Archive filename for a stack of frames, HDF5 if that is the archive format and npz otherwise.
+
+    Args:
+        settings: object with the archive settings (archive_dir, archive_prefix, ...), usually the main window
+        name (str): camera name
+        tag (str): what the stack is, e.g. 'burst'
+    """
+    timestamp = datetime.datetime.now()
+    prefix_string = settings.archive_prefix + '_' if settings.archive_prefix != '' else ''
+    suffix_string = '_' + settings.archive_suffix if settings.archive_suffix != '' else ''
+    file_ext_string = '.h5' if settings.archive_format == 'HDF5' and h5py is not None else '.npz'
+    return os.path.join(settings.archive_dir, f'{prefix_string}{timestamp:%Y%m%d_%H%M%S}_{name}{suffix_string}_{tag}{file_ext_string}')
+
+def save_stack(filename, frames, **datasets):
+    """Write a stack of frames plus extra datasets to filename (.h5 or .npz)."""
+    if filename.endswith('.h5'):
+        if h5py is None:
+            raise RuntimeError('h5py is required for HDF5 archives')
+        with h5py.File(filename, 'w') as h5file:
+            h5file.create_dataset('frames', data=frames, chunks=(1,) + frames.shape[1:],
+                                  compression='gzip', shuffle=True)
+            for name, data in datasets.items():
+                h5file.create_dataset(name, data=data)
+    else:
+        np.savez(filename, frames=frames, **datasets)
+
+class HDF5Archive:
+    flush_interval = 1
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = {}
+        self.last_flush = {}
+
+    def append(self, filename, frame, record, compression='gzip', roi_records=None):
+        """Append a frame and its metadata record to filename, creating it if needed.
+
+        roi_records are rows of roi_stats_dtype, appended to the group's roi_stats table.
+        """
+        if h5py is None:
+            raise RuntimeError('h5py is required for HDF5 archives')
+        with self.lock:
+            h5file = self.files.get(filename)
+            if h5file is None:
+                h5file = h5py.File(filename, 'a')
+                self.files[filename] = h5file
+                self.last_flush[filename] = time.time()
+            group_name = f'roi_{record["offset_x"]}_{record["offset_y"]}_{frame.shape[1]}x{frame.shape[0]}_bin{record["binning"]}'
+            if group_name in h5file:
+                group = h5file[group_name]
+            else:
+                group = h5file.create_group(group_name)
+                compression = compression_options.get(compression, compression)
+                group.create_dataset('frames', shape=(0,) + frame.shape, maxshape=(None,) + frame.shape,
+                                     dtype=frame.dtype, chunks=(1,) + frame.shape, compression=compression,
+                                     shuffle=compression is not None)
+                group.create_dataset('metadata', shape=(0,), maxshape=(None,), dtype=metadata_dtype, chunks=(256,))
+            frames = group['frames']
+            metadata = group['metadata']
+            n = frames.shape[0]
+            frames.resize(n + 1, axis=0)
+            frames[n] = frame
+            metadata.resize(n + 1, axis=0)
+            metadata[n] = record
+            if roi_records is not None and len(roi_records) > 0:
+                if 'roi_stats' not in group:
+                    group.create_dataset('roi_stats', shape=(0,), maxshape=(None,), dtype=roi_stats_dtype, chunks=(256,))
+                roi_table = group['roi_stats']
+                m = roi_table.shape[0]
+                roi_table.resize(m + len(roi_records), axis=0)
+                roi_table[m:] = roi_records
+            if time.time() - self.last_flush[filename] > self.flush_interval:
+                h5file.flush()
+                self.last_flush[filename] = time.time()
+
+    def close(self):
+        with self.lock:
+            for h5file in self.files.values():
+                h5file.close()
+            self.files = {}
+            self.last_flush = {}
@@ -1,20 +1,47 @@
-from pypylon import pylon
 import time
 
-class ImageGrabber(pylon.ImageEventHandler):
+from frame_buffer import FrameRingBuffer
+
+try:
+    from pypylon import pylon
+    ImageEventHandler = pylon.ImageEventHandler
+except ImportError:
+    # synthetic cameras call OnImageGrabbed directly and don't need pylon
+    ImageEventHandler = object
+
+def frame_id(res):
+    # BlockID numbers frames on the device, but transport layers without it report the maximum value
+    block_id = res.BlockID
+    if block_id == 2**64 - 1:
+        return res.ImageNumber
+    return block_id
+
+class ImageGrabber(ImageEventHandler):
     min_frame_time = 0.2
     def __init__(self, camera_frame):
         super().__init__()
         self.camera_frame = camera_frame
         self.last_frame_timestamp = time.time()
+        self.ring_buffer = FrameRingBuffer()
+        self.burst_recorder = None
 
     def OnImageGrabbed(self, camera, res):
 #        print('hello')
         if res.IsValid():
-            with self.camera_frame.lock:
-                self.camera_frame.plot_data = res.Array
-                self.camera_frame.frame_available = True
-                self.last_frame_timestamp = time.time()
-
-
-
+            self.last_frame_timestamp = time.time()
+            with res.GetArrayZeroCopy() as array:
+                frame = self.ring_buffer.write(array, self.last_frame_timestamp)
+                burst_recorder = self.burst_recorder
+                if burst_recorder is not None:
+                    try:
+                        if burst_recorder.record(array, frame_id(res), self.last_frame_timestamp):
+                            self.burst_recorder = None
+                            self.camera_frame.burst_complete.emit()
+                    except ValueError as e:
+                        # the frames can't go on the stack any more, the burst ends with what it has
+                        self.burst_recorder = None
+                        self.camera_frame.burst_failed.emit(str(e))
+            if frame is None:
+                self.camera_frame.processor.count_dropped()
+            else:
+                self.camera_frame.processor.submit(frame)
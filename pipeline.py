@@ -0,0 +1,357 @@
+'''
+Composable frame processing pipeline
+
+The processing of a frame is a list of stages run in order on a FrameState.
+Each stage reads the fields earlier stages left in the state and replaces the
+ones it changes, and decides from the camera frame's settings whether it runs
+for this frame. Stages time themselves, so the diagnostics window can show
+where the frame budget goes.
+
+Stages that hand out pooled buffers register them with the state. Buffers
+that don't end up in the processed frame go back to their pool when the
+pipeline finishes, the others when the processed frame is released.
+'''
+
+from abc import ABC, abstractmethod
+from collections import namedtuple
+import datetime
+import os
+import time
+
+import numpy as np
+import scipy.ndimage as ndi
+
+from archive_writer import ArchiveItem
+from hdf5_archive import metadata_record, roi_stats_records
+from event_capture import EventStats
+from processing import frame_statistics, decimate
+from roi_stats import IntegralImage, roi_statistics
+
+StageTiming = namedtuple('StageTiming', ['name', 'frames', 'mean', 'p99', 'maximum'])
+
+class StageTimer:
+    def __init__(self, history=1000):
+        """Durations of the last history runs of a stage, in seconds."""
+        self.times = np.zeros(history)
+        self.index = 0
+        self.count = 0
+        self.frames = 0
+
+    def add(self, seconds):
+        self.times[self.index] = seconds
+        self.index = (self.index + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+        self.frames += 1
+
+    def reset(self):
+        self.count = 0
+        self.frames = 0
+
+    def timing(self, name):
+        times = self.times[:self.count]
+        if len(times) == 0:
+            return StageTiming(name, self.frames, np.nan, np.nan, np.nan)
+        return StageTiming(name, self.frames, np.mean(times), np.percentile(times, 99), np.max(times))
+
+class FrameState:
+    def __init__(self, camera_frame, frame):
+        """Data of one frame as it passes through the pipeline.
+
+        plot_data is what is displayed and archived. stats_data is what the
+        beam statistics use, None while that is plot_data. filtered_data is
+        the last unsubtracted frame, whose maximum the histogram gave.
+        """
+        self.camera_frame = camera_frame
+        self.frame = frame
+        self.offset_x = camera_frame.cam.offset_x
+        self.offset_y = camera_frame.cam.offset_y
+        self.raw_data = frame.data
+        self.filtered_data = frame.data
+        self.plot_data = frame.data
+        self.stats_data = None
+        self.maximum = 0
+        self.total_counts = 0
+        self.saturated_pixels = 0
+        self.moments = None
+        # plot_data can have negative pixels once a background is subtracted
+        self.background_subtracted = False
+        self.roi_stats = []
+        self.display_image = None
+        self.display_factor = 1
+        self.buffers = []
+
+class Stage(ABC):
+    name = ''
+
+    def __init__(self, camera_frame):
+        self.camera_frame = camera_frame
+        self.timer = StageTimer()
+
+    def active(self):
+        """Whether the stage runs for the next frame, from the camera frame's settings."""
+        return True
+
+    @abstractmethod
+    def process(self, state):
+        pass
+
+    def release(self, buffer):
+        """Take back buffer if the stage handed it out."""
+        pass
+
+class MedianStage(Stage):
+    name = 'Median filter'
+
+    def active(self):
+        return self.camera_frame.use_median_filter
+
+    def process(self, state):
+        state.plot_data = ndi.median_filter(state.plot_data, size=2)
+        state.filtered_data = state.plot_data
+
+class CountsStage(Stage):
+    name = 'Counts'
+
+    def process(self, state):
+        statistics = frame_statistics(state.plot_data, self.camera_frame.bit_depth)
+        state.total_counts = statistics.total_counts
+        state.saturated_pixels = statistics.saturated_pixels
+        state.maximum = statistics.maximum
+
+class DarkSubtractionStage(Stage):
+    name = 'Dark subtraction'
+
+    def active(self):
+        background = self.camera_frame.background
+        return background.mode != 'Off' or background.capturing
+
+    def process(self, state):
+        # saturation was counted on the unsubtracted frame, the sum of the subtracted frame
+        # follows from the histogram's without another pass
+        cam = self.camera_frame.cam
+        data, dark_total = self.camera_frame.background.apply(state.plot_data, state.offset_x, state.offset_y,
+                                                              cam.binning)
+        if data is not state.plot_data:
+            state.buffers.append(data)
+            state.background_subtracted = True
+        state.plot_data = data
+        state.total_counts -= dark_total
+
+    def release(self, buffer):
+        self.camera_frame.background.buffers.recycle(buffer)
+
+class AveragingStage(Stage):
+    name = 'Averaging'
+
+    def active(self):
+        return self.camera_frame.averager.enabled
+
+    def process(self, state):
+        # the average is displayed, statistics come from it or from the single frame
+        average, average_counts = self.camera_frame.averager.add(state.plot_data, state.total_counts)
+        state.buffers.append(average)
+        if self.camera_frame.stats_on_average:
+            state.total_counts = average_counts
+        else:
+            state.stats_data = state.plot_data
+        state.plot_data = average
+
+    def release(self, buffer):
+        self.camera_frame.averager.buffers.recycle(buffer)
+
+class ThresholdStage(Stage):
+    name = 'Threshold'
+
+    def active(self):
+        return self.camera_frame.use_threshold
+
+    def process(self, state):
+        state.plot_data = self.threshold(state, state.plot_data)
+        if state.stats_data is not None:
+            state.stats_data = self.threshold(state, state.stats_data)
+
+    def threshold(self, state, data):
+        """Zero the pixels below the threshold, in place unless data is the raw frame."""
+        maximum = state.maximum
+        if data is state.raw_data:
+            data = np.copy(data)
+        elif data is not state.filtered_data:
+            maximum = np.max(data)
+        data[data < maximum*self.camera_frame.threshold/100] = 0
+        return data
+
+class StatisticsStage(Stage):
+    name = 'Statistics'
+
+    def process(self, state):
+        camera_frame = self.camera_frame
+        if camera_frame.calculate_stats:
+            data = state.stats_data if state.stats_data is not None else state.plot_data
+            state.moments = camera_frame.moment_engine.compute(data, state.offset_x, state.offset_y,
+                                                               clip_negative=state.background_subtracted)
+        camera_frame.stats_history.append(state.frame.timestamp, state.total_counts, state.saturated_pixels,
+                                          state.moments)
+
+class AnalysisRoiStage(Stage):
+    name = 'Analysis ROIs'
+
+    def __init__(self, camera_frame):
+        super().__init__(camera_frame)
+        self.integral_image = IntegralImage()
+
+    def active(self):
+        return len(self.camera_frame.analysis_rois) > 0
+
+    def process(self, state):
+        data = state.stats_data if state.stats_data is not None else state.plot_data
+        state.roi_stats = roi_statistics(self.integral_image, data, self.camera_frame.analysis_rois,
+                                         state.offset_x, state.offset_y)
+
+class EventCaptureStage(Stage):
+    name = 'Event capture'
+
+    def active(self):
+        return self.camera_frame.event_capture.enabled
+
+    def process(self, state):
+        frame = state.frame
+        window = self.camera_frame.event_capture.add(state.raw_data, frame.sequence, frame.timestamp,
+                                                     self.camera_frame.cam,
+                                                     EventStats(state.total_counts, state.saturated_pixels,
+                                                                state.moments))
+        if window is not None:
+            self.save_event(window)
+
+    def save_event(self, window):
+        # several events can fire within a second, so the name includes the trigger frame's sequence number
+        sequence = window.metadata['shot_number'][window.trigger_index]
+        filename = self.camera_frame.archive_stack_filename(f'event_{window.rule}_{sequence}')
+        print(f'{self.camera_frame.cam.name}: {window.rule} event, saving to {filename}')
+        self.camera_frame.master.archive_writer.submit_stack(
+            ArchiveItem(filename, window.frames, datasets={'metadata': window.metadata,
+                                                           'trigger_index': window.trigger_index,
+                                                           'rule': window.rule}))
+
+class ArchiveStage(Stage):
+    name = 'Archive'
+
+    def active(self):
+        master = self.camera_frame.master
+        return master.archive_mode and time.time() - self.camera_frame.last_archive_time > master.archive_time
+
+    def process(self, state):
+        """Queue the frame on the archive writer.
+
+        HDF5 archives append the raw frame and its metadata to the session file.
+        Low resolution archives are colormapped PNGs of the displayed data,
+        otherwise the raw frame is saved as TIFF.
+        """
+        camera_frame = self.camera_frame
+        master = camera_frame.master
+        frame = state.frame
+        camera_frame.last_archive_time = time.time()
+        timestamp = datetime.datetime.now()
+        try:
+            shot_number_string = f'_{camera_frame.shot_number}' if master.archive_shot_number else ''
+            prefix_string = master.archive_prefix + '_' if master.archive_prefix != '' else ''
+            suffix_string = '_' + master.archive_suffix if master.archive_suffix != '' else ''
+            if master.archive_format == 'HDF5':
+                filename = os.path.join(master.archive_dir, f'{prefix_string}{master.archive_session}_{camera_frame.cam.name}{suffix_string}.h5')
+                record = metadata_record(frame.timestamp, camera_frame.shot_number, camera_frame.cam, state.moments,
+                                         state.total_counts)
+                roi_records = roi_stats_records(camera_frame.shot_number, state.roi_stats)
+                camera_frame.shot_number += 1
+                master.archive_writer.submit(ArchiveItem(filename, np.copy(frame.data), metadata=record,
+                                                         compression=master.archive_compression,
+                                                         roi_records=roi_records))
+                return
+            filename = os.path.join(master.archive_dir, f'{prefix_string}{timestamp.year}{timestamp.month:02d}{timestamp.day:02d}_{timestamp.hour:02d}{timestamp.minute:02d}{timestamp.second:02d}'+f'_{camera_frame.cam.name}{suffix_string}{shot_number_string}')
+            print(filename)
+            camera_frame.shot_number += 1
+            if master.low_res_mode:
+                item = ArchiveItem(filename + '.png', np.copy(state.plot_data), lut=camera_frame.display_lut,
+                                   levels=camera_frame.display_levels)
+            else:
+                item = ArchiveItem(filename + '.tiff', np.copy(frame.data), archive_description(state.moments, state.roi_stats))
+            master.archive_writer.submit(item)
+        except Exception as e:
+            print(e)
+
+class SharedMemoryStage(Stage):
+    name = 'Shared memory'
+
+    def active(self):
+        return self.camera_frame.frame_publisher is not None
+
+    def process(self, state):
+        # the publisher can be closed from the GUI thread in between, it then ignores the frame
+        publisher = self.camera_frame.frame_publisher
+        if publisher is not None:
+            publisher.publish(state.plot_data, state.frame.sequence, state.frame.timestamp, state.offset_x,
+                              state.offset_y, state.total_counts, state.saturated_pixels, state.moments)
+
+class DisplayStage(Stage):
+    name = 'Display'
+
+    def process(self, state):
+        # statistics and archives use the full frame, only the displayed image is shrunk to the tile size
+        display_factor = self.camera_frame.display_factor
+        state.display_image = decimate(state.plot_data, display_factor, self.camera_frame.display_decimation)
+        state.display_factor = display_factor if state.display_image is not state.plot_data else 1
+
+class Pipeline:
+    def __init__(self, stages):
+        """Stages run in order on every frame. The stage list can be reordered or extended."""
+        self.stages = list(stages)
+        self.timer = StageTimer()
+
+    def stage(self, name):
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        return None
+
+    def run(self, state):
+        start = time.perf_counter()
+        try:
+            for stage in self.stages:
+                if not stage.active():
+                    continue
+                stage_start = time.perf_counter()
+                stage.process(state)
+                stage.timer.add(time.perf_counter() - stage_start)
+        except Exception:
+            for buffer in state.buffers:
+                self.release(buffer)
+            raise
+        self.timer.add(time.perf_counter() - start)
+        # the processed frame only keeps the displayed data
+        for buffer in state.buffers:
+            if buffer is not state.plot_data and buffer is not state.display_image:
+                self.release(buffer)
+
+    def release(self, buffer):
+        for stage in self.stages:
+            stage.release(buffer)
+
+    def timings(self):
+        """StageTiming of every stage and of the whole pipeline, which comes last."""
+        timings = [stage.timer.timing(stage.name) for stage in self.stages]
+        timings.append(self.timer.timing('Total'))
+        return timings
+
+    def reset_timers(self):
+        for stage in self.stages:
+            stage.timer.reset()
+        self.timer.reset()
+
+def default_pipeline(camera_frame):
+    stage_types = (MedianStage, CountsStage, DarkSubtractionStage, AveragingStage, ThresholdStage, StatisticsStage,
+                   AnalysisRoiStage, EventCaptureStage, ArchiveStage, SharedMemoryStage, DisplayStage)
+    return Pipeline(stage_type(camera_frame) for stage_type in stage_types)
+
+def archive_description(moments, roi_stats=()):
+    values = [] if moments is None else [f'{k}={float(v):.6g}' for k, v in moments._asdict().items()]
+    for stats in roi_stats:
+        values.extend(f'{stats.name}_{k}={float(getattr(stats, k)):.6g}' for k in ('total_counts', 'centroid_x', 'centroid_y'))
+    return ', '.join(values)
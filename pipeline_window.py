@@ -0,0 +1,100 @@
+from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QComboBox, QLabel, QPushButton,
+                             QTableWidget, QTableWidgetItem, QAbstractItemView, QHeaderView)
+from PyQt5.QtCore import QTimer
+
+import numpy as np
+
+class PipelineWindow(QMainWindow):
+    columns = ('Stage', 'Frames', 'Mean (ms)', 'p99 (ms)', 'Max (ms)')
+
+    def __init__(self, root, app):
+        super().__init__()
+        self.setMinimumSize(450, 350)
+        self.setWindowTitle('Processing diagnostics')
+        self.app = app
+        self.root = root
+
+        dummy_widget = QWidget()
+        layout = QVBoxLayout()
+        dummy_widget.setLayout(layout)
+        self.setCentralWidget(dummy_widget)
+
+        control_row = QHBoxLayout()
+        control_row.addWidget(QLabel(text='Camera: ', parent=self))
+        self.camera_box = QComboBox(parent=self)
+        self.camera_box.currentIndexChanged.connect(self.refresh)
+        control_row.addWidget(self.camera_box, 1)
+        reset_button = QPushButton(text='Reset', parent=self)
+        reset_button.clicked.connect(self.reset)
+        control_row.addWidget(reset_button)
+        layout.addLayout(control_row)
+
+        self.table = QTableWidget(0, len(self.columns), parent=self)
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        layout.addWidget(self.table)
+
+        self.budget_label = QLabel(text='', parent=self)
+        layout.addWidget(self.budget_label)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+
+    def closeEvent(self, event):
+        self.hide()
+        event.ignore()
+
+    def update_cameras(self):
+        serial_numbers = list(self.root.camera_frames)
+        current = self.camera_box.currentData()
+        if serial_numbers == [self.camera_box.itemData(i) for i in range(self.camera_box.count())]:
+            return
+        self.camera_box.blockSignals(True)
+        self.camera_box.clear()
+        for serial_number in serial_numbers:
+            self.camera_box.addItem(self.root.camera_frames[serial_number].cam.name, serial_number)
+        index = self.camera_box.findData(current)
+        self.camera_box.setCurrentIndex(max(index, 0))
+        self.camera_box.blockSignals(False)
+
+    def selected_frame(self):
+        return self.root.camera_frames.get(self.camera_box.currentData())
+
+    def reset(self):
+        frame = self.selected_frame()
+        if frame is not None:
+            frame.processor.pipeline.reset_timers()
+        self.refresh()
+
+    def refresh(self, *args):
+        if not self.isVisible():
+            return
+        self.update_cameras()
+        frame = self.selected_frame()
+        if frame is None:
+            self.table.setRowCount(0)
+            self.budget_label.setText('No open cameras.')
+            return
+        timings = frame.processor.pipeline.timings()
+        self.table.setRowCount(len(timings))
+        for row, timing in enumerate(timings):
+            if timing.frames == 0:
+                # stages that are switched off have no timings
+                values = (timing.name, '0', '', '', '')
+            else:
+                values = (timing.name, str(timing.frames), f'{1e3*timing.mean:.2f}', f'{1e3*timing.p99:.2f}',
+                          f'{1e3*timing.maximum:.2f}')
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(value))
+        total = timings[-1]
+        frame_rate = frame.cam.target_frame_rate
+        if frame_rate is None or not np.isfinite(total.p99):
+            self.budget_label.setText('')
+            return
+        budget = 1/frame_rate
+        self.budget_label.setText(f'Frame budget at {frame_rate:.1f} fps: {1e3*budget:.1f} ms, '
+                                  f'p99 pipeline time uses {100*total.p99/budget:.0f}%')
+        self.budget_label.setStyleSheet('color: red' if total.p99 > budget else '')
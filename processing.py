@@ -0,0 +1,159 @@
+'''
+Frame processing kernels
+
+frame_statistics gets everything the per-frame statistics need from a single
+histogram of the frame: the pixel values of a camera frame are bounded by its
+bit depth, so np.bincount visits every pixel once and total counts, minimum,
+maximum and saturated pixels all follow from the 2**bit_depth bins.
+
+decimate shrinks a frame to about the size it is shown at, so the colormap
+and QImage conversion only handle pixels that reach the screen.
+
+BufferPool hands out frame-sized output buffers for processing steps that
+can't work in place, so they don't allocate a new array for every frame.
+'''
+
+from collections import namedtuple
+import threading
+
+import numpy as np
+
+FrameStatistics = namedtuple('FrameStatistics', ['total_counts', 'minimum', 'maximum', 'saturated_pixels',
+                                                 'histogram'])
+
+# np.bincount works on an intp copy of its input, histogramming in blocks keeps that copy in cache
+block_size = 2**16
+
+_levels_cache = {}
+
+def _levels(n):
+    levels = _levels_cache.get(n)
+    if levels is None:
+        levels = np.arange(n, dtype=np.int64)
+        _levels_cache[n] = levels
+    return levels
+
+def frame_statistics(frame, bit_depth, histogram=False):
+    """Total counts, minimum, maximum and saturated pixel count of a frame in one pass.
+
+    Args:
+        frame (ndarray): camera frame, unsigned integer data is histogrammed and
+            anything else falls back to separate reductions
+        bit_depth (int): bit depth of the camera, pixels at or above 2**bit_depth - 1 count as saturated
+        histogram (bool): also return the histogram of pixel values, 2**bit_depth bins
+
+    Returns:
+        FrameStatistics: histogram is None unless requested
+    """
+    saturation = 2**bit_depth - 1
+    if frame.dtype.kind != 'u' or frame.size == 0:
+        hist = None
+        if histogram:
+            hist, _ = np.histogram(frame, bins=saturation + 1, range=(0, saturation + 1))
+        if frame.size == 0:
+            return FrameStatistics(0, 0, 0, 0, hist)
+        return FrameStatistics(np.sum(frame), np.min(frame), np.max(frame),
+                               int(np.count_nonzero(frame >= saturation)), hist)
+
+    # values above the bit depth only show up with a wrong bit depth, they get bins of their own
+    pixels = frame.ravel()
+    # adding up the block histograms costs a pass over the bins, so blocks cover many bins' worth of pixels
+    step = max(block_size, 16*(saturation + 1))
+    counts = np.bincount(pixels[:step], minlength=saturation + 1)
+    for start in range(step, pixels.size, step):
+        block_counts = np.bincount(pixels[start:start + step], minlength=counts.size)
+        if block_counts.size > counts.size:
+            block_counts[:counts.size] += counts
+            counts = block_counts
+        else:
+            counts += block_counts
+    occupied = np.flatnonzero(counts)
+    total_counts = int(np.dot(counts, _levels(counts.size)))
+    saturated_pixels = int(np.sum(counts[saturation:]))
+    hist = counts[:saturation + 1] if histogram else None
+    return FrameStatistics(total_counts, int(occupied[0]), int(occupied[-1]), saturated_pixels, hist)
+
+decimation_modes = ('Mean', 'Max', 'Off')
+
+def decimate(frame, factor, mode='Mean'):
+    """Downsample a frame by factor in both directions for display.
+
+    Args:
+        frame (ndarray): 2D frame
+        factor (int): block size, frames are cropped to a multiple of it
+        mode (str): 'Mean' averages each block, 'Max' keeps its brightest pixel so hot spots stay
+            visible, 'Off' returns the frame unchanged
+
+    Returns:
+        ndarray: decimated frame with the dtype of frame
+    """
+    if factor <= 1 or mode == 'Off':
+        return frame
+    height = frame.shape[0]//factor
+    width = frame.shape[1]//factor
+    if height == 0 or width == 0:
+        return frame
+    frame = frame[:height*factor, :width*factor]
+    # blocks are reduced with one strided pass per column and row of the block, which is
+    # far faster than reducing a 4D reshape over two axes
+    if mode == 'Max':
+        columns = frame[:, 0::factor].copy()
+        for k in range(1, factor):
+            np.maximum(columns, frame[:, k::factor], out=columns)
+        decimated = columns[0::factor].copy()
+        for k in range(1, factor):
+            np.maximum(decimated, columns[k::factor], out=decimated)
+        return decimated
+    if frame.dtype.kind == 'u' and frame.dtype.itemsize <= 2 and factor <= 256:
+        accumulator = np.uint32
+    elif frame.dtype.kind in 'ui':
+        accumulator = np.int64
+    else:
+        accumulator = np.float64
+    columns = frame[:, 0::factor].astype(accumulator)
+    for k in range(1, factor):
+        columns += frame[:, k::factor]
+    decimated = columns[0::factor].copy()
+    for k in range(1, factor):
+        decimated += columns[k::factor]
+    if accumulator is np.float64:
+        decimated /= factor*factor
+    else:
+        decimated //= factor*factor
+    return decimated.astype(frame.dtype)
+
+class BufferPool:
+    def __init__(self, size=4):
+        """Reusable output buffers of a single shape and dtype.
+
+        Buffers handed out by get come back with recycle once nothing refers to
+        them anymore. At most size buffers are kept, any more are left to the
+        garbage collector.
+        """
+        self.size = size
+        self.lock = threading.Lock()
+        self.shape = None
+        self.dtype = None
+        self.owned = {}
+        self.free = []
+
+    def get(self, shape, dtype):
+        dtype = np.dtype(dtype)
+        with self.lock:
+            if shape != self.shape or dtype != self.dtype:
+                # buffers of the old shape still in use are simply never taken back
+                self.shape = shape
+                self.dtype = dtype
+                self.owned = {}
+                self.free = []
+            if len(self.free) > 0:
+                return self.free.pop()
+            buffer = np.empty(shape, dtype=dtype)
+            if len(self.owned) < self.size:
+                self.owned[id(buffer)] = buffer
+            return buffer
+
+    def recycle(self, buffer):
+        with self.lock:
+            if self.owned.get(id(buffer)) is buffer:
+                self.free.append(buffer)
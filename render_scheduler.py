@@ -0,0 +1,68 @@
+'''
+Render scheduler for all camera frames
+
+A single timer owned by Beamview picks up processed frames and draws them.
+Each tick renders the selected camera first and then the others in
+round-robin order until the tick's time budget is used up, so one slow frame
+can't starve the rest. Frames that are hidden, minimized or have nothing new
+are skipped, and drawing never re-enters the event loop.
+'''
+
+import time
+
+from PyQt5.QtCore import QObject, QTimer
+
+class RenderScheduler(QObject):
+    def __init__(self, master, interval=30, budget=20):
+        """Scheduler drawing the camera frames of master.
+
+        Args:
+            master (Beamview): window owning camera_frames and selected_camera
+            interval (int): time between ticks in ms
+            budget (float): time in ms a tick may spend rendering
+        """
+        super().__init__(master)
+        self.master = master
+        self.budget = budget
+        self.next_index = 0
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.tick)
+        self.timer.start(interval)
+
+    @property
+    def interval(self):
+        return self.timer.interval()
+
+    @interval.setter
+    def interval(self, value):
+        self.timer.setInterval(value)
+
+    def stop(self):
+        self.timer.stop()
+
+    def visible(self, frame):
+        return not self.master.isMinimized() and frame.isVisible() and not frame.visibleRegion().isEmpty()
+
+    def tick(self):
+        start = time.perf_counter()
+        frames = list(self.master.camera_frames.values())
+        if len(frames) == 0:
+            return
+        selected = None
+        if self.master.selected_camera is not None:
+            selected = self.master.camera_frames.get(self.master.selected_camera.serial_number)
+
+        self.next_index %= len(frames)
+        order = frames[self.next_index:] + frames[:self.next_index]
+        if selected is not None:
+            order.remove(selected)
+            order.insert(0, selected)
+        for frame in order:
+            if time.perf_counter() - start > self.budget/1e3:
+                # the rest are first in line on the next tick
+                self.next_index = frames.index(frame)
+                return
+            if not frame.processor.has_result() or not self.visible(frame):
+                continue
+            frame.display_frame()
+        self.next_index = 0
@@ -0,0 +1,373 @@
+'''
+Replay camera that streams archived shots as a live camera
+
+Plays back a series of archive TIFFs, an HDF5 session archive, or a burst or
+event stack, either at the original frame timing or as fast as possible.
+Frames are read ahead on a prefetch thread and pushed to the registered image
+event handler like a real camera.
+'''
+
+import datetime
+import glob
+import os
+import queue
+import re
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+import camera_wrapper as cw
+from camera_wrapper import TriggerMode
+from hdf5_archive import h5py
+from synthetic_camera import SyntheticGrabResult
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+timestamp_pattern = re.compile(r'\d{8}_\d{6}')
+
+def tiff_series(filename):
+    """All archive TIFFs in the directory of filename from the same camera and settings, in order."""
+    directory, name = os.path.split(filename)
+    stem, ext = os.path.splitext(name)
+    # shots of one series only differ in their timestamp and shot number
+    pattern = timestamp_pattern.sub('*', glob.escape(stem), count=1)
+    pattern = re.sub(r'_\d+$', '_*', pattern)
+    return glob.glob(os.path.join(glob.escape(directory), pattern + ext))
+
+def tiff_timestamp(filename):
+    match = timestamp_pattern.search(os.path.basename(filename))
+    if match is not None:
+        return datetime.datetime.strptime(match.group(), '%Y%m%d_%H%M%S').timestamp()
+    return os.path.getmtime(filename)
+
+def shot_number(filename):
+    match = re.search(r'_(\d+)$', os.path.splitext(os.path.basename(filename))[0])
+    return int(match.group(1)) if match is not None else 0
+
+class TiffSource:
+    def __init__(self, filenames):
+        self.filenames = sorted(filenames, key=lambda f: (tiff_timestamp(f), shot_number(f), f))
+        self.timestamps = np.array([tiff_timestamp(f) for f in self.filenames])
+        # filenames only resolve whole seconds, so shots within one second are spread out evenly
+        _, starts, counts = np.unique(self.timestamps, return_index=True, return_counts=True)
+        for start, count in zip(starts, counts):
+            self.timestamps[start:start + count] += np.arange(count)/count
+        self.metadata = None
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def read(self, i):
+        filename = self.filenames[i]
+        if tifffile is not None:
+            try:
+                return tifffile.memmap(filename, mode='r')
+            except ValueError:
+                pass  # compressed or non-contiguous, so it can't be mapped
+        with Image.open(filename) as im:
+            return np.asarray(im)
+
+    def close(self):
+        pass
+
+class HDF5Source:
+    def __init__(self, filename):
+        if h5py is None:
+            raise RuntimeError('h5py is required to replay HDF5 archives')
+        self.h5file = h5py.File(filename, 'r')
+        if 'frames' in self.h5file:
+            groups = [self.h5file]
+        else:
+            groups = [self.h5file[name] for name in sorted(self.h5file.keys())]
+        index = []
+        timestamps = []
+        metadata = []
+        for group in groups:
+            n = group['frames'].shape[0]
+            index.extend((group['frames'], i) for i in range(n))
+            if 'metadata' in group:
+                metadata.append(group['metadata'][:])
+                timestamps.append(metadata[-1]['timestamp'])
+            elif 'timestamps' in group:
+                timestamps.append(group['timestamps'][:])
+            else:
+                timestamps.append(np.arange(n, dtype=float))
+        order = np.argsort(np.concatenate(timestamps), kind='stable')
+        self.index = [index[i] for i in order]
+        self.timestamps = np.concatenate(timestamps)[order]
+        self.metadata = np.concatenate(metadata)[order] if len(metadata) == len(groups) else None
+
+    def __len__(self):
+        return len(self.index)
+
+    def read(self, i):
+        frames, j = self.index[i]
+        return frames[j]
+
+    def close(self):
+        self.h5file.close()
+
+class NpzSource:
+    def __init__(self, filename):
+        with np.load(filename) as archive:
+            self.frames = archive['frames']
+            if 'metadata' in archive:
+                self.metadata = archive['metadata']
+                self.timestamps = self.metadata['timestamp']
+            else:
+                self.metadata = None
+                self.timestamps = archive['timestamps'] if 'timestamps' in archive else np.arange(len(self.frames), dtype=float)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def read(self, i):
+        return self.frames[i]
+
+    def close(self):
+        pass
+
+def open_source(filename):
+    if filename.endswith('.h5'):
+        return HDF5Source(filename)
+    elif filename.endswith('.npz'):
+        return NpzSource(filename)
+    return TiffSource(tiff_series(filename))
+
+class ReplayDeviceInfo:
+    '''
+    Stand-in for pylon.DeviceInfo, so replays can be opened from the camera list
+    '''
+    def __init__(self, filename, real_time=True, loop=True):
+        self.filename = filename
+        self.real_time = real_time
+        self.loop = loop
+        self.name = 'Replay ' + os.path.splitext(os.path.basename(filename))[0]
+
+    def GetSerialNumber(self):
+        return 'replay:' + os.path.abspath(self.filename)
+
+    def GetUserDefinedName(self):
+        return self.name
+
+    def SetUserDefinedName(self, name):
+        self.name = name
+
+    def GetModelName(self):
+        return 'Replay'
+
+    def create_camera(self, trigger_mode, binning=1):
+        return Replay_Camera(self.GetSerialNumber(), self.filename, trigger_mode, self.real_time, self.loop,
+                             name=self.name)
+
+class Replay_Camera(cw.Camera):
+    prefetch_frames = 8
+
+    def __init__(self, serial_number, filename, trigger_mode, real_time=True, loop=True, name=''):
+        """Camera replaying archived frames.
+
+        Args:
+            serial_number (str): serial number reported to Beamview
+            filename (str): archive TIFF (its whole series is replayed), HDF5 archive or npz stack
+            trigger_mode (TriggerMode): ignored apart from validation, frames follow the archive timing
+            real_time (bool): replay at the archived timestamps instead of as fast as possible
+            loop (bool): start over at the end of the archive
+            name (str): user defined camera name
+        """
+        super().__init__(serial_number)
+        if not isinstance(trigger_mode, TriggerMode):
+            raise TypeError('trigger must be of type TriggerMode')
+        self.source = open_source(filename)
+        if len(self.source) == 0:
+            raise ValueError(f'No frames to replay in {filename}')
+        self.name = name
+        self.model = 'Replay'
+        self.real_time = real_time
+        self.loop = loop
+        self._trigger_mode = trigger_mode
+        self.frame_transmission_delay = 0
+        self.interpacket_delay = 0
+
+        first_frame = np.asarray(self.source.read(0))
+        self._height, self._width = first_frame.shape
+        if first_frame.dtype == np.uint8:
+            self._pixel_format = 'Mono8'
+        elif np.max(first_frame) > 4095:
+            self._pixel_format = 'Mono16'
+        else:
+            self._pixel_format = 'Mono12'
+        metadata = self.source.metadata
+        self._offset_x = int(metadata['offset_x'][0]) if metadata is not None else 0
+        self._offset_y = int(metadata['offset_y'][0]) if metadata is not None else 0
+        self._binning = int(metadata['binning'][0]) if metadata is not None else 1
+        self._exposure = float(metadata['exposure'][0]) if metadata is not None else 0
+        self._gain = float(metadata['gain'][0]) if metadata is not None else 0
+
+        self.handler = None
+        self.block_id = 0
+        self._grabbing = False
+        self._threads = []
+        self._queue = None
+
+    def prefetch_loop(self, frames):
+        i = 0
+        while self._grabbing:
+            if i >= len(self.source):
+                if not self.loop:
+                    frames.put(None)
+                    return
+                i = 0
+            frame = np.asarray(self.source.read(i))
+            while self._grabbing:
+                try:
+                    frames.put((i, frame), timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            i += 1
+
+    def play_loop(self, frames):
+        start_time = None
+        first_timestamp = None
+        while self._grabbing:
+            try:
+                item = frames.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is None:
+                self._grabbing = False
+                return
+            i, frame = item
+            timestamp = self.source.timestamps[i]
+            if self.real_time:
+                if start_time is None or i == 0:
+                    start_time = time.perf_counter()
+                    first_timestamp = timestamp
+                delay = (timestamp - first_timestamp) - (time.perf_counter() - start_time)
+                if delay > 0:
+                    time.sleep(delay)
+            self._height, self._width = frame.shape
+            self.block_id += 1
+            handler = self.handler
+            if handler is not None:
+                handler.OnImageGrabbed(self, SyntheticGrabResult(frame, self.block_id, time.time()))
+
+    @property
+    def pixel_format(self):
+        return self._pixel_format
+
+    @property
+    def gain(self):
+        return self._gain
+
+    @gain.setter
+    def gain(self, value):
+        pass
+
+    @property
+    def exposure(self):
+        """Exposure time in ms
+
+        Returns:
+            float: exposure time in ms
+        """
+        return self._exposure
+
+    @exposure.setter
+    def exposure(self, value):
+        pass
+
+    # the ROI is fixed by the archive, so the setters are ignored
+    @property
+    def offset_x(self):
+        return self._offset_x
+
+    @offset_x.setter
+    def offset_x(self, value):
+        pass
+
+    @property
+    def offset_y(self):
+        return self._offset_y
+
+    @offset_y.setter
+    def offset_y(self, value):
+        pass
+
+    @property
+    def width(self):
+        return self._width
+
+    @width.setter
+    def width(self, value):
+        pass
+
+    @property
+    def height(self):
+        return self._height
+
+    @height.setter
+    def height(self, value):
+        pass
+
+    @property
+    def max_width(self):
+        return self._offset_x + self._width
+
+    @property
+    def max_height(self):
+        return self._offset_y + self._height
+
+    @property
+    def binning(self):
+        return self._binning
+
+    @property
+    def trigger_mode(self):
+        return self._trigger_mode
+
+    @trigger_mode.setter
+    def trigger_mode(self, value):
+        if not isinstance(value, TriggerMode):
+            raise TypeError('Input must be of type TriggerMode')
+        self._trigger_mode = value
+
+    def start_grabbing(self):
+        if self._grabbing:
+            return
+        self._grabbing = True
+        self._queue = queue.Queue(maxsize=self.prefetch_frames)
+        self._threads = [threading.Thread(target=self.prefetch_loop, args=(self._queue,), daemon=True),
+                         threading.Thread(target=self.play_loop, args=(self._queue,), daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def return_frame(self):
+        i = self.block_id % len(self.source)
+        self.block_id += 1
+        return SyntheticGrabResult(np.array(self.source.read(i)), self.block_id, time.time())
+
+    def request_frame(self):
+        pass
+
+    def register_event_handler(self, handler):
+        self.handler = handler
+
+    def stop_grabbing(self):
+        self._grabbing = False
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        self._threads = []
+
+    def is_grabbing(self):
+        return self._grabbing
+
+    def release_camera(self):
+        self.stop_grabbing()
+        self.source.close()
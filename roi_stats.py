@@ -0,0 +1,96 @@
+'''
+Statistics of rectangular analysis regions from summed-area tables
+
+One summed-area table of the frame, plus one of the frame weighted by column
+and one weighted by row, give the counts and first moments inside any
+rectangle from four lookups each. However many regions a camera has, the
+frame is only traversed to build the three tables, and the tables only cover
+the bounding box of the regions.
+'''
+
+from collections import namedtuple
+
+import numpy as np
+
+# regions are in frame pixels, x and y of the top left corner of the frame as it is stored
+AnalysisRoi = namedtuple('AnalysisRoi', ['name', 'x', 'y', 'width', 'height'])
+RoiStats = namedtuple('RoiStats', AnalysisRoi._fields + ('total_counts', 'centroid_x', 'centroid_y'))
+
+class IntegralImage:
+    def __init__(self):
+        """Summed-area tables of a frame, the buffers are reused while the size stays the same."""
+        self.counts = None
+        self.moment_x = None
+        self.moment_y = None
+        self.origin = (0, 0)
+
+    def build(self, frame, x0=0, y0=0):
+        """Build the tables of frame, which starts at column x0 and row y0 of the full frame."""
+        dtype = np.int64 if frame.dtype.kind in 'ui' else np.float64
+        height, width = frame.shape
+        shape = (height + 1, width + 1)
+        if self.counts is None or self.counts.shape != shape or self.counts.dtype != dtype:
+            # the zero first row and column make every rectangle four lookups, including at the edges
+            self.counts = np.zeros(shape, dtype=dtype)
+            self.moment_x = np.zeros(shape, dtype=dtype)
+            self.moment_y = np.zeros(shape, dtype=dtype)
+        self.origin = (x0, y0)
+        columns = np.arange(x0, x0 + width, dtype=dtype)
+        rows = np.arange(y0, y0 + height, dtype=dtype)[:, None]
+        counts = self.counts[1:, 1:]
+        moment_x = self.moment_x[1:, 1:]
+        moment_y = self.moment_y[1:, 1:]
+        np.multiply(frame, columns, out=moment_x)
+        np.multiply(frame, rows, out=moment_y)
+        np.copyto(counts, frame)
+        for table in (counts, moment_x, moment_y):
+            # the contiguous axis first, the running sum down the rows is then one add per row
+            np.cumsum(table, axis=1, out=table)
+            for row in range(1, height):
+                np.add(table[row - 1], table[row], out=table[row])
+
+    def rect_sum(self, table, roi):
+        x0 = roi.x - self.origin[0]
+        y0 = roi.y - self.origin[1]
+        x1 = x0 + roi.width
+        y1 = y0 + roi.height
+        return table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+
+    def stats(self, roi, offset_x=0, offset_y=0):
+        """Counts and centroid of roi, centroids in sensor pixels like the global statistics.
+
+        roi has to lie inside the frame the tables were built from.
+        """
+        total_counts = self.rect_sum(self.counts, roi)
+        if total_counts <= 0:
+            return RoiStats(*roi, total_counts, np.nan, np.nan)
+        centroid_x = offset_x + self.rect_sum(self.moment_x, roi)/total_counts
+        centroid_y = offset_y + self.rect_sum(self.moment_y, roi)/total_counts
+        return RoiStats(*roi, total_counts, centroid_x, centroid_y)
+
+def clip_roi(roi, shape):
+    """roi limited to a frame of shape, None if nothing of it is left."""
+    height, width = shape
+    x0 = min(max(roi.x, 0), width)
+    y0 = min(max(roi.y, 0), height)
+    x1 = min(max(roi.x + roi.width, 0), width)
+    y1 = min(max(roi.y + roi.height, 0), height)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return AnalysisRoi(roi.name, x0, y0, x1 - x0, y1 - y0)
+
+def roi_statistics(integral_image, frame, rois, offset_x=0, offset_y=0):
+    """Statistics of every region in rois that overlaps frame.
+
+    Returns:
+        list: RoiStats in the order of rois, regions outside the frame are left out
+    """
+    rois = [clipped for clipped in (clip_roi(roi, frame.shape) for roi in rois) if clipped is not None]
+    if len(rois) == 0:
+        return []
+    x0 = min(roi.x for roi in rois)
+    y0 = min(roi.y for roi in rois)
+    x1 = max(roi.x + roi.width for roi in rois)
+    y1 = max(roi.y + roi.height for roi in rois)
+    integral_image.build(frame[y0:y1, x0:x1], x0, y0)
+    return [integral_image.stats(roi, offset_x, offset_y) for roi in rois]
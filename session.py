@@ -0,0 +1,99 @@
+'''
+Session files
+
+A session is a JSON file with the archive settings and, for each open camera
+in grid order, where it comes from, its acquisition settings and the display
+and processing settings of its frame. Restoring a session opens the cameras on
+worker threads, since opening a camera and writing its parameters over the
+network takes seconds per camera.
+'''
+
+import json
+import os
+
+from camera_wrapper import TriggerMode
+from synthetic_camera import SyntheticDeviceInfo
+from replay_camera import ReplayDeviceInfo
+try:
+    from basler_camera_wrapper import Basler_Camera
+except ImportError:
+    Basler_Camera = None
+
+session_version = 1
+
+def device_entry(device):
+    """Where a camera comes from, enough to find or recreate its device info."""
+    if isinstance(device, SyntheticDeviceInfo):
+        return {'source': 'synthetic', 'width': device.width, 'height': device.height,
+                'bit_depth': device.bit_depth, 'frame_rate': device.frame_rate}
+    if isinstance(device, ReplayDeviceInfo):
+        return {'source': 'replay', 'filename': os.path.abspath(device.filename), 'real_time': device.real_time,
+                'loop': device.loop}
+    return {'source': 'basler'}
+
+def make_device(entry):
+    """Device info of a session camera entry, None for Basler cameras, which are opened by serial number."""
+    source = entry['device']['source']
+    if source == 'synthetic':
+        device = entry['device']
+        return SyntheticDeviceInfo(entry['serial_number'], entry['name'], device['width'], device['height'],
+                                   device['bit_depth'], device['frame_rate'])
+    if source == 'replay':
+        device = entry['device']
+        replay = ReplayDeviceInfo(device['filename'], device['real_time'], device['loop'])
+        replay.SetUserDefinedName(entry['name'])
+        return replay
+    return None
+
+def acquisition_settings(cam):
+    return {'exposure': cam.exposure,
+            'gain': cam.gain,
+            'roi': [cam.offset_x, cam.offset_y, cam.offset_x + cam.width, cam.offset_y + cam.height],
+            'hardware_trigger': cam.trigger_mode == TriggerMode.HARDWARE}
+
+def apply_acquisition_settings(cam, settings):
+    # the ROI first, it limits the exposure through the frame rate on some cameras
+    if 'roi' in settings:
+        cam.set_roi(*settings['roi'])
+    if 'exposure' in settings:
+        cam.exposure = settings['exposure']
+    if 'gain' in settings:
+        cam.gain = settings['gain']
+    if 'hardware_trigger' in settings:
+        cam.trigger_mode = TriggerMode.HARDWARE if settings['hardware_trigger'] else TriggerMode.FREERUN
+
+def open_camera(entry, device, packet_size):
+    """Open the camera of a session entry and apply its acquisition settings, safe to call from a worker thread.
+
+    Args:
+        entry (dict): camera entry of the session
+        device: device info from make_device, None for Basler cameras
+        packet_size (int): initial packet size of Basler cameras
+
+    Returns:
+        Camera: the opened camera
+    """
+    binning = entry.get('binning', 1)
+    if device is not None:
+        cam = device.create_camera(TriggerMode.FREERUN, binning)
+    elif Basler_Camera is None:
+        raise RuntimeError('pypylon is not installed')
+    else:
+        cam = Basler_Camera(entry['serial_number'], TriggerMode.FREERUN, packet_size, binning)
+    cam.name = entry['name']
+    apply_acquisition_settings(cam, entry.get('acquisition', {}))
+    return cam
+
+def write_session(filename, session):
+    # written next to the old file and swapped in, so a failed save leaves the old session intact
+    temporary = filename + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(dict(session, version=session_version), f, indent=4)
+    os.replace(temporary, filename)
+
+def read_session(filename):
+    with open(filename) as f:
+        session = json.load(f)
+    if session.get('version', session_version) > session_version:
+        raise ValueError(f'{filename} was saved by a newer version of Beamview')
+    return session
@@ -3,14 +3,19 @@ import pyqtgraph.exporters as exp
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QComboBox, QPushButton, QGroupBox,
                              QCheckBox, QLineEdit, QLabel, QFileDialog, QGridLayout)
 from PyQt5.QtGui import QIntValidator, QDoubleValidator
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 
 import numpy as np
 
 from camera_frame import CameraFrame
-from basler_camera_wrapper import TriggerMode
+from camera_wrapper import TriggerMode
+from processing import decimation_modes
+from background import background_modes
 
 class SettingsWindow(QWidget):
+    # statistics history windows offered for the strip charts, at most CameraFrame.max_history_window
+    history_windows = {'10 s': 10, '1 min': 60, '5 min': 300}
+    
     def __init__(self, root, app):
         super().__init__()
         self.app = app
@@ -59,7 +64,11 @@ class SettingsWindow(QWidget):
         
         self.build_stat_frame()
         self.build_proc_frame()
+        self.build_background_frame()
         self.build_camera_frame()
+        self.build_burst_frame()
+        self.build_event_frame()
+        self.build_history_frame()
         self.app.focusChanged.connect(self.focus_changed)
         self.setLayout(self.main_layout)
         
@@ -101,6 +110,8 @@ class SettingsWindow(QWidget):
             return
         self.cam = self.active_cameras[i]
         self.active_frame = self.camera_frames[i]
+        # resync the cached parameters in case something else changed them on the device
+        self.cam.refresh()
         self.refresh()
         
     def refresh(self):
@@ -128,6 +139,12 @@ class SettingsWindow(QWidget):
         self.median_check.setChecked(self.active_frame.use_median_filter)
         
         self.thresh_entry.setText(str(self.active_frame.threshold))
+        self.average_entry.setText(str(self.active_frame.averager.n_frames))
+        self.average_stats_check.setChecked(self.active_frame.stats_on_average)
+        self.populate_event_entries()
+        self.populate_background_entries()
+        self.chart_check.setChecked(self.active_frame.chart.isVisibleTo(self.active_frame))
+        self.history_window_box.setCurrentIndex(self.history_window_box.findData(self.active_frame.history_window))
         
         self.exposure_entry.setText(str(self.cam.exposure))
         self.gain_entry.setText(str(self.cam.gain))
@@ -141,6 +158,7 @@ class SettingsWindow(QWidget):
         self.max_range_entry.setText(str(self.active_frame.vmax))
         
         self.colormap_box.setValue(self.active_frame.cmap)
+        self.decimation_box.setCurrentText(self.active_frame.display_decimation)
         if self.cam.trigger_mode == TriggerMode.HARDWARE:
             trigger = True
         elif self.cam.trigger_mode == TriggerMode.FREERUN:
@@ -204,6 +222,24 @@ class SettingsWindow(QWidget):
         
         stat_layout.addLayout(manual_range_layout)
         
+        roi_layout = QHBoxLayout()
+        roi_layout.addWidget(QLabel(text='Analysis ROI: ', parent=stat_frame))
+        self.roi_name_entry = QLineEdit(parent=stat_frame)
+        self.roi_name_entry.setPlaceholderText('name')
+        self.roi_name_entry.setFixedWidth(self.base_entry_width)
+        self.roi_name_entry.returnPressed.connect(self.add_analysis_roi)
+        roi_layout.addWidget(self.roi_name_entry)
+        add_roi_button = QPushButton(text='Add', parent=stat_frame)
+        add_roi_button.setToolTip('Counts and centroid inside the region are shown and archived with each frame. '
+                                  'Right click a region to remove it.')
+        add_roi_button.clicked.connect(self.add_analysis_roi)
+        roi_layout.addWidget(add_roi_button)
+        clear_roi_button = QPushButton(text='Remove all', parent=stat_frame)
+        clear_roi_button.clicked.connect(self.clear_analysis_rois)
+        roi_layout.addWidget(clear_roi_button)
+        roi_layout.addStretch(1)
+        stat_layout.addLayout(roi_layout)
+        
         save_button = QPushButton(text='Save image', parent=self)
         save_button.clicked.connect(self.save_image)
         
@@ -239,6 +275,13 @@ class SettingsWindow(QWidget):
             exporter.export(filename)
 
 
+    def add_analysis_roi(self):
+        self.active_frame.add_analysis_roi(self.roi_name_entry.text().strip())
+        self.roi_name_entry.clear()
+        
+    def clear_analysis_rois(self):
+        self.active_frame.clear_analysis_rois()
+
     def stat_check_clicked(self, checked):
         self.active_frame.calculate_stats = checked
     
@@ -262,7 +305,7 @@ class SettingsWindow(QWidget):
 
 
     def build_proc_frame(self):
-        # frame that contains image post-processing controls (threshold, median filter)
+        # frame that contains image post-processing controls (threshold, median filter, averaging)
         proc_row_layout = QHBoxLayout()
         self.main_layout.addLayout(proc_row_layout)
         proc_frame = QGroupBox(title='Image processing controls', parent=self)
@@ -291,6 +334,20 @@ class SettingsWindow(QWidget):
         thresh_row_layout.addWidget(self.thresh_entry)
         thresh_row_layout.addStretch(1)
         
+        average_row_layout = QHBoxLayout()
+        proc_layout.addLayout(average_row_layout)
+        average_row_layout.addWidget(QLabel(text='Average frames: ', parent=proc_frame))
+        self.average_entry = QLineEdit(parent=proc_frame)
+        self.average_entry.setValidator(QIntValidator(bottom=1, top=1000, parent=self))
+        self.average_entry.setFixedWidth(self.base_entry_width)
+        self.average_entry.setToolTip('Number of frames averaged for display and statistics, 1 shows single frames.')
+        self.average_entry.returnPressed.connect(self.average_changed)
+        average_row_layout.addWidget(self.average_entry)
+        self.average_stats_check = QCheckBox(text='Statistics from average?', parent=proc_frame)
+        self.average_stats_check.clicked.connect(self.average_stats_check_click)
+        average_row_layout.addWidget(self.average_stats_check)
+        average_row_layout.addStretch(1)
+        
         colormap_row_layout = QHBoxLayout()
         proc_layout.addLayout(colormap_row_layout)
         self.colormap_box = pg.ComboBox(parent=proc_frame)
@@ -301,10 +358,24 @@ class SettingsWindow(QWidget):
         colormap_row_layout.addStretch(1)
         self.colormap_box.currentIndexChanged.connect(self.colormap_changed)
         self.colormap_box.setValue(CameraFrame.default_cmap)
+        
+        decimation_row_layout = QHBoxLayout()
+        proc_layout.addLayout(decimation_row_layout)
+        self.decimation_box = QComboBox(parent=proc_frame)
+        self.decimation_box.addItems(decimation_modes)
+        self.decimation_box.setToolTip('How frames are shrunk to the size they are shown at. '
+                                       'Max keeps hot spots visible, Off shows every pixel.')
+        decimation_row_layout.addWidget(QLabel(text='Display downsampling: ', parent=proc_frame))
+        decimation_row_layout.addWidget(self.decimation_box)
+        decimation_row_layout.addStretch(1)
+        self.decimation_box.currentTextChanged.connect(self.decimation_changed)
                 
     def colormap_changed(self, i):
         self.active_frame.cmap = self.colormap_box.value()
         
+    def decimation_changed(self, mode):
+        self.active_frame.display_decimation = mode
+        
     def median_check_click(self, checked):
         self.active_frame.use_median_filter = checked
 
@@ -319,7 +390,101 @@ class SettingsWindow(QWidget):
         
     def threshold_changed(self):
         self.active_frame.threshold = float(self.thresh_entry.text())
+        
+    def average_changed(self):
+        if self.average_entry.text() != '':
+            self.active_frame.averager.set_frames(int(self.average_entry.text()))
+        self.average_entry.setText(str(self.active_frame.averager.n_frames))
+        
+    def average_stats_check_click(self, checked):
+        self.active_frame.stats_on_average = checked
     
+    def build_background_frame(self):
+        # frame that contains dark frame and background subtraction controls
+        background_row_layout = QHBoxLayout()
+        self.main_layout.addLayout(background_row_layout)
+        background_frame = QGroupBox(title='Background subtraction', parent=self)
+        background_row_layout.addWidget(background_frame)
+        background_row_layout.addStretch(1)
+        background_layout = QGridLayout()
+        background_frame.setLayout(background_layout)
+
+        background_layout.addWidget(QLabel(text='Mode: ', parent=background_frame), 0, 0, Qt.AlignmentFlag.AlignRight)
+        self.background_mode_box = QComboBox(parent=background_frame)
+        self.background_mode_box.addItems(background_modes)
+        self.background_mode_box.setToolTip('Dark frame subtracts an average captured with the beam blocked, '
+                                            'running average follows slow background drifts.')
+        self.background_mode_box.currentTextChanged.connect(self.background_mode_changed)
+        background_layout.addWidget(self.background_mode_box, 0, 1)
+
+        background_layout.addWidget(QLabel(text='Frames: ', parent=background_frame), 1, 0, Qt.AlignmentFlag.AlignRight)
+        self.background_frames_entry = QLineEdit(parent=background_frame)
+        self.background_frames_entry.setValidator(QIntValidator(bottom=1, parent=self))
+        self.background_frames_entry.setFixedWidth(self.base_entry_width)
+        self.background_frames_entry.returnPressed.connect(self.background_settings_changed)
+        background_layout.addWidget(self.background_frames_entry, 1, 1)
+
+        background_layout.addWidget(QLabel(text='Running weight: ', parent=background_frame), 2, 0, Qt.AlignmentFlag.AlignRight)
+        self.background_alpha_entry = QLineEdit(parent=background_frame)
+        self.background_alpha_entry.setValidator(QDoubleValidator(bottom=0, top=1, parent=self))
+        self.background_alpha_entry.setFixedWidth(self.base_entry_width)
+        self.background_alpha_entry.returnPressed.connect(self.background_settings_changed)
+        background_layout.addWidget(self.background_alpha_entry, 2, 1)
+
+        for column, (text, slot) in enumerate((('Capture', self.capture_background), ('Save', self.save_background),
+                                               ('Load', self.load_background), ('Clear', self.clear_background))):
+            button = QPushButton(text=text, parent=background_frame)
+            button.clicked.connect(slot)
+            background_layout.addWidget(button, column//2, 2 + column % 2)
+        self.background_status_label = QLabel(text='', parent=background_frame)
+        background_layout.addWidget(self.background_status_label, 2, 2, 1, 2)
+        background_layout.setColumnStretch(4, 100)
+
+        # captures finish in the background, so the status is polled while the window is open
+        self.background_timer = QTimer(self)
+        self.background_timer.timeout.connect(self.update_background_status)
+        self.background_timer.start(500)
+
+    def populate_background_entries(self):
+        background = self.active_frame.background
+        self.background_mode_box.setCurrentText(background.mode)
+        self.background_frames_entry.setText(str(background.capture_frames))
+        self.background_alpha_entry.setText(str(background.alpha))
+        self.update_background_status()
+
+    def update_background_status(self):
+        if self.isVisible() and hasattr(self, 'active_frame'):
+            self.background_status_label.setText(self.active_frame.background.status())
+
+    def background_mode_changed(self, mode):
+        self.active_frame.background.set_mode(mode)
+        self.update_background_status()
+
+    def background_settings_changed(self, *args):
+        background = self.active_frame.background
+        if self.background_frames_entry.text() != '':
+            background.capture_frames = int(self.background_frames_entry.text())
+        if self.background_alpha_entry.text() != '':
+            background.alpha = float(self.background_alpha_entry.text())
+        self.populate_background_entries()
+
+    def capture_background(self):
+        self.background_settings_changed()
+        self.active_frame.background.capture()
+        self.update_background_status()
+
+    def save_background(self):
+        self.active_frame.background.save()
+
+    def load_background(self):
+        if not self.active_frame.background.load():
+            print(f'{self.cam.name}: no saved dark frame for this ROI')
+        self.update_background_status()
+
+    def clear_background(self):
+        self.active_frame.background.clear()
+        self.update_background_status()
+
     def build_camera_frame(self):
         
          # frame that contains exposure time and gain controls
@@ -420,17 +585,146 @@ class SettingsWindow(QWidget):
         calibration_layout.addWidget(self.calibration_entry)
         calibration_layout.addStretch(1)
         
+    def build_burst_frame(self):
+        # frame that contains burst capture controls
+        burst_row_layout = QHBoxLayout()
+        self.main_layout.addLayout(burst_row_layout)
+        burst_frame = QGroupBox(title='Burst capture', parent=self)
+        burst_row_layout.addWidget(burst_frame)
+        burst_row_layout.addStretch(1)
+        burst_layout = QGridLayout()
+        burst_frame.setLayout(burst_layout)
+        
+        burst_layout.addWidget(QLabel(text='Frames: ', parent=burst_frame), 0, 0, Qt.AlignmentFlag.AlignRight)
+        self.burst_frames_entry = QLineEdit(text='500', parent=burst_frame)
+        self.burst_frames_entry.setValidator(QIntValidator(bottom=1, parent=self))
+        self.burst_frames_entry.setFixedWidth(self.base_entry_width)
+        burst_layout.addWidget(self.burst_frames_entry, 0, 1)
+        
+        burst_layout.addWidget(QLabel(text='Grab buffers: ', parent=burst_frame), 1, 0, Qt.AlignmentFlag.AlignRight)
+        self.burst_buffers_entry = QLineEdit(text='100', parent=burst_frame)
+        self.burst_buffers_entry.setValidator(QIntValidator(bottom=1, parent=self))
+        self.burst_buffers_entry.setFixedWidth(self.base_entry_width)
+        burst_layout.addWidget(self.burst_buffers_entry, 1, 1)
+        
+        burst_button = QPushButton(text='Start burst', parent=burst_frame)
+        burst_button.clicked.connect(self.start_burst)
+        burst_layout.addWidget(burst_button, 0, 2, 2, 1)
+        burst_layout.setColumnStretch(3, 100)
+
+    def start_burst(self):
+        self.active_frame.start_burst(int(self.burst_frames_entry.text()), int(self.burst_buffers_entry.text()))
+        self.refresh()
+
+    def build_event_frame(self):
+        # frame that contains event-triggered capture controls
+        event_row_layout = QHBoxLayout()
+        self.main_layout.addLayout(event_row_layout)
+        event_frame = QGroupBox(title='Event capture', parent=self)
+        event_row_layout.addWidget(event_frame)
+        event_row_layout.addStretch(1)
+        event_layout = QGridLayout()
+        event_frame.setLayout(event_layout)
+        
+        self.event_check = QCheckBox(text='Capture events?', parent=event_frame)
+        self.event_check.clicked.connect(self.event_settings_changed)
+        event_layout.addWidget(self.event_check, 0, 0, 1, 2)
+        
+        int_validator = QIntValidator(bottom=0, parent=self)
+        dbl_validator = QDoubleValidator(bottom=0, parent=self)
+        self.event_entries = []
+        def add_entry(row, column, label, validator):
+            event_layout.addWidget(QLabel(text=label, parent=event_frame), row, column, Qt.AlignmentFlag.AlignRight)
+            entry = QLineEdit(parent=event_frame)
+            entry.setValidator(validator)
+            entry.setFixedWidth(self.base_entry_width)
+            entry.returnPressed.connect(self.event_settings_changed)
+            event_layout.addWidget(entry, row, column + 1)
+            self.event_entries.append(entry)
+            return entry
+        
+        self.event_pre_entry = add_entry(1, 0, 'Frames before: ', int_validator)
+        self.event_post_entry = add_entry(2, 0, 'Frames after: ', int_validator)
+        # empty rule entries disable the rule
+        self.event_jump_entry = add_entry(1, 2, 'Centroid jump (px): ', dbl_validator)
+        self.event_saturation_entry = add_entry(2, 2, 'Saturated pixels: ', int_validator)
+        self.event_dropout_entry = add_entry(3, 2, 'Counts below (% of average): ', QDoubleValidator(bottom=0, top=100, parent=self))
+        event_layout.setColumnStretch(4, 100)
+        
+    def build_history_frame(self):
+        # frame that contains the statistics history strip chart controls
+        history_row_layout = QHBoxLayout()
+        self.main_layout.addLayout(history_row_layout)
+        history_frame = QGroupBox(title='Statistics history', parent=self)
+        history_row_layout.addWidget(history_frame)
+        history_row_layout.addStretch(1)
+        history_layout = QHBoxLayout()
+        history_frame.setLayout(history_layout)
+        
+        self.chart_check = QCheckBox(text='Show strip charts?', parent=history_frame)
+        self.chart_check.clicked.connect(self.chart_check_click)
+        history_layout.addWidget(self.chart_check)
+        history_layout.addWidget(QLabel(text='Window: ', parent=history_frame))
+        self.history_window_box = QComboBox(parent=history_frame)
+        for text, seconds in self.history_windows.items():
+            self.history_window_box.addItem(text, seconds)
+        self.history_window_box.currentIndexChanged.connect(self.history_window_changed)
+        history_layout.addWidget(self.history_window_box)
+        clear_button = QPushButton(text='Clear', parent=history_frame)
+        clear_button.clicked.connect(self.clear_history)
+        history_layout.addWidget(clear_button)
+        history_layout.addStretch(1)
+        
+    def chart_check_click(self, checked):
+        self.active_frame.show_charts(checked)
+        
+    def history_window_changed(self, i):
+        self.active_frame.history_window = self.history_window_box.itemData(i)
+        self.active_frame.charted_version = -1
+        
+    def clear_history(self):
+        self.active_frame.stats_history.clear()
+        
+    def populate_event_entries(self):
+        def optional_text(value):
+            return '' if value is None else str(value)
+        self.event_check.setChecked(self.active_frame.event_capture.enabled)
+        self.event_pre_entry.setText(str(self.active_frame.event_capture.pre_frames))
+        self.event_post_entry.setText(str(self.active_frame.event_capture.post_frames))
+        self.event_jump_entry.setText(optional_text(self.active_frame.event_centroid_jump))
+        self.event_saturation_entry.setText(optional_text(self.active_frame.event_saturated_pixels))
+        self.event_dropout_entry.setText(optional_text(self.active_frame.event_counts_dropout))
+        
+    def event_settings_changed(self, *args):
+        def optional_value(entry, kind):
+            return kind(entry.text()) if entry.text() != '' else None
+        pre_frames = optional_value(self.event_pre_entry, int)
+        post_frames = optional_value(self.event_post_entry, int)
+        self.active_frame.configure_event_capture(self.event_check.isChecked(),
+                                                  pre_frames if pre_frames is not None else 0,
+                                                  post_frames if post_frames is not None else 0,
+                                                  optional_value(self.event_jump_entry, float),
+                                                  optional_value(self.event_saturation_entry, int),
+                                                  optional_value(self.event_dropout_entry, float))
+        self.populate_event_entries()
+
     def focus_changed(self, old, new):
         if old == self.calibration_entry:
             self.calibration_changed()
         if old == self.thresh_entry:
             self.threshold_changed()
+        if old == self.average_entry:
+            self.average_changed()
         if old == self.min_x_entry or old == self.min_y_entry or old == self.max_x_entry or old == self.max_y_entry:
             self.size_changed()
         if old == self.gain_entry:
             self.gain_changed()
         if old == self.exposure_entry:
             self.exposure_changed()
+        if old in self.event_entries:
+            self.event_settings_changed()
+        if old == self.background_frames_entry or old == self.background_alpha_entry:
+            self.background_settings_changed()
     
     def calibration_changed(self, *args):
         self.active_frame.change_calibration(self.calibration_check.isChecked(), float(self.calibration_entry.text()))
@@ -448,38 +742,7 @@ class SettingsWindow(QWidget):
         max_x = int(self.max_x_entry.text())
         max_y = int(self.max_y_entry.text())
         
-        if min_x < 0:
-            min_x = 0
-        elif min_x > self.cam.max_width - 4:
-            min_x = self.cam.max_width - 4
-            
-        if min_y < 0:
-            min_y = 0
-        elif min_y > self.cam.max_height - 4:
-            min_y = self.cam.max_height - 4
-        
-        if max_x - min_x < 4:
-            max_x = min_x + 4
-        elif max_x > self.cam.max_width:
-            max_x = self.cam.max_width
-        
-        if max_y - min_y < 4:
-            max_y = min_y + 4
-        elif max_y > self.cam.max_height:
-            max_y = self.cam.max_height
-            
-        if min_x > self.cam.offset_x:
-            self.cam.width = max_x - min_x
-            self.cam.offset_x = min_x
-        else:
-            self.cam.offset_x = min_x
-            self.cam.width = max_x - min_x
-        if min_y > self.cam.offset_y:
-            self.cam.height = max_y - min_y
-            self.cam.offset_y = min_y
-        else:
-            self.cam.offset_y = min_y   
-            self.cam.height = max_y - min_y
+        self.cam.set_roi(min_x, min_y, max_x, max_y)
         
         self.min_x_entry.setText(str(self.cam.offset_x))
         self.min_y_entry.setText(str(self.cam.offset_y))
@@ -487,6 +750,7 @@ class SettingsWindow(QWidget):
         self.max_y_entry.setText(str(self.cam.offset_y + self.cam.height))
         
         self.active_frame.change_offset(self.cam.offset_x, self.cam.offset_y)
+        self.root.set_delays()
 
     def gain_changed(self, *args):
         self.cam.gain = int(self.gain_entry.text())
@@ -495,5 +759,7 @@ class SettingsWindow(QWidget):
     
     def exposure_changed(self, *args):
         self.cam.exposure = float(self.exposure_entry.text())
+        # the exposure limits the frame rate, which the bandwidth plan depends on
+        self.root.set_delays()
 
         self.exposure_entry.setText(str(self.cam.exposure))
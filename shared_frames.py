@@ -0,0 +1,257 @@
+'''
+Latest processed frame of each camera in shared memory
+
+Beamview publishes the latest processed frame and its statistics into one
+named shared memory segment per camera, so other processes on the same host
+can read them without files or sockets. The segment has a header with the
+camera name and the number of the latest publication, two slot headers with
+the shape, dtype, timestamp and statistics of a frame, and two pixel buffers.
+
+Publications alternate between the two slots. Each slot has a seqlock
+counter that is odd while the slot is written: readers check it before and
+after reading and retry if it changed, and the writer never waits for
+readers. A frame read without copying stays valid until the slot is written
+again, two publications later, which valid() tells.
+
+Reading from another process:
+
+    from shared_frames import SharedFrameReader, available_cameras
+
+    print(available_cameras())            # camera name -> serial number
+    reader = SharedFrameReader('40012345')
+    frame = reader.wait(timeout=1)        # next frame, a copy
+    print(frame.frame_number, frame.centroid_x, frame.data.shape)
+    view = reader.read(copy=False)        # zero-copy view into the segment
+    ...
+    if not reader.valid(view):            # overwritten while it was used
+        ...
+    reader.close()
+'''
+
+from collections import namedtuple
+import hashlib
+import os
+import re
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+segment_prefix = 'beamview_'
+shared_frames_version = 1
+magic = 0x46535642  # 'BVSF'
+
+header_dtype = np.dtype([('magic', 'u4'), ('version', 'u4'), ('closed', 'u4'), ('capacity', 'u8'), ('latest', 'i8'),
+                         ('name', 'S64'), ('serial_number', 'S64')], align=True)
+slot_dtype = np.dtype([('seq', 'u8'), ('frame_number', 'u8'), ('camera_sequence', 'i8'), ('timestamp', 'f8'),
+                       ('height', 'u4'), ('width', 'u4'), ('dtype', 'S8'), ('offset_x', 'i4'), ('offset_y', 'i4'),
+                       ('total_counts', 'f8'), ('saturated_pixels', 'i8'), ('centroid_x', 'f8'), ('centroid_y', 'f8'),
+                       ('sigma_x', 'f8'), ('sigma_y', 'f8')], align=True)
+slots_offset = 256
+# pixel buffers start on page boundaries
+page_size = 4096
+data_offset = page_size
+# segments created by this process, which its resource tracker has to keep track of
+published_names = set()
+
+SharedFrame = namedtuple('SharedFrame', ['data', 'frame_number', 'camera_sequence', 'timestamp', 'offset_x', 'offset_y',
+                                         'total_counts', 'saturated_pixels', 'centroid_x', 'centroid_y', 'sigma_x',
+                                         'sigma_y', 'slot', 'seq'])
+
+def segment_name(serial_number):
+    # replayed cameras use the file path as serial number, which is too long and full of separators
+    name = re.sub(r'[^\w.-]', '_', str(serial_number))
+    if len(name) > 40:
+        name = hashlib.sha1(str(serial_number).encode()).hexdigest()[:16]
+    return segment_prefix + name
+
+def slot_size(capacity):
+    return -(-capacity//page_size)*page_size
+
+def segment_views(shm):
+    header = np.ndarray((), header_dtype, buffer=shm.buf)
+    slots = np.ndarray((2,), slot_dtype, buffer=shm.buf, offset=slots_offset)
+    return header, slots
+
+def attach(name):
+    """Map an existing segment without taking ownership, so it isn't unlinked when this process exits."""
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # before Python 3.13 every attached segment is registered with the resource tracker
+        shm = SharedMemory(name=name)
+        if name not in published_names:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+class SharedFramePublisher:
+    def __init__(self, cam, capacity=None):
+        """Shared memory segment the processed frames of cam are published to.
+
+        Args:
+            cam (Camera): camera whose frames are published, names the segment
+            capacity (int): bytes per pixel buffer, by default a full sensor frame of 4-byte pixels,
+                which holds raw, background subtracted and averaged frames of any ROI
+        """
+        if capacity is None:
+            # not max_width and max_height, which shrink with the ROI offset on Basler cameras
+            capacity = cam.sensor_width*cam.sensor_height*4
+        self.capacity = capacity
+        self.name = segment_name(cam.serial_number)
+        size = data_offset + 2*slot_size(capacity)
+        try:
+            self.shm = SharedMemory(name=self.name, create=True, size=size)
+        except FileExistsError:
+            # left behind by a Beamview that didn't exit cleanly. Opened tracked, since unlink
+            # unregisters the segment from this process's resource tracker
+            stale = SharedMemory(name=self.name)
+            stale.close()
+            stale.unlink()
+            self.shm = SharedMemory(name=self.name, create=True, size=size)
+        published_names.add(self.name)
+        self.lock = threading.Lock()
+        self.header, self.slots = segment_views(self.shm)
+        self.slots[...] = 0
+        self.header['capacity'] = capacity
+        self.header['latest'] = -1
+        self.header['closed'] = 0
+        self.header['name'] = cam.name.encode()[:64]
+        self.header['serial_number'] = str(cam.serial_number).encode()[:64]
+        self.header['version'] = shared_frames_version
+        self.header['magic'] = magic
+        self.count = 0
+        self.too_large = False
+
+    def publish(self, data, camera_sequence, timestamp, offset_x, offset_y, total_counts, saturated_pixels, moments):
+        """Copy a processed frame and its statistics into the next slot. Readers never hold it up."""
+        with self.lock:
+            if self.shm is None:
+                return
+            if data.nbytes > self.capacity:
+                if not self.too_large:
+                    print(f'{self.name}: {data.nbytes} byte frames don\'t fit the shared memory segment')
+                    self.too_large = True
+                return
+            index = self.count % 2
+            slot = self.slots[index]
+            slot['seq'] = 2*self.count + 1
+            buffer = np.ndarray(data.shape, data.dtype, buffer=self.shm.buf, offset=data_offset + index*slot_size(self.capacity))
+            np.copyto(buffer, data)
+            del buffer
+            slot['frame_number'] = self.count
+            slot['camera_sequence'] = camera_sequence
+            slot['timestamp'] = timestamp
+            slot['height'], slot['width'] = data.shape
+            slot['dtype'] = data.dtype.str.encode()
+            slot['offset_x'] = offset_x
+            slot['offset_y'] = offset_y
+            slot['total_counts'] = total_counts
+            slot['saturated_pixels'] = saturated_pixels
+            for field in ('centroid_x', 'centroid_y', 'sigma_x', 'sigma_y'):
+                slot[field] = np.nan if moments is None else getattr(moments, field)
+            slot['seq'] = 2*self.count + 2
+            self.header['latest'] = self.count
+            self.count += 1
+
+    def close(self):
+        """Mark the segment closed for readers and unlink it. Readers keep their mapping until they close it."""
+        with self.lock:
+            if self.shm is None:
+                return
+            self.header['closed'] = 1
+            del self.header, self.slots
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+            published_names.discard(self.name)
+
+class SharedFrameReader:
+    def __init__(self, serial_number=None, name=None):
+        """Reader of the frames Beamview publishes for a camera.
+
+        Args:
+            serial_number (str): serial number of the camera
+            name (str): segment name instead of the serial number, see available_cameras
+        """
+        self.shm = attach(name if name is not None else segment_name(serial_number))
+        self.header, self.slots = segment_views(self.shm)
+        if self.header['magic'] != magic or self.header['version'] != shared_frames_version:
+            self.close()
+            raise ValueError('not a Beamview frame segment of a supported version')
+        self.capacity = int(self.header['capacity'])
+        self.camera_name = self.header['name'].item().decode()
+        self.serial_number = self.header['serial_number'].item().decode()
+        self.last_frame_number = -1
+
+    @property
+    def closed(self):
+        """Whether Beamview closed the camera, no more frames will be published."""
+        return bool(self.header['closed'])
+
+    def read(self, copy=True, retries=100):
+        """The latest frame, None if nothing was published yet.
+
+        Args:
+            copy (bool): copy the pixels, otherwise data is a view into the segment that stays
+                valid until the writer reuses the slot, see valid
+            retries (int): attempts when the writer overwrites the slot during the read
+        """
+        for _ in range(retries):
+            latest = int(self.header['latest'])
+            if latest < 0:
+                return None
+            index = latest % 2
+            slot = self.slots[index]
+            seq = int(slot['seq'])
+            if seq % 2 == 1:
+                # the writer lapped this reader and is filling the slot again
+                continue
+            record = slot.copy()
+            data = np.ndarray((int(record['height']), int(record['width'])), np.dtype(record['dtype'].decode()),
+                              buffer=self.shm.buf, offset=data_offset + index*slot_size(self.capacity))
+            if copy:
+                data = data.copy()
+            if int(slot['seq']) != seq:
+                continue
+            self.last_frame_number = int(record['frame_number'])
+            return SharedFrame(data, int(record['frame_number']), int(record['camera_sequence']),
+                               float(record['timestamp']), int(record['offset_x']), int(record['offset_y']),
+                               float(record['total_counts']), int(record['saturated_pixels']),
+                               float(record['centroid_x']), float(record['centroid_y']), float(record['sigma_x']),
+                               float(record['sigma_y']), index, seq)
+        return None
+
+    def wait(self, timeout=None, copy=True, interval=0.001):
+        """The next frame after the last one read, polling every interval seconds. None on timeout or when closed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while int(self.header['latest']) <= self.last_frame_number:
+            if self.closed or (deadline is not None and time.monotonic() > deadline):
+                return None
+            time.sleep(interval)
+        return self.read(copy)
+
+    def valid(self, frame):
+        """Whether the pixels of a frame read without copying haven't been overwritten since."""
+        return int(self.slots[frame.slot]['seq']) == frame.seq
+
+    def close(self):
+        """Unmap the segment. Views into it from read(copy=False) must be deleted first."""
+        del self.header, self.slots
+        self.shm.close()
+
+def available_cameras():
+    """Serial numbers of the cameras Beamview publishes, keyed by camera name (Linux only)."""
+    cameras = {}
+    for name in os.listdir('/dev/shm'):
+        if not name.startswith(segment_prefix):
+            continue
+        try:
+            reader = SharedFrameReader(name=name)
+        except (OSError, ValueError):
+            continue
+        if not reader.closed:
+            cameras[reader.camera_name] = reader.serial_number
+        reader.close()
+    return cameras
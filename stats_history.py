@@ -0,0 +1,130 @@
+'''
+Rolling history of per-frame beam statistics
+
+Every processed frame appends one record to a fixed-capacity structured
+array. Records are written twice, at i and i + capacity, so the most recent
+records always form one contiguous slice of the buffer. Appending is O(1),
+and a window for plots or jitter metrics is a single slice copy instead of
+unwrapping a ring or building Python lists.
+
+The buffer doubles whenever it is full of records younger than the longest
+window it has to hold, so it keeps that window whatever the frame rate.
+Charts pull only the records appended since they last drew with since().
+'''
+
+from collections import namedtuple
+import threading
+
+import numpy as np
+
+history_dtype = np.dtype([('timestamp', 'f8'), ('total_counts', 'f8'), ('centroid_x', 'f8'), ('centroid_y', 'f8'),
+                          ('sigma_x', 'f8'), ('sigma_y', 'f8'), ('saturated_pixels', 'i8')])
+
+JitterStats = namedtuple('JitterStats', ['rms', 'drift', 'minimum', 'maximum', 'samples'])
+
+class StatsHistory:
+    def __init__(self, seconds=300, capacity=3000, max_capacity=2**19):
+        """History of the statistics of the last seconds.
+
+        Args:
+            seconds (float): longest window that has to be kept
+            capacity (int): initial number of records
+            max_capacity (int): number of records the buffer doesn't grow beyond
+        """
+        self.seconds = seconds
+        self.capacity = capacity
+        self.max_capacity = max_capacity
+        self.lock = threading.Lock()
+        self.data = np.zeros(2*capacity, dtype=history_dtype)
+        self.head = 0
+        self.count = 0
+        # bumped on every append, so plots can tell whether they are out of date
+        self.version = 0
+        self.cleared_version = 0
+
+    def append(self, timestamp, total_counts, saturated_pixels, moments):
+        """Add the statistics of one frame. Beam moments are nan when moments is None."""
+        with self.lock:
+            if (self.count == self.capacity and self.capacity < self.max_capacity
+                    and timestamp - self.data[self.head]['timestamp'] < self.seconds):
+                self.grow()
+            record = self.data[self.head]
+            record['timestamp'] = timestamp
+            record['total_counts'] = total_counts
+            record['saturated_pixels'] = saturated_pixels
+            for field in ('centroid_x', 'centroid_y', 'sigma_x', 'sigma_y'):
+                record[field] = np.nan if moments is None else getattr(moments, field)
+            self.data[self.head + self.capacity] = record
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            self.version += 1
+
+    def grow(self):
+        # the full buffer holds the records oldest first from head, they move to the front of both halves
+        capacity = min(2*self.capacity, self.max_capacity)
+        data = np.zeros(2*capacity, dtype=history_dtype)
+        records = self.data[self.head:self.head + self.capacity]
+        data[:self.capacity] = records
+        data[capacity:capacity + self.capacity] = records
+        self.data = data
+        self.head = self.capacity
+        self.capacity = capacity
+
+    def clear(self):
+        with self.lock:
+            self.head = 0
+            self.count = 0
+            self.version += 1
+            self.cleared_version = self.version
+
+    def window(self, seconds=None):
+        """Records of the last seconds (all records if None), oldest first.
+
+        Returns:
+            ndarray: copy of the window, so later appends can't change it under the caller
+        """
+        with self.lock:
+            return self._window(seconds)
+
+    def _window(self, seconds):
+        end = self.head + self.capacity
+        records = self.data[end - self.count:end]
+        if seconds is not None and self.count > 0:
+            start = np.searchsorted(records['timestamp'], records['timestamp'][-1] - seconds)
+            records = records[start:]
+        return records.copy()
+
+    def since(self, version, seconds=None):
+        """Records appended after version, for plots that only draw what is new.
+
+        Returns:
+            tuple: (records, version, reset). reset is True when the records since version
+            aren't all kept any more or the history was cleared, records is then the window
+            of the last seconds to draw from scratch.
+        """
+        with self.lock:
+            new = self.version - version
+            if version >= self.cleared_version and 0 <= new <= self.count:
+                end = self.head + self.capacity
+                return self.data[end - new:end].copy(), self.version, False
+            return self._window(seconds), self.version, True
+
+    def jitter(self, field, seconds=None, records=None):
+        """RMS jitter, drift (per second, from a linear fit) and range of field over a window.
+
+        Args:
+            field (str): field of history_dtype, e.g. 'centroid_x'
+            seconds (float): window length, all records if None
+            records (ndarray): window to use instead of reading one from the history
+        """
+        if records is None:
+            records = self.window(seconds)
+        valid = np.isfinite(records[field])
+        values = records[field][valid]
+        if len(values) == 0:
+            return JitterStats(np.nan, np.nan, np.nan, np.nan, 0)
+        times = records['timestamp'][valid]
+        drift = np.nan
+        if len(values) > 1 and times[-1] > times[0]:
+            drift = np.polyfit(times - times[0], values, 1)[0]
+        return JitterStats(np.std(values), drift, np.min(values), np.max(values), len(values))
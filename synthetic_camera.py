@@ -0,0 +1,294 @@
+'''
+Synthetic camera for running Beamview without hardware
+
+Generates moving Gaussian beams with noise and saturation in pure NumPy and
+pushes them to a registered image event handler, the same way pylon does for
+Basler cameras.
+'''
+
+from contextlib import contextmanager
+import threading
+import time
+
+import numpy as np
+
+import camera_wrapper as cw
+from camera_wrapper import TriggerMode
+
+class SyntheticDeviceInfo:
+    '''
+    Stand-in for pylon.DeviceInfo, so synthetic cameras can be listed next to real ones
+    '''
+    def __init__(self, serial_number, name='', width=1920, height=1200, bit_depth=12, frame_rate=20):
+        self.serial_number = serial_number
+        self.name = name
+        self.width = width
+        self.height = height
+        self.bit_depth = bit_depth
+        self.frame_rate = frame_rate
+
+    def GetSerialNumber(self):
+        return self.serial_number
+
+    def GetUserDefinedName(self):
+        return self.name
+
+    def SetUserDefinedName(self, name):
+        self.name = name
+
+    def GetModelName(self):
+        return 'Synthetic'
+
+    def create_camera(self, trigger_mode, binning=1):
+        return Synthetic_Camera(self.serial_number, trigger_mode, binning, self.width, self.height,
+                                self.bit_depth, self.frame_rate, name=self.name)
+
+class SyntheticGrabResult:
+    '''
+    Minimal grab result with the parts of the pylon.GrabResult interface Beamview uses
+    '''
+    def __init__(self, array, block_id, timestamp):
+        self.Array = array
+        self.BlockID = block_id
+        self.ImageNumber = block_id
+        self.TimeStamp = timestamp
+
+    def IsValid(self):
+        return True
+
+    def GrabSucceeded(self):
+        return True
+
+    @contextmanager
+    def GetArrayZeroCopy(self):
+        yield self.Array
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+class Synthetic_Camera(cw.Camera):
+    pixel_formats = {8: 'Mono8', 12: 'Mono12', 16: 'Mono16'}
+
+    def __init__(self, serial_number, trigger_mode, binning=1, sensor_width=1920, sensor_height=1200, bit_depth=12,
+                 frame_rate=20, noise=0.01, name=''):
+        """Camera producing synthetic Gaussian beams.
+
+        Args:
+            serial_number (str): serial number reported to Beamview
+            trigger_mode (TriggerMode): FREERUN and HARDWARE both free-run at frame_rate
+            binning (int): binning factor applied to the sensor size
+            sensor_width (int), sensor_height (int): unbinned sensor size in pixels
+            bit_depth (int): 8, 12 or 16
+            frame_rate (float): frames per second
+            noise (float): standard deviation of the background noise as a fraction of full scale
+            name (str): user defined camera name
+        """
+        super().__init__(serial_number)
+        if bit_depth not in self.pixel_formats:
+            raise ValueError('bit_depth must be 8, 12 or 16')
+        if trigger_mode == TriggerMode.SOFTWARE:
+            raise NotImplementedError('Software triggers not supported')
+        elif not isinstance(trigger_mode, TriggerMode):
+            raise TypeError('trigger must be of type TriggerMode')
+        self.name = name if name != '' else f'Synthetic {serial_number}'
+        self.model = 'Synthetic'
+        self._trigger_mode = trigger_mode
+        self._binning = binning
+        self._bit_depth = bit_depth
+        self._pixel_format = self.pixel_formats[bit_depth]
+        self._max_width = sensor_width // binning
+        self._max_height = sensor_height // binning
+        self._offset_x = 0
+        self._offset_y = 0
+        self._width = self._max_width
+        self._height = self._max_height
+        self._gain = 0
+        self._exposure = 1.0
+        self.frame_rate = frame_rate
+        self.noise = noise
+        self.frame_transmission_delay = 0
+        self.interpacket_delay = 0
+
+        self.lock = threading.Lock()
+        self.handler = None
+        self.block_id = 0
+        self._grabbing = False
+        self._thread = None
+        self._rng = np.random.default_rng()
+        # each camera gets its own beam path, so several synthetic cameras look different
+        self._phase = self._rng.uniform(0, 2*np.pi, size=3)
+        self._start_time = time.time()
+        self._allocate()
+
+    def _allocate(self):
+        shape = (self._height, self._width)
+        self._signal = np.empty(shape, dtype=np.float32)
+        self._noise = np.empty(shape, dtype=np.float32)
+        self._frame = np.empty(shape, dtype=np.uint8 if self._bit_depth == 8 else np.uint16)
+
+    def generate_frame(self, t):
+        """Render the beam at time t (s) into the frame buffer and return it."""
+        saturation = 2**self._bit_depth - 1
+        phase_x, phase_y, phase_a = self._phase
+        center_x = self._max_width*(0.5 + 0.25*np.sin(0.31*t + phase_x)) - self._offset_x
+        center_y = self._max_height*(0.5 + 0.25*np.sin(0.23*t + phase_y)) - self._offset_y
+        sigma_x = self._max_width/20
+        sigma_y = self._max_height/25
+        # amplitude slowly swings through saturation
+        amplitude = saturation*self._exposure*10**(self._gain/200)*(0.75 + 0.5*np.sin(0.11*t + phase_a))
+
+        profile_x = np.exp(-0.5*((np.arange(self._width, dtype=np.float32) - center_x)/sigma_x)**2)
+        profile_y = np.exp(-0.5*((np.arange(self._height, dtype=np.float32) - center_y)/sigma_y)**2)
+        np.outer(profile_y*np.float32(amplitude), profile_x, out=self._signal)
+        self._rng.standard_normal(dtype=np.float32, out=self._noise)
+        self._noise *= self.noise*saturation
+        self._signal += self._noise
+        self._signal += self.noise*saturation*3
+        np.clip(self._signal, 0, saturation, out=self._signal)
+        np.copyto(self._frame, self._signal, casting='unsafe')
+        return self._frame
+
+    def grab_loop(self):
+        next_frame_time = time.perf_counter()
+        while self._grabbing:
+            with self.lock:
+                frame = self.generate_frame(time.time() - self._start_time)
+                self.block_id += 1
+                res = SyntheticGrabResult(frame, self.block_id, time.time())
+                handler = self.handler
+            if handler is not None:
+                handler.OnImageGrabbed(self, res)
+            next_frame_time += 1/self.frame_rate
+            delay = next_frame_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_frame_time = time.perf_counter()
+
+    @property
+    def pixel_format(self):
+        return self._pixel_format
+
+    @property
+    def gain(self):
+        return self._gain
+
+    @gain.setter
+    def gain(self, value):
+        self._gain = value
+
+    @property
+    def exposure(self):
+        """Exposure time in ms
+
+        Returns:
+            float: exposure time in ms
+        """
+        return self._exposure
+
+    @exposure.setter
+    def exposure(self, value):
+        self._exposure = value
+
+    @property
+    def offset_x(self):
+        return self._offset_x
+
+    @offset_x.setter
+    def offset_x(self, value):
+        with self.lock:
+            self._offset_x = min(value, self._max_width - self._width)
+
+    @property
+    def offset_y(self):
+        return self._offset_y
+
+    @offset_y.setter
+    def offset_y(self, value):
+        with self.lock:
+            self._offset_y = min(value, self._max_height - self._height)
+
+    @property
+    def width(self):
+        return self._width
+
+    @width.setter
+    def width(self, value):
+        with self.lock:
+            self._width = min(value, self._max_width - self._offset_x)
+            self._allocate()
+
+    @property
+    def height(self):
+        return self._height
+
+    @height.setter
+    def height(self, value):
+        with self.lock:
+            self._height = min(value, self._max_height - self._offset_y)
+            self._allocate()
+
+    @property
+    def max_width(self):
+        return self._max_width
+
+    @property
+    def max_height(self):
+        return self._max_height
+
+    @property
+    def binning(self):
+        return self._binning
+
+    @property
+    def trigger_mode(self):
+        return self._trigger_mode
+
+    @trigger_mode.setter
+    def trigger_mode(self, value):
+        if value == TriggerMode.SOFTWARE:
+            raise NotImplementedError('Software triggers not supported')
+        elif not isinstance(value, TriggerMode):
+            raise TypeError('Input must be of type TriggerMode')
+        self._trigger_mode = value
+
+    @property
+    def target_frame_rate(self):
+        return self.frame_rate
+
+    def grab_statistics(self):
+        return cw.GrabStatistics(self.block_id, 0, 0, 0)
+
+    def start_grabbing(self):
+        if self._grabbing:
+            return
+        self._grabbing = True
+        self._thread = threading.Thread(target=self.grab_loop, daemon=True)
+        self._thread.start()
+
+    def return_frame(self):
+        with self.lock:
+            self.block_id += 1
+            frame = np.copy(self.generate_frame(time.time() - self._start_time))
+            return SyntheticGrabResult(frame, self.block_id, time.time())
+
+    def request_frame(self):
+        pass
+
+    def register_event_handler(self, handler):
+        self.handler = handler
+
+    def stop_grabbing(self):
+        self._grabbing = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def is_grabbing(self):
+        return self._grabbing
+
+    def release_camera(self):
+        self.stop_grabbing()
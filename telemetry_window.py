@@ -0,0 +1,80 @@
+from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QCheckBox, QLabel
+import pyqtgraph as pg
+
+class TelemetryWindow(QMainWindow):
+    plots = (('frame_rate', 'Delivered (frames/s)', 1),
+             ('failure_rate', 'Failed (frames/s)', 1),
+             ('resend_rate', 'Resent (packets/s)', 1),
+             ('underrun_rate', 'Buffer underruns (/s)', 1),
+             ('bandwidth', 'Throughput (MB/s)', 1e-6))
+
+    def __init__(self, root, app):
+        super().__init__()
+        self.setMinimumSize(500, 750)
+        self.setWindowTitle('Grab telemetry')
+        self.app = app
+        self.root = root
+
+        dummy_widget = QWidget()
+        layout = QVBoxLayout()
+        dummy_widget.setLayout(layout)
+        self.setCentralWidget(dummy_widget)
+
+        control_row = QHBoxLayout()
+        self.controller_check = QCheckBox(text='Tune inter-packet delays automatically', parent=self)
+        self.controller_check.setChecked(self.root.delay_controller.enabled)
+        self.controller_check.toggled.connect(self.controller_toggled)
+        control_row.addWidget(self.controller_check)
+        self.scale_label = QLabel(text='', parent=self)
+        control_row.addWidget(self.scale_label)
+        control_row.addStretch(1)
+        layout.addLayout(control_row)
+
+        self.plot_widgets = {}
+        for field, label, _ in self.plots:
+            plot_widget = pg.PlotWidget(parent=self)
+            plot_widget.setLabel('left', label)
+            plot_widget.setLabel('bottom', 'Time (s)')
+            plot_widget.addLegend(offset=(-10, 10))
+            layout.addWidget(plot_widget)
+            self.plot_widgets[field] = plot_widget
+        self.curves = {}
+
+    def closeEvent(self, event):
+        self.hide()
+        event.ignore()
+
+    def controller_toggled(self, checked):
+        self.root.delay_controller.enabled = checked
+        if not checked:
+            # drop the corrections so the plain plan applies again
+            self.root.delay_controller.reset()
+            self.root.set_delays()
+        self.refresh()
+
+    def refresh(self):
+        history = self.root.grab_telemetry.history
+        for serial_number in list(self.curves):
+            if serial_number not in history:
+                for field, curve in self.curves.pop(serial_number).items():
+                    self.plot_widgets[field].removeItem(curve)
+        for i, (serial_number, samples) in enumerate(history.items()):
+            if len(samples) == 0:
+                continue
+            curves = self.curves.get(serial_number)
+            if curves is None:
+                cam = self.root.opened_cameras.get(serial_number)
+                name = cam.name if cam is not None else serial_number
+                pen = pg.mkPen(pg.intColor(i, hues=8), width=2)
+                curves = {field: self.plot_widgets[field].plot(pen=pen, name=name) for field, _, _ in self.plots}
+                self.curves[serial_number] = curves
+            now = samples[-1].time
+            times = [sample.time - now for sample in samples]
+            for field, _, scale in self.plots:
+                curves[field].setData(times, [getattr(sample, field)*scale for sample in samples])
+        scales = self.root.bandwidth_planner.utilization_scale
+        if self.root.delay_controller.enabled and len(scales) > 0:
+            self.scale_label.setText('Utilization scale: ' + ', '.join(
+                f'{interface}: {scale:.2f}' for interface, scale in scales.items()))
+        else:
+            self.scale_label.setText('')